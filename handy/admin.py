@@ -1,5 +1,5 @@
 from .models import (
-    HandymanDocument, ServiceImage, Report, PaymentLog, Device, IPBlacklist, ServiceCategory, Service, Booking,
+    HandymanDocument, ServiceImage, Report, PaymentLog, PaymentWebhookEvent, Device, IPBlacklist, ServiceCategory, Service, Booking,
     Notification, Message, DepositTransaction, HeroSlide
 )
 from django.contrib import admin
@@ -93,9 +93,26 @@ class HandymanDocumentInline(admin.TabularInline):
     preview_document.short_description = "Aperçu"
 
 
+class CompletionFilter(admin.SimpleListFilter):
+    title = "Profil complété"
+    parameter_name = "complete"
+
+    def lookups(self, request, model_admin):
+        return (('yes', "Oui"), ('no', "Non"))
+
+    def queryset(self, request, queryset):
+        # colonne stockée et indexée : filtre SQL direct
+        if self.value() == 'yes':
+            return queryset.filter(completion=100)
+        if self.value() == 'no':
+            return queryset.filter(completion__lt=100)
+        return queryset
+
+
 class HandymanProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'rating', 'is_approved', 'profile_completion', 'is_fully_completed')
-    list_filter = ('is_approved', 'skills', 'experience_years')
+    list_filter = ('is_approved', CompletionFilter, 'skills', 'experience_years')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'user__email', 'user__phone', 'license_number', 'cni_number')
     readonly_fields = (
         'profile_completion', 'rating', 'completed_jobs', 'profile_picture_preview', 'is_fully_completed')
@@ -145,15 +162,17 @@ class HandymanProfileAdmin(admin.ModelAdmin):
     profile_picture_preview.short_description = "Photo de profil"
 
     def profile_completion(self, obj):
-        return f"{obj.profile_completion()}%"
+        return f"{obj.completion}%"
 
     profile_completion.short_description = "Complétion du profil"
+    profile_completion.admin_order_field = "completion"
 
     def is_fully_completed(self, obj):
         return obj.is_fully_completed
 
     is_fully_completed.boolean = True  # Affiche ✅ ou ❌
     is_fully_completed.short_description = "Profil complété"
+    is_fully_completed.admin_order_field = "completion"
 
     @admin.action(description="Approuver les profils sélectionnés")
     def approve_profiles(self, request, queryset):
@@ -217,6 +236,24 @@ class PaymentLogAdmin(admin.ModelAdmin):
     list_display = ('payment', 'previous_status', 'new_status', 'changed_at')
 
 
+@admin.register(PaymentWebhookEvent)
+class PaymentWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'event_id', 'provider_ref', 'status', 'received_at', 'processed_at', 'outcome')
+    list_filter = ('provider', 'outcome')
+    search_fields = ('provider_ref', 'event_id')
+    readonly_fields = [f.name for f in PaymentWebhookEvent._meta.fields]
+    actions = ['requeue']
+
+    @admin.action(description="Remettre en file (références désormais connues)")
+    def requeue(self, request, queryset):
+        from handy.services import webhooks
+
+        shards = set(queryset.values_list('shard', flat=True))
+        queryset.update(processed_at=None, outcome='')
+        for shard in shards:
+            webhooks.schedule(shard)
+
+
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
     list_display = ('user', 'device_type', 'last_active')
@@ -224,9 +261,9 @@ class DeviceAdmin(admin.ModelAdmin):
 
 @admin.register(IPBlacklist)
 class IPBlacklistAdmin(admin.ModelAdmin):
-    list_display = ('ip_address', 'is_active', 'reason', 'created_at')
+    list_display = ('ip_address', 'cidr', 'is_active', 'reason', 'created_at')
     list_filter = ('is_active',)
-    search_fields = ('ip_address', 'reason')
+    search_fields = ('ip_address', 'cidr', 'reason')
 
 
 @admin.register(ServiceCategory)
@@ -0,0 +1,171 @@
+# handy/api/async_views.py
+"""
+Vues async (ASGI natif, daphne) des lectures chaudes : match, services/nearby,
+bookings/{id}/eta, slides.
+
+DRF ne sait pas exécuter de vue async : ces vues sont des vues Django async qui
+réutilisent les serializers DRF (validation, rendu JSON identique). Le client lent
+(réseau mobile) n'immobilise plus de thread : seuls les appels ORM synchrones
+restants passent brièvement par `sync_to_async`. Les cas rares (cache froid de
+nearby, `?all=true` des slides) sont délégués à la vue DRF d'origine.
+"""
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Q
+from django.http import JsonResponse
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from handy.api.serializers import HeroSlideSerializer, MatchRequestSerializer, MatchResponseSerializer
+from handy.api.views import DefaultPageNumberPagination, HeroSlideViewSet, ServiceViewSet
+from handy.models import Booking, BookingRoute, HeroSlide, ServiceCategory, User
+from handy.services import nearby as nearby_cache
+
+_jwt = JWTAuthentication()
+
+# vues DRF d'origine, pour les chemins délégués
+_nearby_view = ServiceViewSet.as_view({"get": "nearby"}, detail=False, basename="services",
+                                      **ServiceViewSet.nearby.kwargs)
+_slides_view = HeroSlideViewSet.as_view({"get": "list"}, detail=False, basename="slides")
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+def _api(*methods):
+    """
+    Méthodes autorisées + exemption CSRF (authentification par jeton, comme APIView) :
+    en Django 4.2, csrf_exempt / require_http_methods ne savent pas envelopper une vue async.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return _json({"detail": f"Méthode « {request.method} » non autorisée."}, status=405)
+            return await view(request, *args, **kwargs)
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def _body(request):
+    """Corps JSON ou formulaire (comme les parsers DRF par défaut) ; None si le JSON est invalide."""
+    if request.content_type in ("application/x-www-form-urlencoded", "multipart/form-data"):
+        return request.POST  # corps déjà lu par le handler ASGI : pas d'I/O
+    try:
+        return json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+
+
+async def _authenticate(request):
+    """Utilisateur du jeton JWT (None si absent) ; InvalidToken si le jeton est refusé."""
+    header = _jwt.get_header(request)
+    raw = _jwt.get_raw_token(header) if header else None
+    if raw is None:
+        return None
+    token = _jwt.get_validated_token(raw)
+    return await User.objects.filter(
+        **{jwt_settings.USER_ID_FIELD: token.get(jwt_settings.USER_ID_CLAIM), "is_active": True}
+    ).afirst()
+
+
+async def _require_user(request):
+    try:
+        user = await _authenticate(request)
+    except (InvalidToken, TokenError):
+        return None, _json({"detail": "Jeton invalide ou expiré."}, status=401)
+    if user is None:
+        return None, _json({"detail": "Informations d'authentification non fournies."}, status=401)
+    return user, None
+
+
+# ---- Matching ----
+@_api("POST")
+async def match(request):
+    """
+    Body: { "category_id": 3, "lat": 5.34, "lng": -4.02,
+            "requested_start": "...", "requested_end": "...", "budget": 15000 }  (optionnels)
+    JSON ou formulaire (application/x-www-form-urlencoded, multipart)
+    Return: artisans (libres sur le créneau) classés par score pondéré
+    """
+    user, denied = await _require_user(request)
+    if denied:
+        return denied
+    body = _body(request)
+    if body is None:
+        return _json({"detail": "JSON invalide."}, status=400)
+    req = MatchRequestSerializer(data=body)
+    if not req.is_valid():
+        return _json(req.errors, status=400)
+
+    from handy.services.matching import match_artisans
+
+    data = req.validated_data
+    # index mémoire si chaud ; sinon PostGIS (ORM synchrone, un seul passage par thread)
+    results = await sync_to_async(match_artisans)(
+        data["lat"], data["lng"], data["category_id"],
+        start=data.get("requested_start"), end=data.get("requested_end"),
+        client_id=user.id, budget=data.get("budget"),
+    )
+    return _json(MatchResponseSerializer(results, many=True).data)
+
+
+# ---- Services à proximité ----
+@_api("GET", "HEAD")
+async def services_nearby(request):
+    """GET /services/nearby/ : page servie depuis le cache sans thread ; sinon vue DRF."""
+    params = request.GET
+    lat, lng = params.get("lat"), params.get("lng")
+    page_no, page_size = params.get("page", "1"), params.get("page_size", "")
+    try:
+        radius_km = float(params.get("radius_km", 15))
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return await sync_to_async(_nearby_view)(request)  # erreurs : réponse de la vue d'origine
+
+    if (radius_km <= getattr(settings, "NEARBY_CACHE_MAX_RADIUS_KM", 30)
+            and page_no.isdigit() and (not page_size or page_size.isdigit())):
+        cell, s_lat, s_lng = nearby_cache.snap(lat, lng)
+        key = await nearby_cache.acache_key(cell, s_lat, s_lng, params.get("category_id"), radius_km, page_no,
+                                            page_size or DefaultPageNumberPagination.page_size)
+        cached = await nearby_cache.aget_page(key)
+        if cached is not None:
+            return _json(ServiceViewSet._page_links(request, cached))
+    return await sync_to_async(_nearby_view)(request)
+
+
+# ---- ETA ----
+@_api("GET", "HEAD")
+async def booking_eta(request, pk):
+    """GET /bookings/{id}/eta/"""
+    _, denied = await _require_user(request)
+    if denied:
+        return denied
+    if not await Booking.objects.filter(pk=pk).aexists():
+        return _json({"detail": "Pas trouvé."}, status=404)
+    route, _ = await BookingRoute.objects.aget_or_create(booking_id=pk)
+    return _json({"eta_minutes": route.eta_minutes, "updated_at": route.updated_at})
+
+
+# ---- Slides ----
+@_api("GET", "HEAD")
+async def slides(request):
+    """GET /slides/ : slides actifs, sinon slides générés (cf. HeroSlideViewSet)."""
+    if request.GET.get("all"):
+        return await sync_to_async(_slides_view)(request)  # réservé staff : authentification DRF
+    qs = [s async for s in HeroSlide.objects.active_now()]
+    if qs:
+        return _json(HeroSlideSerializer(qs, many=True, context={"request": request}).data)
+    top_cat = await (ServiceCategory.objects
+                     .filter(is_active=True)
+                     .annotate(svc_count=Count('services', filter=Q(services__is_active=True)))
+                     .order_by('-svc_count')
+                     .afirst())
+    return _json(HeroSlideViewSet.auto_slides(top_cat))
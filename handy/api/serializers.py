@@ -2,6 +2,7 @@
 from decimal import Decimal
 from typing import Optional
 
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.gis.geos import Point
 from django.utils import timezone
@@ -13,7 +14,7 @@ from handy.models import (
     Payment, PaymentLog, Review, Conversation, Message, Notification,
     HandymanDocument, Report, Device, HeroSlide
 )
-from handy.services.pricing import estimate_price
+from handy.services.pricing import estimate_price, pricing_engine
 from handy.services.fees import compute_platform_fee
 
 
@@ -322,6 +323,11 @@ class NotificationSerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at"]
 
 
+class MarkReadSerializer(serializers.Serializer):
+    # curseur = id du dernier élément affiché (absent : tout marquer lu)
+    up_to = serializers.IntegerField(required=False, min_value=1)
+
+
 class HandymanDocumentSerializer(serializers.ModelSerializer):
     # écriture
     handyman = serializers.PrimaryKeyRelatedField(queryset=HandymanProfile.objects.all())
@@ -358,27 +364,58 @@ class MatchRequestSerializer(serializers.Serializer):
     category_id = serializers.IntegerField()
     lat = serializers.FloatField()
     lng = serializers.FloatField()
+    requested_start = serializers.DateTimeField(required=False)
+    requested_end = serializers.DateTimeField(required=False)
+    budget = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=0)
 
+    def validate(self, attrs):
+        start, end = attrs.get("requested_start"), attrs.get("requested_end")
+        if bool(start) != bool(end):
+            raise serializers.ValidationError("requested_start et requested_end vont ensemble.")
+        if start and end <= start:
+            raise serializers.ValidationError("requested_end doit être postérieur à requested_start.")
+        return attrs
 
-class MatchResponseSerializer(serializers.ModelSerializer):
-    full_name = serializers.CharField(source="user.get_full_name")
-    distance_m = serializers.FloatField()
 
-    class Meta:
-        model = HandymanProfile
-        fields = ["id", "full_name", "rating", "completed_jobs", "distance_m"]
+class MatchResponseSerializer(serializers.Serializer):
+    # alimenté par match_artisans (dicts issus de l'index mémoire ou de PostGIS)
+    id = serializers.IntegerField()
+    full_name = serializers.CharField()
+    rating = serializers.FloatField()
+    completed_jobs = serializers.IntegerField()
+    distance_m = serializers.FloatField()
+    score = serializers.FloatField(required=False)
 
 
 class PriceEstimateSerializer(serializers.Serializer):
     category_slug = serializers.CharField()
     minutes = serializers.IntegerField(min_value=1)
+    # position du client (optionnelle) : majoration de zone
+    lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    lng = serializers.FloatField(required=False, min_value=-180, max_value=180)
 
     def to_representation(self, instance):
         # instance == validated_data
-        amount = estimate_price(instance["category_slug"], instance["minutes"])
+        amount = estimate_price(instance["category_slug"], instance["minutes"],
+                                client_lat=instance.get("lat"), client_lng=instance.get("lng"))
         return {"amount_xof": int(amount)}
 
 
+class PriceEstimateBatchSerializer(serializers.Serializer):
+    items = PriceEstimateSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        limit = getattr(settings, "PRICE_ESTIMATE_BATCH_MAX", 100)
+        if len(items) > limit:
+            raise serializers.ValidationError(f"{limit} estimations maximum par requête.")
+        return items
+
+    def to_representation(self, instance):
+        amounts = pricing_engine.quote_many(instance["items"])
+        return {"results": [{"category_slug": item["category_slug"], "minutes": item["minutes"],
+                             "amount_xof": int(amount)} for item, amount in zip(instance["items"], amounts)]}
+
+
 class PaymentInitSerializer(serializers.Serializer):
     booking_id = serializers.IntegerField()
     method = serializers.ChoiceField(choices=Payment.PAYMENT_METHODS)
@@ -391,14 +428,19 @@ class PaymentInitSerializer(serializers.Serializer):
         """
         from handy.services.gateway import OrangeMoney, MTNMoney, StripeCard
 
-        booking = Booking.objects.select_related("service", "service__category").get(pk=validated["booking_id"])
+        booking = Booking.objects.select_related(
+            "service", "service__category", "handyman__handyman_profile"
+        ).get(pk=validated["booking_id"])
         svc = booking.service
         category_id = validated.get("category_id") or (svc.category_id if svc else None)
         category_slug = svc.category.slug if svc and svc.category else "menage"
         minutes = validated["minutes"]
 
-        # pricing + frais
-        amount = estimate_price(category_slug, minutes)
+        # pricing (tables en mémoire) + frais
+        profile = getattr(booking.handyman, "handyman_profile", None)
+        job = booking.job_location
+        amount = estimate_price(category_slug, minutes, artisan_loc=profile.location if profile else None,
+                                client_lat=job.y if job else None, client_lng=job.x if job else None)
         fee = compute_platform_fee(Decimal(amount), category_id=category_id)
 
         payment, _ = Payment.objects.get_or_create(
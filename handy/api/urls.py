@@ -3,11 +3,12 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenBlacklistView
 
+from . import async_views
 from .views import (
     UserViewSet, HandymanProfileViewSet, ServiceCategoryViewSet, ServiceViewSet, ServiceImageViewSet,
     BookingViewSet, PaymentViewSet, PaymentLogViewSet, ReviewViewSet, ConversationViewSet, MessageViewSet,
     NotificationViewSet, HandymanDocumentViewSet, ReportViewSet, DeviceViewSet,
-    price_estimate, payment_initiate, match, PaymentWebhook, EmailOrUsernameTokenObtainPairView, HeroSlideViewSet
+    price_estimate, price_estimate_batch, payment_initiate, unread_counts, PaymentWebhook, EmailOrUsernameTokenObtainPairView, HeroSlideViewSet
 )
 
 router = DefaultRouter()
@@ -28,13 +29,19 @@ router.register(r'reports', ReportViewSet, basename='reports')
 router.register(r'devices', DeviceViewSet, basename='devices')
 router.register(r'slides', HeroSlideViewSet, basename='slides')
 urlpatterns = [
+    # lectures chaudes en vues async (ASGI natif) : déclarées avant le routeur, elles priment sur les routes DRF
+    path('match/', async_views.match, name='match'),
+    path('services/nearby/', async_views.services_nearby, name='services-nearby'),
+    path('bookings/<int:pk>/eta/', async_views.booking_eta, name='bookings-eta'),
+    path('slides/', async_views.slides, name='slides-list'),
     path('', include(router.urls)),
     # path('auth/login/', TokenObtainPairView.as_view(), name='jwt-login'),
     path('auth/login/', EmailOrUsernameTokenObtainPairView.as_view(), name='jwt-login'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='jwt-refresh'),
     path('auth/logout/', TokenBlacklistView.as_view(), name='jwt-logout'),
     path('price/estimate/', price_estimate, name='price-estimate'),
+    path('price/estimate/batch/', price_estimate_batch, name='price-estimate-batch'),
     path('payments/initiate/', payment_initiate, name='payment-initiate'),
     path('payments/webhook/<str:provider>/', PaymentWebhook.as_view(), name='payment-webhook'),
-    path('match/', match, name='match'),
+    path('unread/', unread_counts, name='unread-counts'),
 ]
\ No newline at end of file
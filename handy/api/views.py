@@ -1,7 +1,8 @@
 # handy/api/views.py
+from datetime import timedelta
 from decimal import Decimal
-from math import radians, cos, sqrt, sin, asin
 
+from django.conf import settings
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.geos import Point
 from django.db import transaction, models
@@ -14,9 +15,12 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework.views import APIView
 
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
@@ -27,48 +31,29 @@ from handy.models import (
     Payment, PaymentLog, Review, Conversation, Message, Notification,
     HandymanDocument, Report, Device,
     # ↓ suivants : assure-toi de les avoir dans tes models (cf. reco précédentes)
-    BookingRoute, JobTracking, HeroSlide,  # tracking & ETA
+    BookingRoute, HeroSlide,  # tracking & ETA
     # Optionnel si tu as ajouté ces modèles :
     # ServiceArea, AvailabilitySlot, TimeOff, ReplacementSuggestion, SearchLog
 )
 
 
+from handy.services import nearby as nearby_cache, unread, webhooks
+from handy.services.availability import availability_index
+from handy.services.search import search_services
+from handy.services.tracking import make_point, tracking_buffer
+
+
 # ---- Permissions simples ----
 class IsAuthenticatedOrReadOnly(permissions.IsAuthenticatedOrReadOnly):
     pass
 
 
 # ---- Helpers géo / suggestions ----
-def _haversine_m(lat1, lon1, lat2, lon2):
-    R = 6371000.0
-    dlat, dlon = radians(lat2 - lat1), radians(lon2 - lon1)
-    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-    return 2 * R * asin(sqrt(a))
-
-
-def update_eta_from_last_point(booking: Booking, avg_kmh=25):
-    """Fallback ETA si pas d'API d'itinéraire."""
-    if not booking.job_location:
-        return
-    last = booking.track_points.order_by('-ts').first()
-    if not last:
-        return
-    d_m = _haversine_m(
-        last.loc.y, last.loc.x,
-        booking.job_location.y, booking.job_location.x
-    )
-    speed_ms = max((avg_kmh * 1000 / 3600), 1.0)
-    eta_min = int(d_m / speed_ms / 60)
-    route, _ = BookingRoute.objects.get_or_create(booking=booking)
-    route.eta_minutes = max(eta_min, 0)
-    route.updated_at = timezone.now()
-    route.save()
-
-
 def search_services_nearby_qs(origin_point: Point, category=None, max_km=15):
     qs = (Service.objects
           .filter(is_active=True)
           .select_related('handyman__handyman_profile', 'category')
+          .prefetch_related('images')
           .annotate(distance=Distance('handyman__handyman_profile__location', origin_point))
           .filter(distance__lte=max_km * 1000))
     if category:
@@ -77,7 +62,7 @@ def search_services_nearby_qs(origin_point: Point, category=None, max_km=15):
 
 
 def suggest_alternatives_qs(booking: Booking, price_tolerance=Decimal('0.15'), km=10):
-    """Services proches, même catégorie, ~même prix."""
+    """Services proches, même catégorie, ~même prix, dont l'artisan est libre sur le créneau."""
     if not booking.service or not booking.job_location:
         return Service.objects.none()
 
@@ -95,10 +80,18 @@ def suggest_alternatives_qs(booking: Booking, price_tolerance=Decimal('0.15'), k
             price__gte=min_price, price__lte=max_price)
                 .exclude(pk=booking.service.pk))
 
-    return (base.select_related('handyman__handyman_profile')
-            .annotate(distance=Distance('handyman__handyman_profile__location', booking.job_location))
-            .filter(distance__lte=km * 1000)
-            .order_by('distance', '-handyman__handyman_profile__rating', 'price'))[:10]
+    candidates = list(base.select_related('handyman__handyman_profile')
+                      .annotate(distance=Distance('handyman__handyman_profile__location', booking.job_location))
+                      .filter(distance__lte=km * 1000)
+                      .order_by('distance', '-handyman__handyman_profile__rating', 'price')[:50])
+
+    start = booking.requested_start or booking.booking_date
+    end = booking.requested_end or booking.end_date
+    if start and not end:
+        minutes = booking.service.duration or availability_index.default_booking_min
+        end = start + timedelta(minutes=minutes)
+    free = availability_index.free_between({s.handyman_id for s in candidates}, start, end)
+    return [s for s in candidates if s.handyman_id in free][:10]
 
 
 # ---- Pagination (cohérente partout) ----
@@ -108,6 +101,64 @@ class DefaultPageNumberPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class KeysetCursorPagination(CursorPagination):
+    """
+    Fils sans fin (messages, notifications) : pagination par curseur, sans OFFSET
+    ni COUNT(*), plus récents d'abord (index composites `(..., created_at, id)`).
+
+    `?since=<id>` : synchronisation incrémentale, lignes d'id > since dans l'ordre
+    d'insertion ; la réponse donne le prochain `since` et `has_more`. La première
+    page de l'historique renvoie aussi `since` (plus grand id vu) pour amorcer la synchro.
+    """
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("-created_at", "-id")
+    since_query_param = "since"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        since = request.query_params.get(self.since_query_param)
+        self.since = None
+        if since is None:
+            page = super().paginate_queryset(queryset, request, view)
+            if page and not request.query_params.get(self.cursor_query_param):
+                self.since = max(obj.pk for obj in page)
+            return page
+        try:
+            since = int(since)
+        except ValueError:
+            raise ValidationError({self.since_query_param: "Entier attendu (dernier id reçu)."})
+        size = self.get_page_size(request)
+        rows = list(queryset.filter(pk__gt=since).order_by("pk")[:size + 1])
+        self.has_more = len(rows) > size
+        self.page = rows[:size]
+        self.since = self.page[-1].pk if self.page else since
+        self.since_mode = True
+        return self.page
+
+    def get_paginated_response(self, data):
+        if getattr(self, "since_mode", False):
+            return Response({"since": self.since, "has_more": self.has_more, "results": data})
+        response = super().get_paginated_response(data)
+        if self.since is not None:
+            response.data["since"] = self.since
+        return response
+
+
+class ServiceSearchFilter(SearchFilter):
+    """`?search=` via le moteur plein texte + trigrammes (handy.services.search)."""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        qs = search_services(queryset, " ".join(terms))
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            # tri explicite demandé : on garde celui d'OrderingFilter
+            qs = qs.order_by(*queryset.query.order_by)
+        return qs
+
+
 # ---- Serializers (tu les as déjà) ----
 from .serializers import (
     UserSerializer, HandymanProfileSerializer, ServiceCategorySerializer, ServiceSerializer,
@@ -115,8 +166,8 @@ from .serializers import (
     PaymentSerializer, PaymentLogSerializer, ReviewSerializer,
     ConversationSerializer, MessageSerializer, NotificationSerializer,
     HandymanDocumentSerializer, ReportSerializer, DeviceSerializer,
-    MatchRequestSerializer, MatchResponseSerializer, PriceEstimateSerializer, PaymentInitSerializer,
-    EmailOrUsernameTokenObtainPairSerializer, HeroSlideSerializer
+    PriceEstimateSerializer, PriceEstimateBatchSerializer, PaymentInitSerializer,
+    EmailOrUsernameTokenObtainPairSerializer, HeroSlideSerializer, MarkReadSerializer
 )
 
 class EmailOrUsernameTokenObtainPairView(TokenObtainPairView):
@@ -198,7 +249,8 @@ class ServiceViewSet(viewsets.ModelViewSet):
     )
     serializer_class = ServiceSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # ServiceSearchFilter en dernier : son classement par pertinence prime sur l'ordre par défaut
+    filter_backends = [DjangoFilterBackend, OrderingFilter, ServiceSearchFilter]
     filterset_fields = ["category", "is_active", "price_type"]
     search_fields = ["title", "description", "handyman__first_name", "handyman__last_name"]
     ordering = ["-created_at"]
@@ -211,6 +263,8 @@ class ServiceViewSet(viewsets.ModelViewSet):
         """
         GET /services/nearby/?lat=..&lng=..&radius_km=15&category_id=...
         Renvoie les services triés par distance.
+        L'origine est ramenée au centre de sa cellule geohash et la page sérialisée
+        est mise en cache (cf. handy.services.nearby).
         """
         lat = request.query_params.get("lat")
         lng = request.query_params.get("lng")
@@ -220,7 +274,18 @@ class ServiceViewSet(viewsets.ModelViewSet):
         if lat is None or lng is None:
             return Response({"detail": "lat et lng requis."}, status=status.HTTP_400_BAD_REQUEST)
 
-        origin = Point(float(lng), float(lat), srid=4326)
+        cell, lat, lng = nearby_cache.snap(float(lat), float(lng))
+        key = None
+        page_no, page_size = request.query_params.get("page", "1"), request.query_params.get("page_size", "")
+        if (radius_km <= getattr(settings, "NEARBY_CACHE_MAX_RADIUS_KM", 30)
+                and page_no.isdigit() and (not page_size or page_size.isdigit())):
+            key = nearby_cache.cache_key(cell, lat, lng, cat_id, radius_km, page_no,
+                                         page_size or self.paginator.page_size)
+            cached = nearby_cache.get_page(key)
+            if cached is not None:
+                return Response(self._page_links(request, cached))
+
+        origin = Point(lng, lat, srid=4326)
         category = None
         if cat_id:
             try:
@@ -231,8 +296,26 @@ class ServiceViewSet(viewsets.ModelViewSet):
         qs = search_services_nearby_qs(origin, category, radius_km)
         page = self.paginate_queryset(qs)
         ser = self.get_serializer(page, many=True)
+        if key is not None:
+            p = self.paginator.page
+            nearby_cache.set_page(key, {"count": p.paginator.count, "page": p.number,
+                                        "num_pages": p.paginator.num_pages, "results": ser.data})
         return self.get_paginated_response(ser.data)
 
+    @staticmethod
+    def _page_links(request, cached):
+        """Liens next/previous recalculés sur l'URL de la requête courante."""
+        url, n = request.build_absolute_uri(), cached["page"]
+        previous = None
+        if n > 1:
+            previous = remove_query_param(url, "page") if n == 2 else replace_query_param(url, "page", n - 1)
+        return {
+            "count": cached["count"],
+            "next": replace_query_param(url, "page", n + 1) if n < cached["num_pages"] else None,
+            "previous": previous,
+            "results": cached["results"],
+        }
+
 
 class ServiceImageViewSet(viewsets.ModelViewSet):
     queryset = ServiceImage.objects.select_related("service").all()
@@ -288,26 +371,23 @@ class BookingViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["post"])
     def track(self, request, pk=None):
         """
-        POST: { "lat": ..., "lng": ..., "speed": 5.2, "heading": 120 }
-        Crée un point JobTracking et met à jour l’ETA.
+        POST: { "lat": ..., "lng": ..., "speed": 5.2, "heading": 120, "ts": <optionnel> }
+        Empile un point JobTracking ; l’écriture par lot met aussi à jour l’ETA (services.eta).
         """
         booking = self.get_object()
         lat = request.data.get("lat")
         lng = request.data.get("lng")
-        speed = request.data.get("speed")
-        heading = request.data.get("heading")
 
         if lat is None or lng is None:
             return Response({"detail": "lat et lng requis."}, status=status.HTTP_400_BAD_REQUEST)
 
-        jt = JobTracking.objects.create(
-            booking=booking,
-            handyman=booking.handyman,
-            loc=Point(float(lng), float(lat), srid=4326),
-            speed=float(speed) if speed is not None else None,
-            heading=float(heading) if heading is not None else None,
+        jt = make_point(
+            booking.id, booking.handyman_id, lat, lng,
+            speed=request.data.get("speed"),
+            heading=request.data.get("heading"),
+            ts=request.data.get("ts"),
         )
-        update_eta_from_last_point(booking)
+        tracking_buffer.add(jt)
         return Response({"ok": True, "ts": jt.ts}, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=["get"])
@@ -359,21 +439,60 @@ class ConversationViewSet(viewsets.ModelViewSet):
     ordering = ["-updated_at"]
     pagination_class = DefaultPageNumberPagination
 
+    @action(detail=True, methods=["post"])
+    def read(self, request, pk=None):
+        """
+        POST /conversations/{id}/read/  Body: { "up_to": <id du dernier message affiché> }
+        Marque lus, en une requête, les messages reçus jusqu'à ce curseur.
+        """
+        conversation_id = int(pk) if str(pk).isdigit() else None
+        if conversation_id is None or not Conversation.participants.through.objects.filter(
+                conversation_id=conversation_id, user_id=request.user.id).exists():
+            return Response({"detail": "Conversation introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        ser = MarkReadSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        up_to = ser.validated_data.get("up_to", 2 ** 63 - 1)
+        marked = unread.mark_conversation_read(request.user.id, conversation_id, up_to)
+        counts = unread.counts(request.user.id, [unread.conversation_key(conversation_id), unread.MESSAGES])
+        return Response({"marked": marked, "unread": counts[unread.conversation_key(conversation_id)],
+                         "messages": counts[unread.MESSAGES]})
+
 
 class MessageViewSet(viewsets.ModelViewSet):
-    queryset = Message.objects.select_related("conversation", "sender").all()
+    """Historique des conversations de l'utilisateur ; `?conversation=<id>` pour un fil."""
+    queryset = Message.objects.select_related("sender").all()
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
-    ordering = ["-created_at"]
-    pagination_class = DefaultPageNumberPagination
+    pagination_class = KeysetCursorPagination
+
+    def get_queryset(self):
+        conversations = Conversation.participants.through.objects.filter(user_id=self.request.user.id)
+        conversation_id = self.request.query_params.get("conversation")
+        if conversation_id:
+            if not conversation_id.isdigit():
+                raise ValidationError({"conversation": "Entier attendu."})
+            conversations = conversations.filter(conversation_id=conversation_id)
+        return super().get_queryset().filter(conversation_id__in=conversations.values("conversation_id"))
 
 
 class NotificationViewSet(viewsets.ModelViewSet):
+    """Fil de notifications de l'utilisateur connecté."""
     queryset = Notification.objects.select_related("user").all()
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
-    ordering = ["-created_at"]
-    pagination_class = DefaultPageNumberPagination
+    pagination_class = KeysetCursorPagination
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user_id=self.request.user.id)
+
+    @action(detail=False, methods=["post"])
+    def read(self, request):
+        """POST /notifications/read/  Body: { "up_to": <id> } (optionnel) : marquage en une requête."""
+        ser = MarkReadSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        marked = unread.mark_notifications_read(request.user.id, ser.validated_data.get("up_to"))
+        return Response({"marked": marked,
+                         "unread": unread.counts(request.user.id, [unread.NOTIFICATIONS])[unread.NOTIFICATIONS]})
 
 
 class HandymanDocumentViewSet(viewsets.ModelViewSet):
@@ -406,13 +525,25 @@ class DeviceViewSet(viewsets.ModelViewSet):
 @permission_classes([permissions.AllowAny])
 def price_estimate(request):
     """
-    Body: { "category_slug": "plomberie", "minutes": 90 }
+    Body: { "category_slug": "plomberie", "minutes": 90, "lat": 5.34, "lng": -4.02 }  (position optionnelle)
     """
     ser = PriceEstimateSerializer(data=request.data)
     ser.is_valid(raise_exception=True)
     return Response(ser.data, status=status.HTTP_200_OK)
 
 
+@api_view(["POST"])
+@permission_classes([permissions.AllowAny])
+def price_estimate_batch(request):
+    """
+    Body: { "items": [ { "category_slug": "plomberie", "minutes": 90, "lat": 5.34, "lng": -4.02 }, ... ] }
+    Return: { "results": [ { "category_slug", "minutes", "amount_xof" }, ... ] } dans l'ordre des items
+    """
+    ser = PriceEstimateBatchSerializer(data=request.data)
+    ser.is_valid(raise_exception=True)
+    return Response(ser.data, status=status.HTTP_200_OK)
+
+
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated])
 def payment_initiate(request):
@@ -426,28 +557,15 @@ def payment_initiate(request):
     return Response(payload, status=status.HTTP_201_CREATED)
 
 
-@api_view(["POST"])
+@api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
-def match(request):
+def unread_counts(request):
     """
-    Body: { "category_id": 3, "lat": 5.34, "lng": -4.02 }
-    Return: artisans classés par distance/rating
+    GET /unread/?conversations=3,7
+    Badges : { notifications, messages, conversations: {id: n} } lus dans le cache (O(1)).
     """
-    req = MatchRequestSerializer(data=request.data)
-    req.is_valid(raise_exception=True)
-
-    lat = req.validated_data["lat"]
-    lng = req.validated_data["lng"]
-    category_id = req.validated_data["category_id"]
-
-    # Ta fonction domaine
-    from handy.services.matching import match_artisans
-    qs = match_artisans(lat, lng, category_id)
-
-    origin = Point(lng, lat, srid=4326)
-    qs = qs.annotate(distance_m=Distance("location", origin))
-    data = MatchResponseSerializer(qs, many=True).data
-    return Response(data, status=status.HTTP_200_OK)
+    ids = [int(c) for c in request.query_params.get("conversations", "").split(",") if c.strip().isdigit()]
+    return Response(unread.badges(request.user.id, ids[:100]))
 
 
 # ---- Webhook Paiement (idempotent) ----
@@ -458,7 +576,8 @@ class PaymentWebhook(APIView):
     def post(self, request, provider):
         """
         Provider path: 'om' | 'mtn' | 'card' | 'moov'...
-        Body: { "provider_ref": "...", "status": "completed|failed|refunded" }
+        Body: { "event_id": "...", "provider_ref": "...", "status": "completed|failed|refunded" }
+        Journalisé (dédoublonné par event_id) puis acquitté ; appliqué au paiement par un worker.
         """
         data = request.data
         provider_ref = data.get("provider_ref")
@@ -467,17 +586,12 @@ class PaymentWebhook(APIView):
         if not provider_ref or not new_status:
             return Response({"detail": "provider_ref et status requis."},
                             status=status.HTTP_400_BAD_REQUEST)
+        if new_status not in dict(Payment.PAYMENT_STATUS):
+            return Response({"detail": "status inconnu."}, status=status.HTTP_400_BAD_REQUEST)
 
         # TODO: vérifier signature HMAC (sécurité)
         with transaction.atomic():
-            p = Payment.objects.select_for_update().get(transaction_id=provider_ref)
-            old = p.status
-            if old != new_status:
-                p.status = new_status
-                p.save(update_fields=["status", "updated_at"])
-                PaymentLog.objects.create(
-                    payment=p, previous_status=old, new_status=new_status, notes=f"prov={provider}"
-                )
+            webhooks.record_event(provider, data)
 
         return Response({"ok": True}, status=status.HTTP_200_OK)
 
@@ -507,19 +621,22 @@ class HeroSlideViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(auto)
 
     def _auto_generate_slides(self):
-        """
-        Construit 2-3 slides dynamiques quand il n'y a aucun slide configuré :
-        - Promo générique
-        - Top catégorie (par volume de services)
-        - Artisans certifiés (générique)
-        """
         # Top category par nombre de services actifs
         top_cat = (ServiceCategory.objects
                    .filter(is_active=True)
                    .annotate(svc_count=Count('services', filter=models.Q(services__is_active=True)))
                    .order_by('-svc_count')
                    .first())
+        return self.auto_slides(top_cat)
 
+    @staticmethod
+    def auto_slides(top_cat):
+        """
+        Construit 2-3 slides dynamiques quand il n'y a aucun slide configuré :
+        - Promo générique
+        - Top catégorie (par volume de services)
+        - Artisans certifiés (générique)
+        """
         slides = []
 
         slides.append({
@@ -7,3 +7,4 @@ class HandyConfig(AppConfig):
 
     def ready(self):
         import handy.signal
+        import handy.services.querybudget  # compteur de requêtes posé sur chaque connexion
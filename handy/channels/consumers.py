@@ -1,8 +1,7 @@
 # channels/consumers.py
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
-from asgiref.sync import sync_to_async
-from django.contrib.gis.geos import Point
-from handy.models import JobTracking
+from channels.db import database_sync_to_async
+from handy.services.tracking import make_point, tracking_buffer
 
 class TrackingConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
@@ -10,14 +9,16 @@ class TrackingConsumer(AsyncJsonWebsocketConsumer):
         await self.channel_layer.group_add(f"bk_{self.booking_id}", self.channel_name)
         await self.accept()
 
-    @sync_to_async
-    def _save_point(self, data):
-        JobTracking.objects.create(
-            booking_id=int(self.booking_id),
-            handyman_id=data["handyman_id"],
-            loc=Point(data["lng"], data["lat"]),
-            speed=data.get("speed"), heading=data.get("heading")
+    async def _save_point(self, data):
+        point = make_point(
+            self.booking_id, data["handyman_id"], data["lat"], data["lng"],
+            speed=data.get("speed"), heading=data.get("heading"), ts=data.get("ts"),
         )
+        # pas d'I/O ici : le point est écrit par lot (bulk_create) par le buffer
+        if tracking_buffer.synchronous:
+            await database_sync_to_async(tracking_buffer.add)(point)
+        else:
+            tracking_buffer.add(point)
 
     async def receive_json(self, content, **kwargs):
         await self._save_point(content)
@@ -26,4 +27,8 @@ class TrackingConsumer(AsyncJsonWebsocketConsumer):
         )
 
     async def loc_update(self, event): await self.send_json(event["data"])
-    async def disconnect(self, code): await self.channel_layer.group_discard(f"bk_{self.booking_id}", self.channel_name)
\ No newline at end of file
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(f"bk_{self.booking_id}", self.channel_name)
+        if tracking_buffer.pending:
+            await database_sync_to_async(tracking_buffer.flush)()
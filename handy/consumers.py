@@ -2,18 +2,23 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from .models import Conversation, Message
+from .models import Conversation
+from .services.chat import make_message, message_buffer
 
 User = get_user_model()
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
+        self.conversation_id = int(self.scope['url_route']['kwargs']['conversation_id'])
         self.room_group_name = f'chat_{self.conversation_id}'
 
-        # Vérifie que l’utilisateur est bien participant de la conversation
-        if await self.is_valid_conversation():
+        # Vérifie que l’utilisateur est bien participant de la conversation (une fois par socket)
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated and await self.is_valid_conversation(user.id):
+            # identité de l'expéditeur gardée pour toute la durée du socket
+            self.sender_id = user.id
+            self.sender_name = user.get_full_name()
             await self.channel_layer.group_add(
                 self.room_group_name,
                 self.channel_name
@@ -27,14 +32,22 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        if message_buffer.pending:
+            await database_sync_to_async(message_buffer.flush)()
 
     # Réception d’un message du WebSocket
     async def receive(self, text_data):
         data = json.loads(text_data)
-        message = data['message']
-        sender_id = self.scope['user'].id
+        message = data.get('message')
+        if not isinstance(message, str) or not message.strip():
+            return
 
-        msg = await self.save_message(sender_id, message)
+        msg = make_message(self.conversation_id, self.sender_id, message)
+        # pas d'I/O ici : le message est écrit par lot (bulk_create) par le buffer
+        if message_buffer.synchronous:
+            await database_sync_to_async(message_buffer.add)(msg)
+        else:
+            message_buffer.add(msg)
 
         # Broadcast à tous les membres de la conversation
         await self.channel_layer.group_send(
@@ -42,7 +55,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             {
                 'type': 'chat_message',
                 'message': msg.content,
-                'sender': msg.sender.get_full_name(),
+                'sender': self.sender_name,
+                'sender_id': self.sender_id,
                 'created_at': msg.created_at.isoformat(),
             }
         )
@@ -52,23 +66,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'message': event['message'],
             'sender': event['sender'],
+            'sender_id': event.get('sender_id'),
             'created_at': event['created_at'],
         }))
 
     @database_sync_to_async
-    def is_valid_conversation(self):
-        try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            return self.scope['user'] in conversation.participants.all()
-        except Conversation.DoesNotExist:
-            return False
-
-    @database_sync_to_async
-    def save_message(self, sender_id, message):
-        sender = User.objects.get(id=sender_id)
-        conversation = Conversation.objects.get(id=self.conversation_id)
-        return Message.objects.create(
-            conversation=conversation,
-            sender=sender,
-            content=message
-        )
+    def is_valid_conversation(self, user_id):
+        return Conversation.participants.through.objects.filter(
+            conversation_id=self.conversation_id, user_id=user_id
+        ).exists()
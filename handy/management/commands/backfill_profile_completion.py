@@ -0,0 +1,16 @@
+# handy/management/commands/backfill_profile_completion.py
+
+from django.core.management.base import BaseCommand
+
+from handy.models import HandymanProfile
+
+
+class Command(BaseCommand):
+    help = "Recalcule HandymanProfile.completion (après un import ou une écriture hors ORM)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        changed = HandymanProfile.refresh_completion(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{len(changed)} profils mis à jour."))
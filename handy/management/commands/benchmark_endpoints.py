@@ -0,0 +1,195 @@
+# handy/management/commands/benchmark_endpoints.py
+"""
+Banc de mesure des endpoints critiques, à lancer sur un jeu `create_fake_data --bulk`.
+
+    python manage.py benchmark_endpoints --iterations 200 --json bench.json
+    python manage.py benchmark_endpoints --compare bench.json
+
+Chaque endpoint est appelé en process (client de test Django, pas de réseau) ;
+on relève la latence (p50/p95/p99, ms) et le nombre de requêtes SQL par appel.
+"""
+import json
+import math
+import random
+import statistics
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from handy.management.commands.create_fake_data import ABJ_LAT, ABJ_LNG, random_point_around
+from handy.models import Booking, HandymanProfile, Service, User
+
+ENDPOINTS = ("match", "nearby", "search", "handyman_dashboard", "employer_dashboard", "track")
+
+
+def percentile(sorted_values, pct):
+    """Percentile par rang (nearest-rank) d'une liste triée."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class Command(BaseCommand):
+    help = "Chronomètre les endpoints critiques (p50/p95/p99, requêtes SQL par appel)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--endpoints", nargs="*", choices=ENDPOINTS, default=list(ENDPOINTS))
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--host", default="localhost", help="Host HTTP (doit figurer dans ALLOWED_HOSTS)")
+        parser.add_argument("--json", dest="json_path", default=None, help="Écrit les résultats (baseline)")
+        parser.add_argument("--compare", default=None, help="Baseline JSON à comparer")
+
+    def handle(self, *args, **opt):
+        self.rng = random.Random(opt["seed"])
+        self.host = opt["host"]
+        self.ctx = self._context()
+
+        results = []
+        for name in opt["endpoints"]:
+            call = getattr(self, f"_{name}")()
+            if call is None:
+                self.stdout.write(self.style.WARNING(f"{name}: données insuffisantes, ignoré."))
+                continue
+            results.append(self._measure(name, call, opt["iterations"], opt["warmup"]))
+
+        baseline = {}
+        if opt["compare"]:
+            with open(opt["compare"]) as fh:
+                baseline = {r["endpoint"]: r for r in json.load(fh)["results"]}
+        self._report(results, baseline)
+
+        if opt["json_path"]:
+            with open(opt["json_path"], "w") as fh:
+                json.dump({"iterations": opt["iterations"], "results": results}, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {opt['json_path']}"))
+
+    # ---- mesure ----
+    def _measure(self, name, call, iterations, warmup):
+        for _ in range(warmup):
+            call()
+        timings, queries, statuses = [], [], Counter()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                t0 = time.perf_counter()
+                response = call()
+                timings.append((time.perf_counter() - t0) * 1000)
+            queries.append(len(captured.captured_queries))
+            statuses[response.status_code] += 1
+        timings.sort()
+        return {
+            "endpoint": name,
+            "p50_ms": round(percentile(timings, 50), 2),
+            "p95_ms": round(percentile(timings, 95), 2),
+            "p99_ms": round(percentile(timings, 99), 2),
+            "mean_ms": round(statistics.fmean(timings), 2),
+            "queries_avg": round(statistics.fmean(queries), 1),
+            "queries_max": max(queries),
+            "statuses": dict(statuses),
+        }
+
+    def _report(self, results, baseline):
+        header = f"{'endpoint':<20}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL moy':>9}{'SQL max':>9}  statuts"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for r in results:
+            line = (f"{r['endpoint']:<20}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+                    f"{r['queries_avg']:>9.1f}{r['queries_max']:>9}  {r['statuses']}")
+            base = baseline.get(r["endpoint"])
+            if base and base["p95_ms"]:
+                delta = (r["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100
+                line += f"  (p95 {delta:+.0f}% vs baseline, SQL {base['queries_avg']} -> {r['queries_avg']})"
+            self.stdout.write(line)
+
+    # ---- contexte (un tirage, réutilisé par tous les endpoints) ----
+    def _client(self, user=None, session=False):
+        """API : vrai jeton JWT (les vues async ne lisent que l'en-tête) ; session=True : vues HTML."""
+        client = APIClient(HTTP_HOST=self.host)
+        if user is not None and session:
+            client.force_login(user)
+        elif user is not None:
+            token = AccessToken.for_user(user)
+            token.set_exp(lifetime=timedelta(hours=1))  # valable toute la mesure
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return client
+
+    def _context(self):
+        active = Booking.objects.filter(status__in=["confirmed", "in_progress"])
+        handyman_id = active.values_list("handyman_id", flat=True).first()
+        employer_id = (Booking.objects.filter(client__user_type="employeur")
+                       .values_list("client_id", flat=True).first())
+        if not Service.objects.exists():
+            raise CommandError("Catalogue vide : lancez d'abord create_fake_data (--bulk).")
+
+        words = set()
+        for title in Service.objects.values_list("title", flat=True)[:300]:
+            words.update(w.strip(".,").lower() for w in title.split() if len(w) > 3)
+
+        return {
+            "categories": list(HandymanProfile.skills.through.objects
+                              .values_list("servicecategory_id", flat=True).distinct()[:50]),
+            "handyman": User.objects.filter(pk=handyman_id).first(),
+            "employer": User.objects.filter(pk=employer_id).first(),
+            "tracked": list(active.filter(handyman_id=handyman_id).values_list("id", flat=True)[:20]),
+            "words": sorted(words) or ["plomberie"],
+        }
+
+    def _point(self):
+        return random_point_around(ABJ_LAT, ABJ_LNG, max_km=15)
+
+    # ---- endpoints ----
+    def _match(self):
+        user = self.ctx["employer"] or self.ctx["handyman"]
+        if not user or not self.ctx["categories"]:
+            return None
+        client, url = self._client(user), reverse("match")
+
+        def call():
+            lat, lng = self._point()
+            return client.post(url, {"category_id": self.rng.choice(self.ctx["categories"]),
+                                     "lat": round(lat, 6), "lng": round(lng, 6)}, format="json")
+        return call
+
+    def _nearby(self):
+        client, url = self._client(), reverse("services-nearby")
+
+        def call():
+            lat, lng = self._point()
+            return client.get(url, {"lat": lat, "lng": lng, "radius_km": 10})
+        return call
+
+    def _search(self):
+        client, url = self._client(), reverse("service_search")
+        return lambda: client.get(url, {"q": self.rng.choice(self.ctx["words"])})
+
+    def _handyman_dashboard(self):
+        if not self.ctx["handyman"]:
+            return None
+        client, url = self._client(self.ctx["handyman"], session=True), reverse("handydash")
+        return lambda: client.get(url)
+
+    def _employer_dashboard(self):
+        if not self.ctx["employer"]:
+            return None
+        client, url = self._client(self.ctx["employer"], session=True), reverse("employeur_dashboard")
+        return lambda: client.get(url)
+
+    def _track(self):
+        if not self.ctx["handyman"] or not self.ctx["tracked"]:
+            return None
+        client = self._client(self.ctx["handyman"])
+
+        def call():
+            lat, lng = self._point()
+            url = reverse("bookings-track", args=[self.rng.choice(self.ctx["tracked"])])
+            return client.post(url, {"lat": lat, "lng": lng, "speed": 8.0, "heading": 90}, format="json")
+        return call
@@ -0,0 +1,44 @@
+# handy/management/commands/build_client_rollups.py
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+from handy.models import Booking, ClientDailyStats, Payment, Review
+
+
+class Command(BaseCommand):
+    help = "(Re)construit la table ClientDailyStats à partir des paiements, demandes et avis."
+
+    def handle(self, *args, **options):
+        rows = defaultdict(lambda: {'spend': Decimal('0.00'), 'bookings': 0, 'bookings_pending': 0,
+                                    'bookings_responded': 0, 'reviews': 0, 'rating_sum': 0})
+
+        for r in (Payment.objects.filter(payment_date__isnull=False)
+                  .annotate(day=TruncDate('payment_date')).values('booking__client_id', 'day')
+                  .annotate(total=Sum('amount'))):
+            rows[(r['booking__client_id'], r['day'])]['spend'] = r['total'] or Decimal('0.00')
+
+        for r in (Booking.objects.annotate(day=TruncDate('created_at')).values('client_id', 'day')
+                  .annotate(total=Count('id', distinct=True),
+                            pending=Count('id', filter=Q(status='pending'), distinct=True),
+                            responded=Count('id', filter=Q(quotations__isnull=False), distinct=True))):
+            row = rows[(r['client_id'], r['day'])]
+            row.update(bookings=r['total'], bookings_pending=r['pending'], bookings_responded=r['responded'])
+
+        for r in (Review.objects.annotate(day=TruncDate('created_at')).values('booking__client_id', 'day')
+                  .annotate(count=Count('id'), rating_sum=Sum('rating'))):
+            row = rows[(r['booking__client_id'], r['day'])]
+            row.update(reviews=r['count'], rating_sum=r['rating_sum'] or 0)
+
+        with transaction.atomic():
+            ClientDailyStats.objects.all().delete()
+            ClientDailyStats.objects.bulk_create(
+                [ClientDailyStats(client_id=client_id, day=day, **values) for (client_id, day), values in rows.items()],
+                batch_size=1000,
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(rows)} lignes ClientDailyStats reconstruites."))
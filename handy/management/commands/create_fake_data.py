@@ -1,14 +1,20 @@
 # handy/management/commands/create_fake_data.py
 from __future__ import annotations
 
+import io
+import json
 import math
 import random
+import time
+from datetime import datetime, date
 from decimal import Decimal, ROUND_HALF_UP
-from typing import List, Tuple
+from typing import Iterable, List, Tuple
 
+from django.contrib.auth.hashers import make_password
 from django.contrib.gis.geos import Point, GEOSGeometry
-from django.core.management.base import BaseCommand
-from django.db import IntegrityError, transaction
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
 from django.db.models.signals import post_save
 from django.utils import timezone
 from django.utils.crypto import get_random_string
@@ -38,6 +44,7 @@ except Exception:
 fake = Faker("fr_FR")
 
 ABJ_LAT, ABJ_LNG = 5.3600, -4.0083  # centre Abidjan
+BULK_EMAIL_DOMAIN = "seed.handy.local"
 
 
 def seed_all(seed: int | None):
@@ -72,6 +79,66 @@ def random_point_around(lat0: float, lng0: float, max_km: float = 12.0) -> Tuple
     return lat, lng
 
 
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _copy_text(value) -> str:
+    """Valeur -> champ COPY (format texte)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    text = str(value)
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_rows(model, rows: List[dict]) -> int:
+    """
+    Insère `rows` (dicts attname -> valeur) via COPY FROM STDIN, sans signaux ni save().
+    Les colonnes absentes prennent la valeur par défaut du champ (auto_now(_add) = maintenant).
+    """
+    if not rows:
+        return 0
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    now = timezone.now()
+
+    def value(field, row):
+        if field.attname in row:
+            v = row[field.attname]
+        elif getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+            v = now
+        elif field.has_default():
+            v = field.get_default()
+        else:
+            v = None
+        if isinstance(v, (dict, list)):
+            return json.dumps(v)
+        if isinstance(v, GEOSGeometry):
+            return v.ewkt
+        return v
+
+    qn = connection.ops.quote_name
+    sql = f"COPY {qn(model._meta.db_table)} ({', '.join(qn(f.column) for f in fields)}) FROM STDIN"
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, "copy"):  # psycopg 3
+            with raw.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row([value(f, row) for f in fields])
+        else:  # psycopg2
+            buf = io.StringIO()
+            for row in rows:
+                buf.write("\t".join(_copy_text(value(f, row)) for f in fields))
+                buf.write("\n")
+            buf.seek(0)
+            raw.copy_expert(sql, buf)
+    return len(rows)
+
+
 class Command(BaseCommand):
     help = "Génère des données de test Handy (artisans, services, réservations) autour d’Abidjan."
 
@@ -82,6 +149,12 @@ class Command(BaseCommand):
         parser.add_argument("--bookings", type=int, default=160)
         parser.add_argument("--seed", type=int, default=None)
         parser.add_argument("--drop", action="store_true")
+        # Mode volumineux (bulk_create + COPY, sans signaux) pour les tests de charge
+        parser.add_argument("--bulk", action="store_true",
+                            help="Chargement en masse (ex. --handymen 100000 --bookings 3000000)")
+        parser.add_argument("--handymen", type=int, default=1000, help="[bulk] nombre d'artisans")
+        parser.add_argument("--clients", type=int, default=5000, help="[bulk] nombre d'employeurs")
+        parser.add_argument("--batch-size", type=int, default=5000, help="[bulk] taille des lots")
 
     # --- util commission ---
     @staticmethod
@@ -90,11 +163,15 @@ class Command(BaseCommand):
             return Decimal("0.00")
         return (Decimal(amount) * rate).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
-    @transaction.atomic
     def handle(self, *args, **opt):
         seed_all(opt.get("seed"))
         fake.unique.clear()
+        if opt["bulk"]:
+            return self._handle_bulk(opt)
+        self._handle_standard(opt)
 
+    @transaction.atomic
+    def _handle_standard(self, opt):
         self.stdout.write(self.style.WARNING("=== Création de FAKE DATA Handy (transactionnelle) ==="))
 
         # déconnecte le signal Booking -> tâche celery
@@ -488,6 +565,210 @@ class Command(BaseCommand):
             ))
         else:
             self.stdout.write(self.style.SUCCESS("Diagnostics: toutes les positions GPS sont renseignées."))
+
+    # ---------------- MODE BULK ----------------
+    def _handle_bulk(self, opt):
+        """
+        Jeux de données volumineux : utilisateurs / profils / services par bulk_create,
+        réservations / paiements / avis par COPY, par lots de --batch-size.
+        Déterministe pour un --seed donné ; les signaux sont contournés, les tables
+        dérivées (compteurs d'avis, index de recherche, agrégats clients) sont
+        recalculées à la fin.
+        """
+        seed = opt["seed"] if opt.get("seed") is not None else 0
+        seed_all(seed)
+        rng = random.Random(seed)
+        batch = max(100, opt["batch_size"])
+        started = time.perf_counter()
+
+        if opt["drop"]:
+            raise CommandError("--drop n'est pas supporté en mode --bulk : utilisez une base vierge (manage.py flush).")
+        if User.objects.filter(username__startswith=f"s{seed}h", email__endswith=BULK_EMAIL_DOMAIN).exists():
+            raise CommandError(f"Le jeu bulk seed={seed} existe déjà : changez --seed ou repartez d'une base vierge.")
+
+        self.stdout.write(self.style.WARNING(f"=== Seed BULK Handy (seed={seed}, lots de {batch}) ==="))
+        pools = self._bulk_text_pools()
+        cats = self._create_categories(opt["categories"])
+
+        handymen = self._bulk_users(rng, opt["handymen"], "handyman", f"s{seed}h", pools, batch)
+        clients = self._bulk_users(rng, opt["clients"], "employeur", f"s{seed}c", pools, batch)
+        self._bulk_profiles(rng, handymen, cats, pools, batch)
+        services = self._bulk_services(rng, opt["services"], handymen, cats, pools, batch)
+        self._bulk_bookings(rng, opt["bookings"], clients, services, pools, batch)
+        self._bulk_derived()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✔ Seed bulk terminé en {time.perf_counter() - started:.1f}s "
+            f"({len(handymen)} artisans, {len(clients)} employeurs, {len(services)} services, "
+            f"{opt['bookings']} réservations)."
+        ))
+
+    @staticmethod
+    def _bulk_text_pools(size: int = 500) -> dict:
+        # Faker est trop lent à l'échelle du million : on tire dans des réservoirs pré-générés
+        return {
+            "first_names": [fake.first_name() for _ in range(size)],
+            "last_names": [fake.last_name() for _ in range(size)],
+            "titles": [fake.catch_phrase() for _ in range(size)],
+            "texts": [fake.text(max_nb_chars=220) for _ in range(size)],
+            "addresses": [fake.street_address() for _ in range(size)],
+            "postcodes": [fake.postcode() for _ in range(50)],
+            "communes": ["Cocody", "Abobo", "Adjamé", "Plateau", "Yopougon", "Treichville", "Marcory", "Koumassi"],
+        }
+
+    def _bulk_users(self, rng, count, user_type, prefix, pools, batch) -> List[User]:
+        self.stdout.write(f"• {count} utilisateurs '{user_type}' (bulk_create)…")
+        password = make_password("password123")  # un seul hachage pour tout le lot
+        now = timezone.now()
+        created: List[User] = []
+        for start in range(0, count, batch):
+            chunk = []
+            for i in range(start, min(count, start + batch)):
+                lat, lng = random_point_around(ABJ_LAT, ABJ_LNG, max_km=20)
+                chunk.append(User(
+                    username=f"{prefix}{i}", email=f"{prefix}{i}@{BULK_EMAIL_DOMAIN}", password=password,
+                    first_name=rng.choice(pools["first_names"]), last_name=rng.choice(pools["last_names"]),
+                    user_type=user_type, is_verified=rng.random() < 0.8, city="Abidjan",
+                    last_location=_pt(lng, lat), last_location_ts=now,
+                ))
+            created.extend(User.objects.bulk_create(chunk))
+        return created
+
+    def _bulk_profiles(self, rng, handymen: List[User], cats: List[ServiceCategory], pools, batch):
+        self.stdout.write(f"• {len(handymen)} profils artisans + compétences + zones…")
+        through = HandymanProfile.skills.through
+        prior_mean = HandymanProfile.rating_prior()[0]
+        for users in _chunks(handymen, batch):
+            profiles = []
+            for u in users:
+                lat, lng = random_point_around(ABJ_LAT, ABJ_LNG, max_km=20)
+                profiles.append(HandymanProfile(
+                    user=u, bio=rng.choice(pools["texts"]), commune=rng.choice(pools["communes"]),
+                    location=_pt(lng, lat), completed_jobs=rng.randint(0, 200),
+                    is_approved=rng.random() < 0.8, online=rng.random() < 0.5,
+                    hourly_rate=rng.randrange(2000, 10000, 500), experience_years=rng.randint(0, 25),
+                    bayes_score=prior_mean,  # bulk_create ne passe pas par save()
+                ))
+            profiles = HandymanProfile.objects.bulk_create(profiles)
+            skills, areas = [], []
+            for p in profiles:
+                for cat in rng.sample(cats, k=min(len(cats), rng.randint(1, 3))):
+                    skills.append(through(handymanprofile_id=p.id, servicecategory_id=cat.id))
+                areas.append(ServiceArea(handyman=p, center=p.location, radius_km=rng.randint(5, 20)))
+            through.objects.bulk_create(skills, batch_size=batch)
+            ServiceArea.objects.bulk_create(areas, batch_size=batch)
+
+    def _bulk_services(self, rng, count, handymen: List[User], cats, pools, batch) -> List[Service]:
+        self.stdout.write(f"• {count} services (bulk_create)…")
+        if not handymen or not cats:
+            return []
+        created: List[Service] = []
+        for start in range(0, count, batch):
+            chunk = []
+            for _ in range(start, min(count, start + batch)):
+                price_type = rng.choice(["hourly", "fixed", "quote"])
+                price = None if price_type == "quote" else Decimal(rng.randrange(2000, 120000, 500))
+                chunk.append(Service(
+                    handyman=rng.choice(handymen), category=rng.choice(cats), title=rng.choice(pools["titles"]),
+                    description=rng.choice(pools["texts"]), price_type=price_type, price=price,
+                    duration=rng.choice([30, 60, 90, 120, 180, 240]) if price_type == "hourly" else None,
+                    is_active=rng.random() > 0.08,
+                ))
+            created.extend(Service.objects.bulk_create(chunk))
+        return created
+
+    def _bulk_bookings(self, rng, count, clients: List[User], services: List[Service], pools, batch):
+        self.stdout.write(f"• {count} réservations + paiements + avis (COPY)…")
+        if not clients or not services:
+            return
+        statuses = ["pending", "confirmed", "in_progress", "completed", "completed", "cancelled"]
+        catalogue = [(s.id, s.handyman_id, s.price) for s in services]
+        client_ids = [c.id for c in clients]
+        now = timezone.now()
+
+        done = 0
+        while done < count:
+            n = min(batch, count - done)
+            bookings, meta = [], []
+            for _ in range(n):
+                service_id, handyman_id, price = rng.choice(catalogue)
+                status = rng.choice(statuses)
+                if status == "pending":
+                    booking_date = now + timezone.timedelta(days=rng.randint(1, 30), minutes=rng.randint(0, 1440))
+                elif status in ("confirmed", "in_progress"):
+                    booking_date = now + timezone.timedelta(days=rng.randint(-2, 7), minutes=rng.randint(0, 1440))
+                else:
+                    booking_date = now - timezone.timedelta(days=rng.randint(1, 365), minutes=rng.randint(0, 1440))
+                created_at = min(now, booking_date) - timezone.timedelta(days=rng.randint(0, 10))
+                lat, lng = random_point_around(ABJ_LAT, ABJ_LNG, max_km=16)
+                bookings.append({
+                    "client_id": rng.choice(client_ids), "handyman_id": handyman_id, "service_id": service_id,
+                    "status": status, "booking_date": booking_date, "address": rng.choice(pools["addresses"]),
+                    "city": "Abidjan", "postal_code": rng.choice(pools["postcodes"]),
+                    "job_location": f"SRID=4326;POINT({lng} {lat})", "description": rng.choice(pools["texts"]),
+                    "created_at": created_at, "updated_at": created_at,
+                })
+                amount = price if price is not None else Decimal(rng.randrange(10000, 120000, 500))
+                meta.append((status, amount, booking_date))
+
+            last_id = Booking.objects.order_by("-id").values_list("id", flat=True).first() or 0
+            with transaction.atomic():
+                copy_rows(Booking, bookings)
+                ids = list(Booking.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:n])
+
+                payments, reviews = [], []
+                for booking_id, (status, amount, booking_date) in zip(ids, meta):
+                    if status not in ("confirmed", "in_progress", "completed"):
+                        continue
+                    paid = status == "completed" and rng.random() < 0.9
+                    payments.append({
+                        "booking_id": booking_id, "amount": amount, "platform_fee": self._fee(amount),
+                        "method": rng.choice(["cash", "card", "transfer"]),
+                        "status": "completed" if paid else "pending", "is_paid": paid,
+                        "transaction_id": f"SEED-{booking_id}", "payment_date": booking_date if paid else None,
+                    })
+                    if status == "completed" and rng.random() < 0.65:
+                        reviews.append({
+                            "booking_id": booking_id, "rating": rng.randint(2, 5),
+                            "comment": rng.choice(pools["texts"]), "created_at": booking_date,
+                            "updated_at": booking_date,
+                        })
+                copy_rows(Payment, payments)
+                copy_rows(Review, reviews)
+
+            done += n
+            self.stdout.write(f"  … {done}/{count}")
+
+    def _bulk_derived(self):
+        """Recalcule ce que les signaux auraient maintenu (le chargement en masse les contourne)."""
+        from handy.services.coverage import rebuild_coverage_column
+        from handy.services.search import rebuild_search_index
+
+        self.stdout.write("• Tables dérivées (avis, recherche, zones, agrégats clients, statistiques)…")
+        prior_mean, prior_weight = HandymanProfile.rating_prior()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE handy_handymanprofile AS p
+                SET rating_sum = r.total, review_count = r.n,
+                    rating = r.total::float / r.n,
+                    bayes_score = (%s * %s + r.total) / (%s + r.n)
+                FROM (SELECT b.handyman_id, SUM(rv.rating) AS total, COUNT(*) AS n
+                      FROM handy_review rv JOIN handy_booking b ON b.id = rv.booking_id
+                      GROUP BY b.handyman_id) AS r
+                WHERE p.user_id = r.handyman_id
+                """,
+                [prior_mean, prior_weight, prior_weight],
+            )
+        rebuild_search_index()
+        rebuild_coverage_column()
+        call_command("backfill_profile_completion", stdout=self.stdout)
+        call_command("build_client_rollups", stdout=self.stdout)
+        with connection.cursor() as cursor:
+            for model in (User, HandymanProfile, ServiceArea, Service, Booking, Payment, Review):
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+
 # # handy/management/commands/create_fake_data.py
 # from __future__ import annotations
 #
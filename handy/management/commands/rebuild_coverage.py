@@ -0,0 +1,14 @@
+# handy/management/commands/rebuild_coverage.py
+
+from django.core.management.base import BaseCommand
+
+from handy.services.coverage import coverage_index, rebuild_coverage_column
+
+
+class Command(BaseCommand):
+    help = "Recalcule ServiceArea.coverage (disques / polygones) et reconstruit l'index des zones."
+
+    def handle(self, *args, **options):
+        count = rebuild_coverage_column()
+        coverage_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{count} zones recalculées, index reconstruit."))
@@ -1,22 +1,87 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.http import HttpResponseForbidden
 
-from handy.models import IPBlacklist
+from handy.services import querybudget
+from handy.services.ipblacklist import ip_blacklist
 
 
 class IPBlacklistMiddleware:
+    # compatible sync et async : sous ASGI, ne force pas les vues async à passer par un thread
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
         ip = self.get_client_ip(request)
-        if IPBlacklist.objects.filter(ip_address=ip, is_active=True).exists():
-            return HttpResponseForbidden("🚫 Accès refusé : votre IP est sur liste noire.")
+        # test en mémoire (adresses + plages CIDR), sans requête SQL
+        if ip_blacklist.is_blocked(ip):
+            return self.forbidden()
         return self.get_response(request)
 
+    async def __acall__(self, request):
+        if await ip_blacklist.ais_blocked(self.get_client_ip(request)):
+            return self.forbidden()
+        return await self.get_response(request)
+
+    @staticmethod
+    def forbidden():
+        return HttpResponseForbidden("🚫 Accès refusé : votre IP est sur liste noire.")
+
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
             ip = x_forwarded_for.split(',')[0].strip()
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return ip
+
+
+class QueryBudgetMiddleware:
+    """
+    Requêtes SQL et temps DB par nom d'URL (cf. handy.services.querybudget) ;
+    signale les endpoints au-delà de leur budget (lève en mode strict).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = querybudget.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            usage = querybudget.stop(token)
+        return self.finish(request, response, usage)
+
+    async def __acall__(self, request):
+        token = querybudget.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            usage = querybudget.stop(token)
+        return self.finish(request, response, usage)
+
+    @staticmethod
+    def finish(request, response, usage):
+        match = getattr(request, "resolver_match", None)
+        if match is not None and match.view_name:
+            querybudget.check(match.view_name, usage)
+        if getattr(settings, "QUERY_BUDGET_HEADERS", False):
+            response["X-DB-Queries"] = str(usage.queries)
+            response["X-DB-Time-ms"] = f"{usage.db_ms:.1f}"
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.23 on 2025-10-17 09:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0016_alter_bookingroute_eta_minutes_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='jobtracking',
+            name='ts',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
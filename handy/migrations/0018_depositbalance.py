@@ -0,0 +1,45 @@
+# Generated by Django 4.2.23 on 2025-10-17 10:05
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def backfill_balances(apps, schema_editor):
+    DepositTransaction = apps.get_model('handy', 'DepositTransaction')
+    DepositBalance = apps.get_model('handy', 'DepositBalance')
+    totals = (DepositTransaction.objects.filter(status='completed')
+              .values('handyman_id').annotate(total=Sum('amount')))
+    DepositBalance.objects.bulk_create(
+        [DepositBalance(handyman_id=row['handyman_id'], balance=row['total'] or Decimal('0.00')) for row in totals],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0017_alter_jobtracking_ts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepositBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+                ('handyman', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='deposit_ledger', to=settings.AUTH_USER_MODEL)),
+                ('last_transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='handy.deposittransaction')),
+            ],
+            options={
+                'verbose_name': 'Solde de caution',
+                'verbose_name_plural': 'Soldes de caution',
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
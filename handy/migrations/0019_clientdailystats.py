@@ -0,0 +1,40 @@
+# Generated by Django 4.2.23 on 2025-10-17 11:20
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0018_depositbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('spend', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('bookings_pending', models.PositiveIntegerField(default=0)),
+                ('bookings_responded', models.PositiveIntegerField(default=0)),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Statistiques client (jour)',
+                'verbose_name_plural': 'Statistiques clients (jour)',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='clientdailystats',
+            constraint=models.UniqueConstraint(fields=('client', 'day'), name='uniq_client_daily_stats'),
+        ),
+    ]
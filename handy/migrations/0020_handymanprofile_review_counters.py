@@ -0,0 +1,53 @@
+# Generated by Django 4.2.23 on 2025-10-17 14:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_review_counters(apps, schema_editor):
+    HandymanProfile = apps.get_model('handy', 'HandymanProfile')
+    Review = apps.get_model('handy', 'Review')
+    prior_mean = getattr(settings, 'RATING_PRIOR_MEAN', 4.0)
+    prior_weight = getattr(settings, 'RATING_PRIOR_WEIGHT', 5)
+
+    totals = {
+        row['booking__handyman_id']: row
+        for row in Review.objects.values('booking__handyman_id').annotate(total=Sum('rating'), count=Count('id'))
+    }
+    profiles = list(HandymanProfile.objects.all())
+    for profile in profiles:
+        row = totals.get(profile.user_id)
+        total, count = (row['total'] or 0, row['count']) if row else (0, 0)
+        profile.rating_sum = total
+        profile.review_count = count
+        profile.rating = total / count if count else 0
+        profile.bayes_score = (prior_mean * prior_weight + total) / (prior_weight + count)
+    HandymanProfile.objects.bulk_update(profiles, ['rating_sum', 'review_count', 'rating', 'bayes_score'],
+                                        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0019_clientdailystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='handymanprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='handymanprofile',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='handymanprofile',
+            name='bayes_score',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_review_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2025-10-17 16:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+BACKFILL_SQL = """
+UPDATE handy_service AS s
+SET search_vector =
+        setweight(to_tsvector('french', coalesce(s.title, '')), 'A')
+     || setweight(to_tsvector('french', coalesce(c.name, '') || ' ' || coalesce(u.first_name, '') || ' '
+                                      || coalesce(u.last_name, '')), 'B')
+     || setweight(to_tsvector('french', coalesce(s.description, '')), 'C'),
+    search_document = concat_ws(' ', s.title, c.name, nullif(trim(concat_ws(' ', u.first_name, u.last_name)), ''))
+FROM handy_servicecategory AS c, handy_user AS u
+WHERE c.id = s.category_id AND u.id = s.handyman_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0020_handymanprofile_review_counters'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='service',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='svc_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='svc_search_doc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
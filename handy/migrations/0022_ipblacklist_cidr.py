@@ -0,0 +1,27 @@
+# Generated by Django 4.2.23 on 2025-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0021_service_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ipblacklist',
+            name='ip_address',
+            field=models.GenericIPAddressField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='ipblacklist',
+            name='cidr',
+            field=models.CharField(blank=True, help_text="Plage d'adresses, ex. 41.202.0.0/16 ou 2001:db8::/32", max_length=43, null=True, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='ipblacklist',
+            constraint=models.CheckConstraint(check=models.Q(('ip_address__isnull', False), ('cidr__isnull', False), _connector='OR'), name='ipbl_address_or_cidr'),
+        ),
+    ]
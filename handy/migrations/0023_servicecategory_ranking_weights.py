@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2025-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0022_ipblacklist_cidr'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecategory',
+            name='ranking_weights',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2025-10-18 11:40
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+# même calcul que ServiceArea.compute_coverage (disque géodésique si pas de polygone)
+BACKFILL_SQL = """
+UPDATE handy_servicearea
+SET coverage = COALESCE(polygon, ST_Buffer(center::geography, radius_km * 1000, 16)::geometry)
+WHERE polygon IS NOT NULL OR (center IS NOT NULL AND radius_km > 0)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0023_servicecategory_ranking_weights'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicearea',
+            name='coverage',
+            field=django.contrib.gis.db.models.fields.PolygonField(blank=True, editable=False, null=True, srid=4326),
+        ),
+        migrations.AddIndex(
+            model_name='servicearea',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['coverage'], name='servicearea_coverage_gist'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2025-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0025_alter_message_created_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='msg_conv_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='notif_user_created_idx'),
+        ),
+    ]
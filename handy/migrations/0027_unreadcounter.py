@@ -0,0 +1,52 @@
+# Generated by Django 4.2.23 on 2025-10-19 09:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# état initial à partir des lignes non lues existantes
+BACKFILL_SQL = [
+    """
+INSERT INTO handy_unreadcounter (user_id, key, count, updated_at)
+SELECT user_id, 'notifications', COUNT(*), now()
+FROM handy_notification WHERE NOT is_read GROUP BY user_id
+""",
+    """
+INSERT INTO handy_unreadcounter (user_id, key, count, updated_at)
+SELECT p.user_id, 'conversation:' || m.conversation_id, COUNT(*), now()
+FROM handy_message m
+JOIN handy_conversation_participants p ON p.conversation_id = m.conversation_id AND p.user_id <> m.sender_id
+WHERE NOT m.is_read GROUP BY p.user_id, m.conversation_id
+""",
+    """
+INSERT INTO handy_unreadcounter (user_id, key, count, updated_at)
+SELECT user_id, 'messages', SUM(count), now()
+FROM handy_unreadcounter WHERE key LIKE 'conversation:%' GROUP BY user_id
+""",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('handy', '0026_message_notification_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40)),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='unreadcounter',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='uniq_unread_counter'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
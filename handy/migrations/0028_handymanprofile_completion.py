@@ -0,0 +1,35 @@
+# Generated by Django 4.2.23 on 2025-10-19 15:10
+
+from django.db import migrations, models
+
+# même formule que HandymanProfile.compute_completion (8 critères, arrondi inférieur)
+BACKFILL_SQL = """
+UPDATE handy_handymanprofile AS p SET completion = (
+      (CASE WHEN COALESCE(p.bio, '') <> '' THEN 1 ELSE 0 END)
+    + (CASE WHEN EXISTS (SELECT 1 FROM handy_handymanprofile_skills s WHERE s.handymanprofile_id = p.id)
+            THEN 1 ELSE 0 END)
+    + (CASE WHEN p.experience_years > 0 THEN 1 ELSE 0 END)
+    + (CASE WHEN COALESCE(p.license_number, '') <> '' THEN 1 ELSE 0 END)
+    + (CASE WHEN COALESCE(p.cni_number, '') <> '' THEN 1 ELSE 0 END)
+    + (CASE WHEN COALESCE(p.insurance_info, '') <> '' THEN 1 ELSE 0 END)
+    + (CASE WHEN COALESCE(p.photo, '') <> '' THEN 1 ELSE 0 END)
+    + (CASE WHEN EXISTS (SELECT 1 FROM handy_handymandocument d WHERE d.handyman_id = p.id)
+            THEN 1 ELSE 0 END)
+) * 100 / 8
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0027_unreadcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='handymanprofile',
+            name='completion',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2025-10-20 08:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0028_handymanprofile_completion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=20)),
+                ('event_id', models.CharField(max_length=100)),
+                ('provider_ref', models.CharField(max_length=100)),
+                ('status', models.CharField(max_length=20)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('outcome', models.CharField(blank=True, choices=[('applied', 'Appliqué'), ('unchanged', 'Sans effet'), ('unknown', 'Référence inconnue'), ('invalid', 'Statut invalide')], max_length=20)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='paymentwebhookevent',
+            constraint=models.UniqueConstraint(fields=('provider', 'event_id'), name='uniq_payment_webhook_event'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentwebhookevent',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['shard', 'id'], name='paywh_pending_idx'),
+        ),
+    ]
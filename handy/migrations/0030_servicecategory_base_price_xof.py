@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2025-10-20 11:05
+
+from django.db import migrations, models
+
+# anciens tarifs codés en dur dans handy.services.pricing
+BASES = {'menage': 2500, 'plomberie': 3000, 'electricite': 3500}
+
+
+def set_initial_bases(apps, schema_editor):
+    ServiceCategory = apps.get_model('handy', 'ServiceCategory')
+    for slug, base in BASES.items():
+        ServiceCategory.objects.filter(slug=slug, base_price_xof__isnull=True).update(base_price_xof=base)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handy', '0029_paymentwebhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecategory',
+            name='base_price_xof',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_initial_bases, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,22 @@
+import ipaddress
+import math
 from decimal import Decimal
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Sum, UniqueConstraint, Q
+from django.db.models.functions import Cast, Greatest
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.gis.db import models as gis_models
-from django.contrib.postgres.indexes import GistIndex
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVectorField
 
 # Create your models here.
 
@@ -85,9 +90,15 @@ class HandymanProfile(models.Model):
 
     availability = models.JSONField(default=dict, blank=True)  # <- null False, default dict
     is_approved = models.BooleanField(default=False, db_index=True)
-    rating = models.FloatField(default=0)
+    rating = models.FloatField(default=0)  # moyenne brute = rating_sum / review_count
+    # Compteurs d'avis dénormalisés (cf. apply_review), lus par les listes et tris
+    rating_sum = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    bayes_score = models.FloatField(default=0, db_index=True)  # moyenne lissée (a priori bayésien)
     completed_jobs = models.PositiveIntegerField(default=0)
     photo = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # complétion du profil (%) stockée, recalculée par les signaux (profil, compétences, documents)
+    completion = models.PositiveSmallIntegerField(default=0, db_index=True)
 
     # Localisation précise (si dispo)
     location = gis_models.PointField(srid=4326, null=True, blank=True)
@@ -108,12 +119,36 @@ class HandymanProfile(models.Model):
             models.CheckConstraint(check=Q(travel_fee__gte=0), name="hm_travel_fee_gte_0"),
         ]
 
+    @staticmethod
+    def rating_prior():
+        return (getattr(settings, 'RATING_PRIOR_MEAN', 4.0), getattr(settings, 'RATING_PRIOR_WEIGHT', 5))
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.review_count:
+            # sans avis, la note lissée vaut l'a priori (comme la migration 0020 pour l'existant)
+            self.bayes_score = self.rating_prior()[0]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def apply_review(cls, user_id, rating_delta: int, count_delta: int):
+        """
+        Mise à jour O(1) des compteurs d'avis (un seul UPDATE, expressions F()) :
+        création (+note, +1), modification (nouvelle - ancienne, 0), suppression (-note, -1).
+        """
+        prior_mean, prior_weight = cls.rating_prior()
+        total = models.F('rating_sum') + rating_delta
+        count = models.F('review_count') + count_delta
+        cls.objects.filter(user_id=user_id).update(
+            rating_sum=total,
+            review_count=count,
+            rating=Cast(total, models.FloatField()) / Greatest(count, 1),
+            bayes_score=(prior_mean * prior_weight + Cast(total, models.FloatField())) / (prior_weight + count),
+        )
+
     @property
     def deposit_balance(self) -> Decimal:
-        total = self.user.deposit_transactions.filter(status='completed').aggregate(
-            total=Sum('amount')
-        )['total'] or Decimal('0.00')
-        return total
+        # lecture O(1) du solde matérialisé (cf. DepositBalance)
+        return DepositBalance.current(self.user_id)
 
     def has_sufficient_deposit(self, service_amount: Decimal) -> bool:
         required = Decimal(service_amount) * Decimal('0.11')
@@ -122,33 +157,69 @@ class HandymanProfile(models.Model):
     def deduct_platform_fee(self, service_amount: Decimal) -> bool:
         """
         Déduit 11% en créant une transaction négative (DB-safe & traçable).
+        Le contrôle de solde est fait sous verrou dans DepositTransaction.save().
         """
         fee = (Decimal(service_amount) * Decimal('0.11')).quantize(Decimal('0.01'))
-        if self.deposit_balance >= fee:
+        try:
             DepositTransaction.objects.create(
                 handyman=self.user, type='deduction', amount=-fee, status='completed',
                 reference=f"PLATFORM_FEE:{timezone.now().isoformat(timespec='seconds')}"
             )
-            return True
-        return False
+        except ValidationError:
+            return False
+        return True
 
-    def profile_completion(self) -> int:
+    # champs lus par compute_completion (has_skills / has_documents : annotations Exists)
+    COMPLETION_FIELDS = ('bio', 'has_skills', 'experience_years', 'license_number', 'cni_number',
+                         'insurance_info', 'photo', 'has_documents')
+
+    @staticmethod
+    def compute_completion(bio, has_skills, experience_years, license_number, cni_number, insurance_info, photo,
+                           has_documents) -> int:
         fields = [
-            bool(self.bio),
-            self.skills.exists(),
-            self.experience_years > 0,
-            bool(self.license_number),
-            bool(self.cni_number),
-            bool(self.insurance_info),
-            bool(self.photo),
-            self.documents.exists()
+            bool(bio),
+            bool(has_skills),
+            (experience_years or 0) > 0,
+            bool(license_number),
+            bool(cni_number),
+            bool(insurance_info),
+            bool(photo),
+            bool(has_documents),
         ]
         completed = sum(fields)
         return int((completed / len(fields)) * 100)
 
+    @classmethod
+    def with_completion_flags(cls, qs=None):
+        """Annote has_skills / has_documents (sous-requêtes EXISTS) pour un calcul en lot."""
+        qs = cls.objects.all() if qs is None else qs
+        return qs.annotate(
+            has_skills=models.Exists(cls.skills.through.objects.filter(handymanprofile_id=models.OuterRef('pk'))),
+            has_documents=models.Exists(HandymanDocument.objects.filter(handyman_id=models.OuterRef('pk'))),
+        )
+
+    @classmethod
+    def refresh_completion(cls, pks=None, batch_size=1000) -> dict:
+        """
+        Recalcule la colonne `completion` (une requête de lecture par lot, écriture
+        des seules lignes modifiées). `pks=None` : tous les profils. Retourne {pk: nouvelle valeur}.
+        """
+        qs = cls.objects.all() if pks is None else cls.objects.filter(pk__in=list(pks))
+        rows = cls.with_completion_flags(qs).order_by('pk').values_list('pk', 'completion', *cls.COMPLETION_FIELDS)
+        changed = []
+        for pk, current, *flags in rows.iterator(chunk_size=batch_size):
+            value = cls.compute_completion(*flags)
+            if value != current:
+                changed.append(cls(pk=pk, completion=value))
+        cls.objects.bulk_update(changed, ['completion'], batch_size=batch_size)
+        return {p.pk: p.completion for p in changed}
+
+    def profile_completion(self) -> int:
+        return self.completion
+
     @property
     def is_fully_completed(self) -> bool:
-        return self.profile_completion() == 100
+        return self.completion == 100
 
     def __str__(self):
         return f"Profil de {self.user.get_full_name() or self.user.username}"
@@ -207,8 +278,13 @@ class DepositTransaction(models.Model):
 
     @staticmethod
     def get_balance(handyman: User):
-        total = DepositTransaction.objects.filter(handyman=handyman, status='completed').aggregate(total=Sum('amount'))[
-            'total']
+        return DepositBalance.current(handyman.pk)
+
+    @staticmethod
+    def compute_balance(handyman_id) -> Decimal:
+        """SUM complet de l'historique : réservé à l'initialisation et à la réconciliation."""
+        total = DepositTransaction.objects.filter(handyman_id=handyman_id, status='completed').aggregate(
+            total=Sum('amount'))['total']
         return total or Decimal('0.00')
 
     def clean(self):
@@ -217,12 +293,76 @@ class DepositTransaction(models.Model):
         if self.type in ['withdrawal', 'deduction'] and self.amount >= 0:
             raise ValidationError("Le montant doit être négatif pour un retrait ou une déduction.")
 
+    def _ledger_amount(self) -> Decimal:
+        return Decimal(self.amount) if self.status == 'completed' else Decimal('0.00')
+
     def save(self, *args, **kwargs):
-        if self.type in ['withdrawal', 'deduction'] and self.status == 'completed':
-            balance = DepositTransaction.get_balance(self.handyman)
-            if abs(self.amount) > balance:
-                raise ValidationError("Solde insuffisant pour effectuer cette opération.")
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            ledger = DepositBalance.lock(self.handyman_id)
+            previous = Decimal('0.00')
+            if self.pk:
+                old = DepositTransaction.objects.filter(pk=self.pk).values_list('amount', 'status').first()
+                if old and old[1] == 'completed':
+                    previous = old[0]
+            delta = self._ledger_amount() - previous
+
+            if self.type in ['withdrawal', 'deduction'] and self.status == 'completed':
+                if ledger.balance + delta < 0:
+                    raise ValidationError("Solde insuffisant pour effectuer cette opération.")
+            super().save(*args, **kwargs)
+            if delta:
+                ledger.apply(delta, self)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            ledger = DepositBalance.lock(self.handyman_id)
+            amount = self._ledger_amount()
+            result = super().delete(*args, **kwargs)
+            if amount:
+                ledger.apply(-amount)
+        return result
+
+
+class DepositBalance(models.Model):
+    """
+    Solde de caution matérialisé (une ligne par artisan), mis à jour dans la même
+    transaction que chaque DepositTransaction 'completed'. Réconcilié par la tâche
+    `reconcile_deposit_balances`.
+    """
+    handyman = models.OneToOneField(User, on_delete=models.CASCADE, related_name='deposit_ledger')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    last_transaction = models.ForeignKey(DepositTransaction, on_delete=models.SET_NULL, null=True, blank=True,
+                                         related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+    reconciled_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Solde de caution"
+        verbose_name_plural = "Soldes de caution"
+
+    def __str__(self):
+        return f"{self.handyman} - {self.balance} XOF"
+
+    @classmethod
+    def current(cls, handyman_id) -> Decimal:
+        balance = cls.objects.filter(handyman_id=handyman_id).values_list('balance', flat=True).first()
+        return balance if balance is not None else Decimal('0.00')
+
+    @classmethod
+    def lock(cls, handyman_id) -> "DepositBalance":
+        """Ligne verrouillée (SELECT ... FOR UPDATE), créée à partir de l'historique si absente."""
+        ledger, _ = cls.objects.select_for_update().get_or_create(
+            handyman_id=handyman_id,
+            defaults={'balance': lambda: DepositTransaction.compute_balance(handyman_id)},
+        )
+        return ledger
+
+    def apply(self, delta: Decimal, tx: "DepositTransaction" = None):
+        fields = {'balance': models.F('balance') + delta, 'updated_at': timezone.now()}
+        if tx is not None:
+            fields['last_transaction'] = tx
+        DepositBalance.objects.filter(pk=self.pk).update(**fields)
+        self.balance += delta
 
 
 # ---- CATALOGUE ----
@@ -233,6 +373,10 @@ class ServiceCategory(models.Model):
     icon = models.CharField(max_length=50, blank=True, null=True)
     is_active = models.BooleanField(default=True, db_index=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, related_name='children')
+    # poids du classement des artisans (cf. handy.services.ranking), ex. {"distance": 0.5, "price_fit": 0.2}
+    ranking_weights = models.JSONField(default=dict, blank=True)
+    # tarif horaire de référence des devis (cf. handy.services.pricing) ; vide = celui du parent
+    base_price_xof = models.PositiveIntegerField(blank=True, null=True)
 
     class Meta:
         verbose_name_plural = "Service Categories"
@@ -259,10 +403,16 @@ class Service(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Recherche plein texte (cf. services/search.py), recalculée par signaux
+    search_vector = SearchVectorField(null=True, editable=False)
+    search_document = models.TextField(blank=True, default='', editable=False)  # titre + catégorie + artisan
+
     class Meta:
         indexes = [
             models.Index(fields=["handyman", "is_active"]),
             models.Index(fields=["category", "is_active"]),
+            GinIndex(fields=["search_vector"], name="svc_search_vector_gin"),
+            GinIndex(fields=["search_document"], name="svc_search_doc_trgm", opclasses=["gin_trgm_ops"]),
         ]
         constraints = [
             # si quote => price is null ; sinon price >= 0
@@ -297,6 +447,30 @@ class ServiceArea(models.Model):
     center = gis_models.PointField(srid=4326, null=True, blank=True)
     radius_km = models.FloatField(default=10)  # simple
     polygon = gis_models.PolygonField(srid=4326, null=True, blank=True)  # optionnel
+    # zone effectivement couverte (polygon, sinon disque center/radius_km), indexée GIST :
+    # "qui dessert cette adresse" = coverage__covers=point
+    coverage = gis_models.PolygonField(srid=4326, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [GistIndex(fields=["coverage"], name="servicearea_coverage_gist")]
+
+    def compute_coverage(self):
+        if self.polygon:
+            return self.polygon
+        if not self.center or not self.radius_km:
+            return None
+        # disque tracé en Web Mercator (échelle corrigée par la latitude), puis ramené en 4326
+        center = self.center.transform(3857, clone=True)
+        disk = center.buffer(self.radius_km * 1000 / math.cos(math.radians(self.center.y)), 16)
+        disk.transform(4326)
+        return disk
+
+    def save(self, *args, **kwargs):
+        self.coverage = self.compute_coverage()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'center', 'radius_km', 'polygon'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'coverage'}
+        super().save(*args, **kwargs)
 
 
 class AvailabilitySlot(models.Model):
@@ -437,6 +611,37 @@ class PaymentLog(models.Model):
     notes = models.TextField(blank=True, null=True)
 
 
+class PaymentWebhookEvent(models.Model):
+    """
+    Journal append-only des webhooks fournisseurs, dédoublonné par (provider, event_id).
+    Appliqué aux paiements par lot, hors requête (cf. handy.services.webhooks).
+    """
+    OUTCOMES = [('applied', 'Appliqué'), ('unchanged', 'Sans effet'), ('unknown', 'Référence inconnue'),
+                ('invalid', 'Statut invalide')]
+
+    provider = models.CharField(max_length=20)
+    event_id = models.CharField(max_length=100)
+    provider_ref = models.CharField(max_length=100)
+    status = models.CharField(max_length=20)
+    payload = models.JSONField(default=dict, blank=True)
+    shard = models.PositiveSmallIntegerField(default=0)  # partition de traitement (par provider_ref)
+    received_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    outcome = models.CharField(max_length=20, choices=OUTCOMES, blank=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["provider", "event_id"], name="uniq_payment_webhook_event"),
+        ]
+        indexes = [
+            # file d'attente : seuls les événements non traités sont indexés
+            models.Index(fields=["shard", "id"], name="paywh_pending_idx", condition=Q(processed_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}:{self.event_id} -> {self.status}"
+
+
 class Payout(models.Model):
     handyman = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payouts', db_index=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
@@ -474,6 +679,33 @@ class Review(models.Model):
         return f"Avis pour la réservation #{self.booking.id}"
 
 
+class ClientDailyStats(models.Model):
+    """
+    Agrégats quotidiens par client (dépenses, demandes, avis), recalculés par
+    case (client, jour) via les signaux Payment / Booking / Quotation / Review.
+    Alimente le tableau de bord employeur en un seul parcours d'index.
+    """
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    spend = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    bookings = models.PositiveIntegerField(default=0)  # demandes créées ce jour
+    bookings_pending = models.PositiveIntegerField(default=0)  # ... encore en attente
+    bookings_responded = models.PositiveIntegerField(default=0)  # ... ayant reçu au moins un devis
+    reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Statistiques client (jour)"
+        verbose_name_plural = "Statistiques clients (jour)"
+        constraints = [
+            UniqueConstraint(fields=["client", "day"], name="uniq_client_daily_stats"),
+        ]
+
+    def __str__(self):
+        return f"{self.client} - {self.day}"
+
+
 class Conversation(models.Model):
     participants = models.ManyToManyField(User, related_name='conversations')
     booking = models.ForeignKey('Booking', on_delete=models.CASCADE, related_name='conversation', null=True,
@@ -492,7 +724,14 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # horodaté à la réception (le message est diffusé avant d'être écrit par lot)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # historique d'une conversation par curseur (created_at, id)
+            models.Index(fields=["conversation", "created_at", "id"], name="msg_conv_created_idx"),
+        ]
 
     def __str__(self):
         return f"Message de {self.sender} dans la conversation #{self.conversation.id}"
@@ -522,6 +761,32 @@ class Notification(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    class Meta:
+        indexes = [
+            # fil de notifications par curseur (created_at, id)
+            models.Index(fields=["user", "created_at", "id"], name="notif_user_created_idx"),
+        ]
+
+
+class UnreadCounter(models.Model):
+    """
+    Compteurs de non-lus par utilisateur (copie durable de ceux du cache Redis) :
+    key = "notifications", "messages" (toutes conversations) ou "conversation:<id>".
+    Maintenus par deltas (cf. handy.services.unread), jamais par COUNT(*).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='unread_counters')
+    key = models.CharField(max_length=40)
+    count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["user", "key"], name="uniq_unread_counter"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.key}: {self.count}"
+
 
 class Report(models.Model):
     REPORT_TYPE = [
@@ -557,13 +822,30 @@ class Device(models.Model):
 
 
 class IPBlacklist(models.Model):
-    ip_address = models.GenericIPAddressField(unique=True)
+    ip_address = models.GenericIPAddressField(unique=True, blank=True, null=True)
+    cidr = models.CharField(max_length=43, unique=True, blank=True, null=True,
+                            help_text="Plage d'adresses, ex. 41.202.0.0/16 ou 2001:db8::/32")
     reason = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=Q(ip_address__isnull=False) | Q(cidr__isnull=False),
+                                   name="ipbl_address_or_cidr"),
+        ]
+
+    def clean(self):
+        if not self.ip_address and not self.cidr:
+            raise ValidationError("Adresse IP ou plage CIDR requise.")
+        if self.cidr:
+            try:
+                self.cidr = str(ipaddress.ip_network(self.cidr.strip(), strict=False))
+            except ValueError:
+                raise ValidationError({'cidr': "Plage CIDR invalide."})
+
     def __str__(self):
-        return f"{self.ip_address} - {'Actif' if self.is_active else 'Inactif'}"
+        return f"{self.ip_address or self.cidr} - {'Actif' if self.is_active else 'Inactif'}"
 
 
 class PricingRule(models.Model):
@@ -582,7 +864,8 @@ class JobTracking(models.Model):
     loc = gis_models.PointField(srid=4326)
     speed = models.FloatField(null=True, blank=True)
     heading = models.FloatField(null=True, blank=True)
-    ts = models.DateTimeField(auto_now_add=True, db_index=True)
+    # horodatage du point (client ou réception), pas de l'écriture : les points sont insérés par lot
+    ts = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         indexes = [models.Index(fields=['booking', '-ts'])]
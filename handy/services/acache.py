@@ -0,0 +1,68 @@
+# services/acache.py
+"""
+Lecture / écriture asynchrones du cache partagé pour les vues async.
+
+- backend RedisCache : client `redis.asyncio` natif (un par boucle d'événements),
+  mêmes clés (`make_and_validate_key`) et même sérialisation que `django.core.cache`,
+  donc interopérable avec le code synchrone ;
+- autre backend (LocMem en dev/tests) : repli sur `cache.aget/aset` de Django.
+"""
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache, RedisSerializer
+
+_clients = weakref.WeakKeyDictionary()  # boucle -> client
+_serializer = RedisSerializer()
+
+
+def _backend():
+    return caches["default"]
+
+
+def _native() -> bool:
+    return isinstance(_backend(), RedisCache)
+
+
+def _client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        from redis.asyncio import Redis
+
+        location = settings.CACHES["default"]["LOCATION"]
+        client = _clients[loop] = Redis.from_url(location[0] if isinstance(location, (list, tuple)) else location)
+    return client
+
+
+async def aget(key, default=None):
+    backend = _backend()
+    if not _native():
+        return await backend.aget(key, default)
+    raw = await _client().get(backend.make_and_validate_key(key))
+    return default if raw is None else _serializer.loads(raw)
+
+
+async def aget_many(keys) -> dict:
+    backend = _backend()
+    keys = list(keys)
+    if not keys:
+        return {}
+    if not _native():
+        return await backend.aget_many(keys)
+    values = await _client().mget([backend.make_and_validate_key(k) for k in keys])
+    return {k: _serializer.loads(v) for k, v in zip(keys, values) if v is not None}
+
+
+async def aset(key, value, timeout):
+    backend = _backend()
+    if not _native():
+        await backend.aset(key, value, timeout)
+        return
+    ttl = backend.get_backend_timeout(timeout)
+    if ttl == 0:
+        await _client().delete(backend.make_and_validate_key(key))
+        return
+    await _client().set(backend.make_and_validate_key(key), _serializer.dumps(value), ex=ttl)
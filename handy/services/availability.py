@@ -0,0 +1,194 @@
+# services/availability.py
+"""
+Index de disponibilité des artisans : un bitmap par artisan, un bit par créneau
+de `bucket_min` minutes sur `horizon_days` jours glissants (30 j x 15 min =
+2880 bits, ~360 octets), stocké dans le cache partagé.
+
+bit à 1 = libre :
+- gabarit hebdomadaire : AvailabilitySlot, sinon le JSON HandymanProfile.availability,
+  au format du formulaire artisan ({"Lundi": ["matin", "aprem"], ...}, cf. SLOT_HOURS)
+  ou en heures ({"monday": [[8, 12], [14, 18]], ...}) ; sans gabarit exploitable,
+  l'artisan est considéré libre par défaut ;
+- moins TimeOff ;
+- moins les réservations confirmées / en cours (booking_date -> end_date, sinon
+  durée du service, sinon `default_booking_min`).
+
+Clé par artisan (User) et par jour de départ : la fenêtre glisse d'elle-même.
+Les signaux recalculent l'artisan concerné ; les bitmaps absents sont construits
+par lot (4 requêtes quel que soit le nombre de candidats).
+"""
+import calendar
+import math
+from datetime import datetime, time as dt_time, timedelta
+from typing import Dict, Iterable, Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+BUSY_STATUSES = ("confirmed", "in_progress")
+# créneaux du formulaire artisan (forms.SLOT_CHOICES), en heures depuis minuit ; nuit : jusqu'à 6h le lendemain
+SLOT_HOURS = {"matin": (8, 12), "aprem": (14, 18), "soir": (18, 22), "nuit": (22, 30)}
+FRENCH_DAYS = ("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche")
+
+
+def _weekday(name):
+    name = str(name).strip().lower()
+    for names in (FRENCH_DAYS, [d.lower() for d in calendar.day_name]):
+        if name in names:
+            return names.index(name)
+    return None
+
+
+def _hours(slot):
+    if isinstance(slot, str):
+        return SLOT_HOURS.get(slot.strip().lower())
+    try:
+        return float(slot[0]), float(slot[1])
+    except (TypeError, ValueError, IndexError, KeyError):
+        return None
+
+
+def weekly_template(weekly_json) -> Dict[int, list]:
+    """JSON de disponibilité -> {jour (0 = lundi): [(début h, fin h), ...]} ; entrées illisibles ignorées."""
+    template = {}
+    if not isinstance(weekly_json, dict):
+        return template
+    for day, slots in weekly_json.items():
+        weekday = _weekday(day)
+        if weekday is None or not isinstance(slots, (list, tuple)):
+            continue
+        for slot in slots:
+            hours = _hours(slot)
+            if hours and hours[1] > hours[0]:
+                template.setdefault(weekday, []).append(hours)
+    return template
+
+
+class AvailabilityIndex:
+    def __init__(self, bucket_min=15, horizon_days=30, default_booking_min=120):
+        self.bucket_min = bucket_min
+        self.horizon_days = horizon_days
+        self.default_booking_min = default_booking_min
+        self.buckets_per_day = 24 * 60 // bucket_min
+        self.size = self.buckets_per_day * horizon_days
+
+    # ---- repères temporels ----
+    def _base(self):
+        """Minuit local du jour : origine du bitmap."""
+        today = timezone.localdate()
+        return timezone.make_aware(datetime.combine(today, dt_time.min))
+
+    def _key(self, user_id, base):
+        return f"avail:{user_id}:{base:%Y%m%d}"
+
+    def _index(self, base, dt, ceil=False) -> int:
+        minutes = (dt - base).total_seconds() / 60 / self.bucket_min
+        i = math.ceil(minutes) if ceil else math.floor(minutes)
+        return min(max(i, 0), self.size)
+
+    @staticmethod
+    def _mask(i0, i1) -> int:
+        return ((1 << (i1 - i0)) - 1) << i0 if i1 > i0 else 0
+
+    # ---- construction ----
+    @staticmethod
+    def _offsets(day, slots, weekly):
+        """Intervalles libres du jour, en décalages depuis minuit."""
+        if slots:
+            return [(timedelta(hours=s.hour, minutes=s.minute), timedelta(hours=e.hour, minutes=e.minute))
+                    for weekday, s, e in slots if weekday == day.weekday()]
+        return [(timedelta(hours=start), timedelta(hours=end)) for start, end in weekly.get(day.weekday(), [])]
+
+    def _template(self, base, slots, weekly_json) -> int:
+        """Bits libres issus du gabarit hebdomadaire (ou tout libre si aucun gabarit exploitable)."""
+        weekly = weekly_template(weekly_json)
+        if not slots and not weekly:
+            return self._mask(0, self.size)
+        bits = 0
+        for d in range(self.horizon_days):
+            day = base.date() + timedelta(days=d)
+            day_start = timezone.make_aware(datetime.combine(day, dt_time.min))
+            for start, end in self._offsets(day, slots, weekly):
+                bits |= self._mask(self._index(base, day_start + start), self._index(base, day_start + end, ceil=True))
+        return bits
+
+    def build_many(self, user_ids: Iterable[int], base=None) -> Dict[int, int]:
+        from handy.models import AvailabilitySlot, Booking, HandymanProfile, TimeOff
+
+        user_ids = list(set(user_ids))
+        if not user_ids:
+            return {}
+        base = base or self._base()
+        horizon_end = base + timedelta(days=self.horizon_days)
+
+        profiles = {pid: (uid, weekly or {}) for pid, uid, weekly in
+                    HandymanProfile.objects.filter(user_id__in=user_ids).values_list('id', 'user_id', 'availability')}
+        slots: Dict[int, list] = {}
+        for pid, weekday, start, end in AvailabilitySlot.objects.filter(
+                handyman_id__in=profiles).values_list('handyman_id', 'weekday', 'start_time', 'end_time'):
+            slots.setdefault(profiles[pid][0], []).append((weekday, start, end))
+
+        bitmaps = {}
+        for pid, (uid, weekly) in profiles.items():
+            bitmaps[uid] = self._template(base, slots.get(uid), weekly)
+        for uid in user_ids:
+            bitmaps.setdefault(uid, self._mask(0, self.size))  # pas de profil : aucune contrainte
+
+        def busy(uid, start, end):
+            if uid in bitmaps and end > base and start < horizon_end:
+                bitmaps[uid] &= ~self._mask(self._index(base, start), self._index(base, end, ceil=True))
+
+        for pid, start, end in TimeOff.objects.filter(
+                handyman_id__in=profiles, end__gt=base, start__lt=horizon_end).values_list('handyman_id', 'start', 'end'):
+            busy(profiles[pid][0], start, end)
+
+        default = timedelta(minutes=self.default_booking_min)
+        for uid, start, end, duration in Booking.objects.filter(
+                handyman_id__in=user_ids, status__in=BUSY_STATUSES,
+                booking_date__gte=base - timedelta(days=1), booking_date__lt=horizon_end,
+        ).values_list('handyman_id', 'booking_date', 'end_date', 'service__duration'):
+            busy(uid, start, end or start + (timedelta(minutes=duration) if duration else default))
+        return bitmaps
+
+    def refresh(self, user_id):
+        """Recalcule et publie le bitmap d'un artisan (appelé par les signaux)."""
+        base = self._base()
+        bits = self.build_many([user_id], base)[user_id]
+        cache.set(self._key(user_id, base), bits, timeout=86400 + 3600)
+
+    def bitmaps(self, user_ids: Iterable[int]) -> Dict[int, int]:
+        """Bitmaps en un aller-retour cache ; les absents sont construits par lot."""
+        base = self._base()
+        user_ids = list(set(user_ids))
+        keys = {self._key(uid, base): uid for uid in user_ids}
+        found = {keys[k]: v for k, v in cache.get_many(list(keys)).items()}
+        missing = [uid for uid in user_ids if uid not in found]
+        if missing:
+            built = self.build_many(missing, base)
+            cache.set_many({self._key(uid, base): bits for uid, bits in built.items()}, timeout=86400 + 3600)
+            found.update(built)
+        return found
+
+    # ---- requêtes ----
+    def free_between(self, user_ids: Iterable[int], start, end) -> Set[int]:
+        """Artisans libres sur tout [start, end[ (partie hors horizon non vérifiable : ignorée)."""
+        user_ids = list(user_ids)
+        if not user_ids or not start or not end or end <= start:
+            return set(user_ids)
+        base = self._base()
+        i0, i1 = self._index(base, start), self._index(base, end, ceil=True)
+        if i1 <= i0:
+            return set(user_ids)  # entièrement passé ou au-delà de l'horizon
+        mask = self._mask(i0, i1)
+        return {uid for uid, bits in self.bitmaps(user_ids).items() if bits & mask == mask}
+
+    def is_free(self, user_id, start, end) -> bool:
+        return user_id in self.free_between([user_id], start, end)
+
+
+availability_index = AvailabilityIndex(
+    bucket_min=getattr(settings, "AVAILABILITY_BUCKET_MIN", 15),
+    horizon_days=getattr(settings, "AVAILABILITY_HORIZON_DAYS", 30),
+    default_booking_min=getattr(settings, "AVAILABILITY_DEFAULT_BOOKING_MIN", 120),
+)
@@ -0,0 +1,141 @@
+# services/batching.py
+"""
+Écriture bufferisée : les objets sont empilés en mémoire (sans I/O) et écrits
+par lots via `bulk_create` par un thread de fond, dès que `max_batch` objets
+sont en attente ou que le plus ancien attend depuis `flush_ms` millisecondes.
+La file restante est écrite à l'arrêt du process (atexit) : le thread de fond
+étant un démon, elle serait sinon perdue à chaque redémarrage.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    def __init__(self, model, name=None, max_batch=200, flush_ms=1000, max_pending=10000):
+        self.model = model
+        self.name = name or model.__name__
+        self.max_batch = max(1, int(max_batch))
+        self.flush_ms = max(10, int(flush_ms))
+        self.max_pending = max(self.max_batch, int(max_pending))
+        self._buf = deque()
+        self._oldest_at = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "flushes": 0, "errors": 0}
+        atexit.register(self._flush_at_exit)
+
+    # ---- production ----
+    def add(self, obj) -> bool:
+        """
+        Empile un objet non sauvegardé. Retourne False si la file était pleine
+        (backpressure : le plus ancien objet en attente est alors abandonné).
+        """
+        if self.synchronous:
+            # mode synchrone (dev/tests) : I/O immédiate, à appeler hors boucle async
+            self.write([obj])
+            self.stats["written"] += 1
+            return True
+
+        accepted = True
+        with self._lock:
+            if len(self._buf) >= self.max_pending:
+                self._buf.popleft()
+                self.stats["dropped"] += 1
+                accepted = False
+            self._buf.append(obj)
+            self.stats["queued"] += 1
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            full = len(self._buf) >= self.max_batch
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+        return accepted
+
+    @property
+    def synchronous(self) -> bool:
+        return self.max_batch == 1
+
+    @property
+    def pending(self) -> int:
+        return len(self._buf)
+
+    # ---- consommation ----
+    def write(self, objs):
+        """Écrit un lot ; surchargeable pour des traitements post-insertion."""
+        self.model.objects.bulk_create(objs, batch_size=self.max_batch)
+
+    def _take(self):
+        with self._lock:
+            n = min(len(self._buf), self.max_batch)
+            batch = [self._buf.popleft() for _ in range(n)]
+            self._oldest_at = time.monotonic() if self._buf else None
+        return batch
+
+    def flush(self) -> int:
+        """Vide toute la file (appel synchrone, ex. à la déconnexion d'un socket)."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take()
+                if not batch:
+                    break
+                try:
+                    self.write(batch)
+                    written += len(batch)
+                    self.stats["written"] += len(batch)
+                except Exception:
+                    self.stats["errors"] += 1
+                    self.stats["dropped"] += len(batch)
+                    logger.exception("%s: échec d'écriture d'un lot de %s", self.name, len(batch))
+            if written:
+                self.stats["flushes"] += 1
+        return written
+
+    def _flush_at_exit(self):
+        if not self._buf:
+            return
+        try:
+            written = self.flush()
+            logger.info("%s: %s objet(s) écrit(s) à l'arrêt", self.name, written)
+        except Exception:
+            logger.exception("%s: échec de l'écriture de la file à l'arrêt", self.name)
+        finally:
+            close_old_connections()
+
+    def _due(self) -> bool:
+        if not self._buf:
+            return False
+        if len(self._buf) >= self.max_batch:
+            return True
+        return self._oldest_at is not None and (time.monotonic() - self._oldest_at) * 1000 >= self.flush_ms
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=f"batch-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=self.flush_ms / 1000)
+            self._wake.clear()
+            if not self._due():
+                continue
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
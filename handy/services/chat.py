@@ -0,0 +1,39 @@
+# services/chat.py
+"""
+Persistance des messages du chat (ChatConsumer) : les messages sont construits
+avec des identifiants bruts (conversation_id, sender_id), horodatés à la
+réception, diffusés immédiatement puis écrits par lot (bulk_create) en tâche de
+fond. La latence de diffusion ne dépend plus de l'écriture en base.
+"""
+from django.conf import settings
+from django.utils import timezone
+
+from handy.models import Message
+from handy.services import unread
+from handy.services.batching import BatchWriter
+
+
+def make_message(conversation_id, sender_id, content) -> Message:
+    return Message(
+        conversation_id=int(conversation_id),
+        sender_id=sender_id,
+        content=content,
+        created_at=timezone.now(),
+    )
+
+
+class MessageBuffer(BatchWriter):
+    def __init__(self, **kwargs):
+        super().__init__(Message, name="chat", **kwargs)
+
+    def write(self, objs):
+        super().write(objs)
+        # bulk_create ne déclenche pas post_save : compteurs de non-lus mis à jour ici, par lot
+        unread.messages_created(objs)
+
+
+message_buffer = MessageBuffer(
+    max_batch=getattr(settings, "CHAT_BATCH_SIZE", 100),
+    flush_ms=getattr(settings, "CHAT_FLUSH_MS", 250),
+    max_pending=getattr(settings, "CHAT_MAX_PENDING", 10000),
+)
@@ -0,0 +1,262 @@
+# services/coverage.py
+"""
+"Quels artisans desservent cette adresse ?" à partir des ServiceArea (disque
+center/radius_km ou polygone), sans dépendre de la position GPS en direct.
+
+- chemin de référence : ServiceArea.coverage (polygone dérivé, index GIST),
+  requête `coverage__covers=point` (ST_Covers indexé) ;
+- chemin chaud : R-tree en mémoire (empaquetage STR) sur les boîtes englobantes,
+  test exact ensuite (haversine pour un disque, point-dans-polygone sinon) ;
+- mises à jour incrémentales par les signaux : les zones modifiées vont dans un
+  petit tampon parcouru linéairement (et masquent l'ancienne entrée de l'arbre),
+  l'arbre est reconstruit au-delà de `max_pending` entrées ;
+- même protocole de version partagée que le GeoIndex (VersionGate).
+"""
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from handy.services.geo import haversine_m
+from handy.services.versioning import VersionGate, get_version
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAME = "coverage"
+M_PER_DEG_LAT = 111320.0
+NODE_CAPACITY = 16
+
+# recalcul en masse de la colonne coverage (après un chargement qui contourne save())
+REBUILD_SQL = """
+UPDATE handy_servicearea
+SET coverage = CASE
+    WHEN polygon IS NOT NULL THEN polygon
+    WHEN center IS NOT NULL AND radius_km > 0 THEN ST_Buffer(center::geography, radius_km * 1000, 16)::geometry
+END
+"""
+
+
+def rebuild_coverage_column() -> int:
+    """Recalcule toutes les zones en une requête et périme les index mémoire."""
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_SQL)
+        count = cursor.rowcount
+    coverage_index.invalidate()
+    return count
+
+
+@dataclass(frozen=True)
+class CoverageArea:
+    id: int
+    handyman_id: int  # HandymanProfile
+    user_id: int
+    categories: Tuple[int, ...]
+    bbox: Tuple[float, float, float, float]  # min_lng, min_lat, max_lng, max_lat
+    center: Optional[Tuple[float, float]]  # (lat, lng) du disque
+    radius_m: float = 0.0
+    rings: Tuple[Tuple[Tuple[float, float], ...], ...] = ()  # polygone : extérieur puis trous (lng, lat)
+
+    def covers(self, lat: float, lng: float) -> bool:
+        if self.rings:
+            if not _in_ring(self.rings[0], lng, lat):
+                return False
+            return not any(_in_ring(hole, lng, lat) for hole in self.rings[1:])
+        return haversine_m(lat, lng, self.center[0], self.center[1]) <= self.radius_m
+
+    def distance_m(self, lat: float, lng: float) -> float:
+        """Distance au centre de la zone (centre du disque, sinon de la boîte englobante)."""
+        if self.center:
+            return haversine_m(lat, lng, self.center[0], self.center[1])
+        min_lng, min_lat, max_lng, max_lat = self.bbox
+        return haversine_m(lat, lng, (min_lat + max_lat) / 2, (min_lng + max_lng) / 2)
+
+
+def _in_ring(ring, x, y) -> bool:
+    """Ray casting (bord inclus approximativement)."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _disk_bbox(lat, lng, radius_m):
+    dlat = radius_m / M_PER_DEG_LAT
+    dlng = radius_m / (M_PER_DEG_LAT * max(0.01, math.cos(math.radians(lat))))
+    return lng - dlng, lat - dlat, lng + dlng, lat + dlat
+
+
+def make_area(area_id, profile_id, user_id, categories, center, radius_km, polygon) -> Optional[CoverageArea]:
+    if polygon:
+        rings = tuple(tuple((x, y) for x, y in ring.coords) for ring in polygon)
+        return CoverageArea(id=area_id, handyman_id=profile_id, user_id=user_id, categories=tuple(categories),
+                            bbox=tuple(polygon.extent), center=None, rings=rings)
+    if center and radius_km:
+        radius_m = radius_km * 1000
+        return CoverageArea(id=area_id, handyman_id=profile_id, user_id=user_id, categories=tuple(categories),
+                            bbox=_disk_bbox(center.y, center.x, radius_m), center=(center.y, center.x),
+                            radius_m=radius_m)
+    return None
+
+
+class STRTree:
+    """R-tree statique empaqueté par Sort-Tile-Recursive ; feuilles = CoverageArea."""
+
+    def __init__(self, items: List[CoverageArea], capacity: int = NODE_CAPACITY):
+        self.size = len(items)
+        level = [(a.bbox, a) for a in items]
+        while len(level) > capacity:
+            level = self._pack(level, capacity)
+        self.root = (self._union([b for b, _ in level]), level) if level else None
+
+    @staticmethod
+    def _union(boxes):
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+    def _pack(self, entries, capacity):
+        n_nodes = math.ceil(len(entries) / capacity)
+        n_slices = math.ceil(math.sqrt(n_nodes))
+        per_slice = n_slices * capacity
+        entries = sorted(entries, key=lambda e: e[0][0] + e[0][2])
+        parents = []
+        for s in range(0, len(entries), per_slice):
+            vertical = sorted(entries[s:s + per_slice], key=lambda e: e[0][1] + e[0][3])
+            for k in range(0, len(vertical), capacity):
+                children = vertical[k:k + capacity]
+                parents.append((self._union([b for b, _ in children]), children))
+        return parents
+
+    def query(self, lng: float, lat: float) -> List[CoverageArea]:
+        """Entrées dont la boîte englobante contient le point."""
+        found, stack = [], [self.root] if self.root else []
+        while stack:
+            _, children = stack.pop()
+            for box, child in children:
+                if box[0] <= lng <= box[2] and box[1] <= lat <= box[3]:
+                    if isinstance(child, CoverageArea):
+                        found.append(child)
+                    else:
+                        stack.append((box, child))
+        return found
+
+
+class CoverageIndex:
+    def __init__(self, ttl: int = 600, max_pending: int = 500):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._lock = threading.RLock()
+        self._tree: Optional[STRTree] = None
+        self._pending: Dict[int, Optional[CoverageArea]] = {}  # area_id -> zone à jour (None = retirée)
+        self._built_at: Optional[float] = None
+        self._rebuilding = False
+        self.gate = VersionGate(VERSION_NAME)
+
+    # ---- état ----
+    def is_ready(self) -> bool:
+        if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+            return False
+        return self.gate.is_current()
+
+    # ---- construction ----
+    @staticmethod
+    def _load(area_ids=None) -> List[CoverageArea]:
+        from handy.models import HandymanProfile, ServiceArea
+
+        qs = ServiceArea.objects.filter(handyman__is_approved=True, coverage__isnull=False)
+        if area_ids is not None:
+            qs = qs.filter(pk__in=area_ids)
+        rows = list(qs.values_list('id', 'handyman_id', 'handyman__user_id', 'center', 'radius_km', 'polygon'))
+        skills: Dict[int, List[int]] = {}
+        through = HandymanProfile.skills.through
+        for pid, cat_id in through.objects.filter(
+                handymanprofile_id__in=[r[1] for r in rows]).values_list('handymanprofile_id', 'servicecategory_id'):
+            skills.setdefault(pid, []).append(cat_id)
+        areas = []
+        for area_id, pid, user_id, center, radius_km, polygon in rows:
+            area = make_area(area_id, pid, user_id, skills.get(pid, ()), center, radius_km, polygon)
+            if area:
+                areas.append(area)
+        return areas
+
+    def rebuild(self):
+        # version lue AVANT les données : une écriture concurrente rendra l'index périmé
+        version = get_version(VERSION_NAME)
+        tree = STRTree(self._load())
+        with self._lock:
+            self._tree = tree
+            self._pending = {}
+            self._built_at = time.monotonic()
+            self.gate.mark_loaded(version)
+        logger.info("CoverageIndex reconstruit: %s zones (v%s)", tree.size, version)
+
+    def schedule_rebuild(self):
+        """Reconstruit en tâche de fond (un seul thread à la fois)."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def _run():
+            try:
+                close_old_connections()
+                self.rebuild()
+            except Exception:
+                logger.exception("Échec de reconstruction du CoverageIndex")
+            finally:
+                close_old_connections()
+                with self._lock:
+                    self._rebuilding = False
+
+        threading.Thread(target=_run, name="coverage-rebuild", daemon=True).start()
+
+    # ---- mises à jour incrémentales ----
+    def refresh_areas(self, area_ids):
+        """Relit des zones (créées, modifiées, artisan (dés)approuvé, compétences) et les remplace."""
+        area_ids = list(area_ids)
+        if not area_ids:
+            return
+        fresh = {a.id: a for a in self._load(area_ids)}
+        with self._lock:
+            for area_id in area_ids:
+                self._pending[area_id] = fresh.get(area_id)
+            overflow = len(self._pending) > self.max_pending
+            self.gate.bump()
+        if overflow:
+            self.schedule_rebuild()
+
+    def remove(self, area_id: int):
+        with self._lock:
+            self._pending[area_id] = None
+            self.gate.bump()
+
+    def invalidate(self):
+        """Force une reconstruction (ici et dans les autres process)."""
+        with self._lock:
+            self._built_at = None
+            self.gate.bump()
+
+    # ---- requête ----
+    def covering(self, lat: float, lng: float, category_id: Optional[int] = None) -> List[CoverageArea]:
+        with self._lock:
+            tree, pending = self._tree, dict(self._pending)
+        candidates = [a for a in (tree.query(lng, lat) if tree else []) if a.id not in pending]
+        candidates += [a for a in pending.values()
+                       if a and a.bbox[0] <= lng <= a.bbox[2] and a.bbox[1] <= lat <= a.bbox[3]]
+        return [a for a in candidates
+                if (category_id is None or category_id in a.categories) and a.covers(lat, lng)]
+
+
+coverage_index = CoverageIndex(
+    ttl=getattr(settings, "COVERAGE_INDEX_TTL", 600),
+    max_pending=getattr(settings, "COVERAGE_INDEX_MAX_PENDING", 500),
+)
@@ -0,0 +1,80 @@
+# services/dashboard.py
+"""
+Statistiques du tableau de bord artisan.
+
+Tous les compteurs (missions du jour, prochaine mission, mois courant / précédent,
+revenu) sortent d'une seule agrégation conditionnelle sur Booking ; le graphique
+des revenus par jour d'une seconde requête. Le résultat est mis en cache par
+artisan et invalidé par les signaux Booking / Payment / DepositTransaction.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from handy.models import Booking, DepositBalance
+
+ACTIVE_STATUSES = ("pending", "confirmed", "in_progress")
+CACHE_TTL = getattr(settings, "DASHBOARD_CACHE_TTL", 300)
+
+
+def _key(user_id, day):
+    # la date fait partie de la clé : les compteurs "aujourd'hui" changent à minuit
+    return f"dash:hm:{user_id}:{day:%Y%m%d}"
+
+
+def compute_handyman_stats(user_id, now=None) -> dict:
+    now = timezone.localtime(now or timezone.now())
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today_end = today_start + timedelta(days=1)
+    month_start = today_start.replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+
+    today = Q(booking_date__gte=today_start, booking_date__lt=today_end)
+    month = Q(booking_date__gte=month_start, booking_date__lt=next_month_start)
+
+    stats = Booking.objects.filter(handyman_id=user_id, booking_date__gte=last_month_start).aggregate(
+        today_missions_count=Count('id', filter=today & Q(status__in=['confirmed', 'in_progress'])),
+        mission_count=Count('id', filter=today & Q(status__in=ACTIVE_STATUSES)),
+        next_service_at=Min('booking_date', filter=today & Q(status__in=ACTIVE_STATUSES)),
+        next_mission_at=Min('booking_date', filter=Q(booking_date__gt=now, status='confirmed')),
+        total_missions=Count('id', filter=month),
+        last_month_missions=Count('id', filter=Q(booking_date__lt=month_start)),
+        revenue=Sum('payment__amount', filter=month & Q(payment__is_paid=True)),
+    )
+    stats['revenue'] = stats['revenue'] or 0
+
+    revenue_data = list(
+        Booking.objects.filter(month, handyman_id=user_id, payment__is_paid=True)
+        .annotate(day=TruncDay('booking_date')).values('day')
+        .annotate(total=Sum('payment__amount')).order_by('day')
+    )
+    max_revenue = max((row['total'] for row in revenue_data), default=0) or 1
+    stats['revenue_chart'] = [
+        {'day': row['day'], 'amount': row['total'], 'percentage': min(100, round(row['total'] / max_revenue * 100))}
+        for row in revenue_data
+    ]
+
+    stats['deposit_balance'] = DepositBalance.current(user_id)
+    stats['days_in_month'] = (next_month_start - month_start).days
+    return stats
+
+
+def get_handyman_stats(user_id) -> dict:
+    now = timezone.now()
+    key = _key(user_id, timezone.localdate(now))
+    stats = cache.get(key)
+    # la "prochaine mission" mise en cache peut être passée : on recalcule
+    if stats is None or (stats['next_mission_at'] is not None and stats['next_mission_at'] <= now):
+        stats = compute_handyman_stats(user_id, now)
+        cache.set(key, stats, CACHE_TTL)
+    return stats
+
+
+def invalidate_handyman_stats(user_id):
+    if user_id:
+        cache.delete(_key(user_id, timezone.localdate()))
@@ -0,0 +1,136 @@
+# services/eta.py
+"""
+ETA incrémental (fallback sans API d'itinéraire).
+
+L'état par réservation (dernier point, vitesse lissée, cap, dernier ETA écrit)
+vit dans le cache partagé : aucune relecture de JobTracking. BookingRoute n'est
+écrit que si l'ETA bouge d'au moins `min_delta_min` minutes ou si la dernière
+écriture date de plus de `min_interval_s` secondes.
+"""
+import time
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from handy.services.geo import haversine_m
+
+KEY = "eta:bk:{}"
+
+
+class EtaEngine:
+    def __init__(self, alpha=0.3, default_kmh=25, min_kmh=8, min_delta_min=2, min_interval_s=60,
+                 state_ttl=6 * 3600):
+        self.alpha = alpha
+        self.default_ms = default_kmh * 1000 / 3600
+        self.min_ms = min_kmh * 1000 / 3600
+        self.min_delta_min = min_delta_min
+        self.min_interval_s = min_interval_s
+        self.state_ttl = state_ttl
+        self.stats = {"observed": 0, "late": 0, "writes": 0}
+
+    @staticmethod
+    def _load_target(booking_id):
+        from handy.models import Booking
+
+        loc = Booking.objects.filter(pk=booking_id).values_list('job_location', flat=True).first()
+        return (loc.y, loc.x) if loc else None
+
+    def _state(self, booking_id):
+        state = cache.get(KEY.format(booking_id))
+        if state is None:
+            state = {}
+        if state.get("target") is None:
+            # seule requête : la destination, une fois par réservation (puis mise en cache) ;
+            # relue tant qu'elle n'est pas renseignée
+            state["target"] = self._load_target(booking_id)
+        return state
+
+    def observe(self, point) -> Optional[int]:
+        """Intègre un point JobTracking ; retourne l'ETA courant (minutes) ou None."""
+        state = self._state(point.booking_id)
+        eta = self._apply(state, point)
+        self._finish(point.booking_id, state)
+        return eta
+
+    def observe_many(self, points: Iterable):
+        """Version lot : un get/set de cache et au plus une écriture par réservation."""
+        by_booking = {}
+        for p in points:
+            by_booking.setdefault(p.booking_id, []).append(p)
+        for booking_id, pts in by_booking.items():
+            state = self._state(booking_id)
+            for p in sorted(pts, key=lambda p: p.ts):
+                self._apply(state, p)
+            self._finish(booking_id, state)
+
+    def _apply(self, state, point):
+        self.stats["observed"] += 1
+        lat, lng, ts = point.loc.y, point.loc.x, point.ts.timestamp()
+
+        last_ts = state.get("ts")
+        if last_ts is not None and ts <= last_ts:
+            self.stats["late"] += 1
+            return state.get("eta")
+
+        # vitesse instantanée : capteur (m/s) sinon déplacement / temps
+        sample = None
+        if point.speed is not None and point.speed >= 0:
+            sample = point.speed
+        elif last_ts is not None:
+            sample = haversine_m(state["lat"], state["lng"], lat, lng) / (ts - last_ts)
+        speed = state.get("speed")
+        if sample is not None:
+            speed = sample if speed is None else self.alpha * sample + (1 - self.alpha) * speed
+
+        state.update({
+            "lat": lat, "lng": lng, "ts": ts, "speed": speed,
+            "heading": point.heading if point.heading is not None else state.get("heading"),
+        })
+
+        target = state.get("target")
+        if not target:
+            return None
+        d_m = haversine_m(lat, lng, target[0], target[1])
+        speed_ms = max(speed if speed is not None else self.default_ms, self.min_ms)
+        state["eta"] = max(int(d_m / speed_ms / 60), 0)
+        return state["eta"]
+
+    def _finish(self, booking_id, state):
+        if state.get("eta") is not None:
+            self._maybe_write(booking_id, state, state["eta"])
+        cache.set(KEY.format(booking_id), state, self.state_ttl)
+
+    def _maybe_write(self, booking_id, state, eta):
+        from handy.models import BookingRoute
+
+        now = time.time()
+        written_eta, written_at = state.get("written_eta"), state.get("written_at")
+        if written_eta is not None and abs(eta - written_eta) < self.min_delta_min \
+                and now - written_at < self.min_interval_s:
+            return
+        updated = BookingRoute.objects.filter(booking_id=booking_id).update(
+            eta_minutes=eta, updated_at=timezone.now()
+        )
+        if not updated:
+            BookingRoute.objects.get_or_create(booking_id=booking_id, defaults={"eta_minutes": eta})
+        state["written_eta"], state["written_at"] = eta, now
+        self.stats["writes"] += 1
+
+    def forget(self, booking_id):
+        cache.delete(KEY.format(booking_id))
+
+    def retarget(self, booking_id, location):
+        """Destination modifiée (job_location) : l'état calculé sur l'ancienne est abandonné."""
+        state = cache.get(KEY.format(booking_id))
+        target = (location.y, location.x) if location else None
+        if state is not None and tuple(state.get("target") or ()) != tuple(target or ()):
+            self.forget(booking_id)
+
+
+eta_engine = EtaEngine(
+    alpha=getattr(settings, "ETA_SPEED_ALPHA", 0.3),
+    min_delta_min=getattr(settings, "ETA_MIN_DELTA_MIN", 2),
+    min_interval_s=getattr(settings, "ETA_MIN_INTERVAL_S", 60),
+)
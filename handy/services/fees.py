@@ -1,11 +1,133 @@
 # services/fees.py
+"""
+Frais plateforme : table des règles PricingRule en mémoire (par process).
+
+- résolution par catégorie : règle active de la catégorie, sinon de son parent
+  (et ainsi de suite), sinon règle globale (category=None), sinon 11 % sans minimum ;
+- la table résolue {category_id: (taux en points de base, minimum XOF)} est
+  chargée en 2 requêtes et rechargée quand la version partagée "pricing_rules"
+  change (save/delete de PricingRule ou de ServiceCategory) ;
+- `compute_platform_fees` calcule un lot en NumPy, en entiers (centimes x points
+  de base) : résultat identique, arrondi compris, au calcul Decimal unitaire.
+"""
+import logging
+import threading
+import time
 from decimal import Decimal
-from handy.models import PricingRule
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from handy.services.versioning import VersionGate, get_version
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAME = "pricing_rules"
+DEFAULT_RULE = (1100, 0)  # 11 %, sans minimum
+SCALE = 10 ** 6  # centimes (1e2) x points de base (1e4)
+
+
+class FeeRuleTable:
+    def __init__(self, ttl: int = 3600, check_every: float = 2.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rules: Dict[Optional[int], Tuple[int, int]] = {}
+        self._loaded_at = None
+        self.gate = VersionGate(VERSION_NAME, check_every=check_every)
+
+    def reload(self):
+        from handy.models import PricingRule, ServiceCategory
+
+        version = get_version(VERSION_NAME)
+        own: Dict[Optional[int], Tuple[int, int]] = {}
+        for category_id, percent, minimum in (PricingRule.objects.filter(active=True).order_by('-id')
+                                              .values_list('category_id', 'fee_percent', 'fee_min_xof')):
+            own[category_id] = (int(percent * 100), int(minimum))  # la plus ancienne l'emporte
+        parents = dict(ServiceCategory.objects.values_list('id', 'parent_id'))
+
+        fallback = own.get(None, DEFAULT_RULE)
+        rules = {None: fallback}
+        for category_id in parents:
+            seen, node = set(), category_id
+            while node is not None and node not in own and node not in seen:
+                seen.add(node)  # garde-fou contre un cycle de parents
+                node = parents.get(node)
+            rules[category_id] = own.get(node, fallback)
+        self._rules = rules
+        self._loaded_at = time.monotonic()
+        self.gate.mark_loaded(version)
+
+    def _is_fresh(self) -> bool:
+        return (self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+                and self.gate.is_current())
+
+    def _ensure_loaded(self):
+        try:
+            if self._is_fresh():
+                return
+        except Exception:
+            # cache partagé indisponible : on garde la table courante
+            if self._loaded_at is not None:
+                return
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    self.reload()
+            return
+        # table périmée : un seul thread recharge, les autres utilisent l'ancienne
+        if self._lock.acquire(blocking=False):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Échec de rechargement des règles de frais")
+            finally:
+                self._lock.release()
+
+    def rule(self, category_id=None) -> Tuple[int, int]:
+        """(taux en points de base, minimum XOF) applicable à la catégorie."""
+        self._ensure_loaded()
+        return self._rules.get(category_id, self._rules[None])
+
+    def invalidate(self):
+        self._loaded_at = None
+        self.gate.bump()
+
+
+fee_rules = FeeRuleTable(ttl=getattr(settings, "FEE_RULES_TTL", 3600))
+
 
 def compute_platform_fee(amount: Decimal, category_id=None) -> Decimal:
-    rule = PricingRule.objects.filter(active=True, category_id=category_id).first() or \
-           PricingRule.objects.filter(active=True, category__isnull=True).first()
-    if not rule:
-        return (amount * Decimal('0.11')).quantize(Decimal('1.'))  # défaut 11%
-    fee = (amount * (rule.fee_percent/Decimal('100'))).quantize(Decimal('1.'))
-    return max(fee, Decimal(rule.fee_min_xof))
\ No newline at end of file
+    bps, minimum = fee_rules.rule(category_id)
+    fee = (amount * Decimal(bps) / Decimal('10000')).quantize(Decimal('1.'))
+    return max(fee, Decimal(minimum))
+
+
+def compute_platform_fees(items: Iterable[Tuple[Decimal, Optional[int]]]) -> List[Decimal]:
+    """
+    Frais d'un lot de (montant, category_id), dans l'ordre. Les montants à plus de
+    2 décimales (non représentables en centimes) passent par le calcul unitaire.
+    """
+    items = list(items)
+    if not items:
+        return []
+    n = len(items)
+    cents = np.zeros(n, dtype=np.int64)
+    bps = np.zeros(n, dtype=np.int64)
+    minimum = np.zeros(n, dtype=np.int64)
+    exact = np.ones(n, dtype=bool)
+    for i, (amount, category_id) in enumerate(items):
+        c = Decimal(amount) * 100
+        if c != c.to_integral_value():
+            exact[i] = False
+            continue
+        cents[i] = int(c)
+        bps[i], minimum[i] = fee_rules.rule(category_id)
+
+    # arrondi au franc, demi-pair (comme Decimal.quantize par défaut) ; négatifs : floor_divide
+    q, r = np.divmod(cents * bps, SCALE)
+    q += (2 * r > SCALE) | ((2 * r == SCALE) & (q % 2 == 1))
+    fees = np.maximum(q, minimum)
+
+    return [Decimal(int(f)) if ok else compute_platform_fee(Decimal(amount), category_id)
+            for f, ok, (amount, category_id) in zip(fees, exact, items)]
@@ -0,0 +1,46 @@
+# services/geo.py
+from math import radians, cos, sqrt, sin, asin
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distance grand-cercle en mètres entre deux points (lat/lng en degrés)."""
+    dlat, dlon = radians(lat2 - lat1), radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * asin(sqrt(a))
+
+
+# ---- Geohash (base 32, bits lng/lat entrelacés) ----
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat, lng, precision=6):
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            value, lng_lo, lng_hi = (value << 1 | 1, mid, lng_hi) if lng >= mid else (value << 1, lng_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            value, lat_lo, lat_hi = (value << 1 | 1, mid, lat_hi) if lat >= mid else (value << 1, lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision):
+    """(hauteur, largeur) d'une cellule en degrés."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def geohash_center(lat, lng, precision=6):
+    """Centre de la cellule contenant (lat, lng) : origine commune à toute la cellule."""
+    dlat, dlng = geohash_cell_size(precision)
+    return ((lat + 90.0) // dlat + 0.5) * dlat - 90.0, ((lng + 180.0) // dlng + 0.5) * dlng - 180.0
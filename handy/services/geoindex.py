@@ -0,0 +1,194 @@
+# services/geoindex.py
+"""
+Index spatial en mémoire (grille par catégorie) des artisans approuvés et en ligne.
+
+- construit en 2 requêtes (profils + compétences), puis maintenu par les signaux
+  de HandymanProfile (save/delete/skills), au commit et seulement quand
+  l'approbation, la présence, la position ou les compétences changent ;
+- une version partagée dans le cache permet de savoir si un autre process
+  (worker celery, autre daphne) a modifié un profil : l'index est alors "périmé"
+  et `match_artisans` repasse par PostGIS le temps d'une reconstruction.
+"""
+import heapq
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from handy.services.geo import haversine_m
+from handy.services.versioning import VersionGate, get_version
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAME = "geoindex"
+M_PER_DEG_LAT = 111320.0
+
+
+@dataclass(frozen=True)
+class IndexedArtisan:
+    id: int
+    user_id: int
+    full_name: str
+    rating: float
+    completed_jobs: int
+    lat: float
+    lng: float
+    categories: Tuple[int, ...]
+
+
+class GeoIndex:
+    def __init__(self, cell_deg: float = 0.02, ttl: int = 300):
+        self.cell_deg = cell_deg
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._entries: Dict[int, IndexedArtisan] = {}
+        self._grid: Dict[int, Dict[Tuple[int, int], Set[int]]] = {}
+        self._built_at: Optional[float] = None
+        self._rebuilding = False
+        self.gate = VersionGate(VERSION_NAME)
+
+    # ---- état ----
+    def is_ready(self) -> bool:
+        if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+            return False
+        return self.gate.is_current()
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    # ---- construction ----
+    def rebuild(self):
+        from handy.models import HandymanProfile
+
+        # version lue AVANT les données : une écriture concurrente rendra l'index périmé
+        version = get_version(VERSION_NAME)
+
+        rows = (HandymanProfile.objects
+                .filter(is_approved=True, online=True, location__isnull=False)
+                .values_list('id', 'user_id', 'location', 'rating', 'completed_jobs',
+                             'user__first_name', 'user__last_name'))
+        skills: Dict[int, List[int]] = {}
+        through = HandymanProfile.skills.through
+        for pid, cat_id in through.objects.filter(
+                handymanprofile__is_approved=True, handymanprofile__online=True
+        ).values_list('handymanprofile_id', 'servicecategory_id'):
+            skills.setdefault(pid, []).append(cat_id)
+
+        entries: Dict[int, IndexedArtisan] = {}
+        grid: Dict[int, Dict[Tuple[int, int], Set[int]]] = {}
+        for pid, user_id, loc, rating, jobs, first, last in rows:
+            entry = IndexedArtisan(
+                id=pid, user_id=user_id,
+                full_name=f"{first or ''} {last or ''}".strip(),
+                rating=rating or 0.0, completed_jobs=jobs or 0,
+                lat=loc.y, lng=loc.x, categories=tuple(skills.get(pid, ())),
+            )
+            entries[pid] = entry
+            cell = self._cell(entry.lat, entry.lng)
+            for cat_id in entry.categories:
+                grid.setdefault(cat_id, {}).setdefault(cell, set()).add(pid)
+
+        with self._lock:
+            self._entries = entries
+            self._grid = grid
+            self._built_at = time.monotonic()
+            self.gate.mark_loaded(version)
+        logger.info("GeoIndex reconstruit: %s artisans (v%s)", len(entries), version)
+
+    def schedule_rebuild(self):
+        """Reconstruit en tâche de fond (un seul thread à la fois)."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def _run():
+            try:
+                close_old_connections()
+                self.rebuild()
+            except Exception:
+                logger.exception("Échec de reconstruction du GeoIndex")
+            finally:
+                close_old_connections()
+                with self._lock:
+                    self._rebuilding = False
+
+        threading.Thread(target=_run, name="geoindex-rebuild", daemon=True).start()
+
+    # ---- mises à jour incrémentales ----
+    def _remove_locked(self, pid: int):
+        old = self._entries.pop(pid, None)
+        if not old:
+            return
+        cell = self._cell(old.lat, old.lng)
+        for cat_id in old.categories:
+            ids = self._grid.get(cat_id, {}).get(cell)
+            if ids:
+                ids.discard(pid)
+
+    def upsert(self, profile, categories=None):
+        """Applique l'état d'un HandymanProfile (ajout, déplacement ou retrait)."""
+        eligible = profile.is_approved and profile.online and profile.location is not None
+        entry = None
+        if eligible:
+            if categories is None:
+                categories = list(profile.skills.values_list('id', flat=True))
+            entry = IndexedArtisan(
+                id=profile.pk, user_id=profile.user_id,
+                full_name=profile.user.get_full_name(),
+                rating=profile.rating or 0.0, completed_jobs=profile.completed_jobs or 0,
+                lat=profile.location.y, lng=profile.location.x, categories=tuple(categories),
+            )
+        with self._lock:
+            self._remove_locked(profile.pk)
+            if entry:
+                self._entries[entry.id] = entry
+                cell = self._cell(entry.lat, entry.lng)
+                for cat_id in entry.categories:
+                    self._grid.setdefault(cat_id, {}).setdefault(cell, set()).add(entry.id)
+            self.gate.bump()
+
+    def invalidate(self):
+        """Force une reconstruction (ici et dans les autres process)."""
+        with self._lock:
+            self._built_at = None
+            self.gate.bump()
+
+    def remove(self, pid: int):
+        with self._lock:
+            self._remove_locked(pid)
+            self.gate.bump()
+
+    # ---- requête ----
+    def nearest(self, lat: float, lng: float, category_id: int, radius_km: float = 15,
+                limit: int = 10) -> List[Tuple[float, IndexedArtisan]]:
+        radius_m = radius_km * 1000
+        dlat = radius_m / M_PER_DEG_LAT
+        dlng = radius_m / (M_PER_DEG_LAT * max(0.01, math.cos(math.radians(lat))))
+        (r0, c0), (r1, c1) = self._cell(lat - dlat, lng - dlng), self._cell(lat + dlat, lng + dlng)
+
+        with self._lock:
+            cells = self._grid.get(category_id)
+            if not cells:
+                return []
+            found = []
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    for pid in cells.get((r, c), ()):
+                        e = self._entries[pid]
+                        d = haversine_m(lat, lng, e.lat, e.lng)
+                        if d <= radius_m:
+                            found.append((d, -e.rating, -e.completed_jobs, pid, e))
+        best = heapq.nsmallest(limit, found)
+        return [(d, e) for d, _, _, _, e in best]
+
+
+geo_index = GeoIndex(
+    cell_deg=getattr(settings, "GEO_INDEX_CELL_DEG", 0.02),
+    ttl=getattr(settings, "GEO_INDEX_TTL", 300),
+)
@@ -0,0 +1,152 @@
+# services/ipblacklist.py
+"""
+Liste noire IP en mémoire (par process) pour IPBlacklistMiddleware.
+
+- adresses exactes : ensemble Python, test O(1) ;
+- plages CIDR : arbre radix binaire (un par famille IPv4 / IPv6), test en
+  au plus 32 / 128 pas, indépendant du nombre de plages.
+
+Rechargée (1 requête) quand la version partagée "ipblacklist" change, c.-à-d.
+après un save/delete d'IPBlacklist dans n'importe quel process.
+"""
+import ipaddress
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from handy.services.versioning import VersionGate, get_version
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAME = "ipblacklist"
+
+
+class PrefixTree:
+    """Arbre radix binaire : chaque nœud = [fils 0, fils 1, fin de préfixe]."""
+
+    def __init__(self):
+        self.root = [None, None, False]
+        self.size = 0
+
+    def insert(self, network):
+        bits, node = int(network.network_address), self.root
+        width = network.max_prefixlen
+        for i in range(network.prefixlen):
+            if node[2]:
+                return  # déjà couvert par une plage plus large
+            b = (bits >> (width - 1 - i)) & 1
+            if node[b] is None:
+                node[b] = [None, None, False]
+            node = node[b]
+        node[2] = True
+        node[0] = node[1] = None  # les sous-plages sont redondantes
+        self.size += 1
+
+    def contains(self, address) -> bool:
+        bits, node = int(address), self.root
+        width = address.max_prefixlen
+        for i in range(width):
+            if node[2]:
+                return True
+            node = node[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                return False
+        return node[2]
+
+
+class IPBlacklistCache:
+    def __init__(self, ttl: int = 600, check_every: float = 2.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._exact = frozenset()
+        self._trees = {4: PrefixTree(), 6: PrefixTree()}
+        self._loaded_at = None
+        self.gate = VersionGate(VERSION_NAME, check_every=check_every)
+
+    def reload(self):
+        from handy.models import IPBlacklist
+
+        version = get_version(VERSION_NAME)
+        exact, trees = set(), {4: PrefixTree(), 6: PrefixTree()}
+        for ip, cidr in IPBlacklist.objects.filter(is_active=True).values_list('ip_address', 'cidr'):
+            try:
+                if ip:
+                    exact.add(ipaddress.ip_address(ip))
+                if cidr:
+                    network = ipaddress.ip_network(cidr, strict=False)
+                    trees[network.version].insert(network)
+            except ValueError:
+                logger.warning("Entrée IPBlacklist invalide ignorée: %s / %s", ip, cidr)
+        self._exact, self._trees = frozenset(exact), trees
+        self._loaded_at = time.monotonic()
+        self.gate.mark_loaded(version)
+
+    def _is_fresh(self) -> bool:
+        return (self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+                and self.gate.is_current())
+
+    def _ensure_loaded(self):
+        try:
+            if self._is_fresh():
+                return
+        except Exception:
+            # cache partagé indisponible : on garde la liste courante
+            if self._loaded_at is not None:
+                return
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    self.reload()
+            return
+        # liste périmée : un seul thread recharge, les autres utilisent l'ancienne
+        if self._lock.acquire(blocking=False):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Échec de rechargement de la liste noire IP")
+            finally:
+                self._lock.release()
+
+    @staticmethod
+    def _address(ip):
+        if not ip:
+            return None
+        try:
+            return ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+    def _contains(self, address) -> bool:
+        if address in self._exact:
+            return True
+        return self._trees[address.version].contains(address)
+
+    def is_blocked(self, ip) -> bool:
+        address = self._address(ip)
+        if address is None:
+            return False
+        self._ensure_loaded()
+        return self._contains(address)
+
+    async def ais_blocked(self, ip) -> bool:
+        """Variante async : seul un rechargement (requête SQL) passe par un thread."""
+        address = self._address(ip)
+        if address is None:
+            return False
+        try:
+            fresh = self._is_fresh()
+        except Exception:
+            fresh = self._loaded_at is not None
+        if not fresh:
+            await sync_to_async(self._ensure_loaded)()
+        return self._contains(address)
+
+    def invalidate(self):
+        self._loaded_at = None
+        self.gate.bump()
+
+
+ip_blacklist = IPBlacklistCache(ttl=getattr(settings, "IP_BLACKLIST_TTL", 600))
@@ -1,15 +1,97 @@
 # services/matching.py
-from django.contrib.gis.db.models.functions import Distance
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Centroid, Distance
 from django.contrib.gis.geos import Point
-from django.utils import timezone
-from handy.models import HandymanProfile
+from handy.models import HandymanProfile, ServiceArea
+from handy.services.availability import availability_index
+from handy.services.coverage import coverage_index
+from handy.services.geoindex import geo_index
+from handy.services.ranking import rank_candidates
 
-def match_artisans(lat: float, lng: float, category_id: int, radius_km=15, limit=10):
+
+def match_artisans_qs(lat: float, lng: float, category_id: int, radius_km=15, limit=10):
+    """Chemin PostGIS (référence) : utilisé quand l'index mémoire est froid ou périmé."""
     origin = Point(lng, lat, srid=4326)
-    now = timezone.localtime().time()
     qs = (HandymanProfile.objects
           .filter(is_approved=True, online=True, skills__id=category_id, location__isnull=False)
+          .select_related('user')
           .annotate(distance=Distance('location', origin))
           .filter(distance__lte=radius_km*1000)
           .order_by('distance','-rating','-completed_jobs')[:limit])
-    return qs
\ No newline at end of file
+    return qs
+
+
+def _nearest(lat: float, lng: float, category_id: int, radius_km, limit):
+    if getattr(settings, "GEO_INDEX_ENABLED", True):
+        if geo_index.is_ready():
+            return [
+                {"id": e.id, "user_id": e.user_id, "full_name": e.full_name, "rating": e.rating,
+                 "completed_jobs": e.completed_jobs, "distance_m": d}
+                for d, e in geo_index.nearest(lat, lng, category_id, radius_km, limit)
+            ]
+        geo_index.schedule_rebuild()
+
+    return [
+        {"id": hp.id, "user_id": hp.user_id, "full_name": hp.user.get_full_name(), "rating": hp.rating,
+         "completed_jobs": hp.completed_jobs, "distance_m": hp.distance.m}
+        for hp in match_artisans_qs(lat, lng, category_id, radius_km, limit)
+    ]
+
+
+def covering_artisans(lat: float, lng: float, category_id: int, limit=10):
+    """
+    Artisans approuvés dont la zone d'intervention (ServiceArea) couvre le point,
+    en ligne ou non : pour les missions planifiées. distance_m = distance au centre de la zone.
+    """
+    if getattr(settings, "COVERAGE_INDEX_ENABLED", True):
+        if coverage_index.is_ready():
+            areas = sorted(coverage_index.covering(lat, lng, category_id), key=lambda a: a.distance_m(lat, lng))[:limit]
+            distances = {a.handyman_id: a.distance_m(lat, lng) for a in areas}
+            profiles = (HandymanProfile.objects.filter(pk__in=distances)
+                        .values_list('id', 'user_id', 'user__first_name', 'user__last_name', 'rating', 'completed_jobs'))
+            rows = [
+                {"id": pid, "user_id": uid, "full_name": f"{first or ''} {last or ''}".strip(), "rating": rating,
+                 "completed_jobs": jobs, "distance_m": distances[pid]}
+                for pid, uid, first, last, rating, jobs in profiles
+            ]
+            return sorted(rows, key=lambda r: r["distance_m"])
+        coverage_index.schedule_rebuild()
+
+    origin = Point(lng, lat, srid=4326)
+    areas = (ServiceArea.objects
+             .filter(coverage__covers=origin, handyman__is_approved=True, handyman__skills__id=category_id)
+             .select_related('handyman__user')
+             .annotate(distance=Distance(Centroid('coverage'), origin))
+             .order_by('distance')[:limit])
+    return [
+        {"id": a.handyman.id, "user_id": a.handyman.user_id, "full_name": a.handyman.user.get_full_name(),
+         "rating": a.handyman.rating, "completed_jobs": a.handyman.completed_jobs, "distance_m": a.distance.m}
+        for a in areas
+    ]
+
+
+def match_artisans(lat: float, lng: float, category_id: int, radius_km=15, limit=10, start=None, end=None,
+                   client_id=None, budget=None):
+    """
+    Artisans les mieux classés autour du point.
+    Retourne une liste de dicts: id, user_id, full_name, rating, completed_jobs, distance_m (+ score).
+    Si [start, end[ est fourni (mission planifiée), les candidats sont les artisans
+    dont la zone d'intervention couvre le point (sans exiger de position GPS en
+    direct) et seuls ceux libres sur ce créneau sont retenus (index de disponibilité).
+    Le classement pondéré (handy.services.ranking) porte sur un lot de candidats
+    pris par distance ; désactivé, l'ordre reste distance, note, missions.
+    """
+    ranking = getattr(settings, "MATCH_RANKING_ENABLED", True)
+    pool = limit
+    if ranking:
+        pool = max(pool, getattr(settings, "MATCH_RANKING_POOL", 50))
+    if start and end:
+        pool *= getattr(settings, "AVAILABILITY_MATCH_OVERFETCH", 5)
+        candidates = covering_artisans(lat, lng, category_id, pool)
+        free = availability_index.free_between([c["user_id"] for c in candidates], start, end)
+        candidates = [c for c in candidates if c["user_id"] in free]
+    else:
+        candidates = _nearest(lat, lng, category_id, radius_km, pool)
+    if ranking:
+        return rank_candidates(candidates, category_id, radius_km, limit, client_id=client_id, budget=budget)
+    return candidates[:limit]
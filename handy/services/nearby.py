@@ -0,0 +1,89 @@
+# services/nearby.py
+"""
+Cache des pages de /services/nearby/ (trafic anonyme de navigation).
+
+- l'origine est ramenée au centre de sa cellule geohash (`NEARBY_GEOHASH_PRECISION`,
+  6 ~ 1,2 x 0,6 km) : tous les visiteurs d'un même quartier partagent la page ;
+- clé = (cellule, catégorie, rayon, page, taille) + empreinte des versions des
+  cellules "grossières" (`NEARBY_VERSION_PRECISION`, 5 ~ 4,9 km) couvrant le
+  cercle de recherche ;
+- un Service ou un HandymanProfile qui change incrémente la version de sa cellule
+  grossière (ancienne et nouvelle position) : seules les pages qui la couvrent
+  sont invalidées, les autres restent chaudes jusqu'à leur TTL court.
+"""
+import hashlib
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+
+from handy.services import acache
+from handy.services.geo import geohash_cell_size, geohash_center, geohash_encode
+from handy.services.versioning import aget_versions, bump_version, get_versions
+
+M_PER_DEG_LAT = 111320.0
+
+
+def _precision():
+    return getattr(settings, "NEARBY_GEOHASH_PRECISION", 6)
+
+
+def _coarse_precision():
+    return getattr(settings, "NEARBY_VERSION_PRECISION", 5)
+
+
+def snap(lat: float, lng: float):
+    """(cellule, lat, lng) du centre de la cellule geohash contenant l'origine."""
+    c_lat, c_lng = geohash_center(lat, lng, _precision())
+    return geohash_encode(c_lat, c_lng, _precision()), c_lat, c_lng
+
+
+def coarse_cells(lat: float, lng: float, radius_km: float):
+    """Cellules grossières recouvrant la boîte englobante du cercle de recherche."""
+    precision = _coarse_precision()
+    dlat, dlng = geohash_cell_size(precision)
+    r_lat = radius_km * 1000 / M_PER_DEG_LAT
+    r_lng = radius_km * 1000 / (M_PER_DEG_LAT * max(0.01, math.cos(math.radians(lat))))
+    cells = set()
+    i0, i1 = math.floor((lat - r_lat + 90) / dlat), math.floor((lat + r_lat + 90) / dlat)
+    j0, j1 = math.floor((lng - r_lng + 180) / dlng), math.floor((lng + r_lng + 180) / dlng)
+    for i in range(i0, i1 + 1):
+        for j in range(j0, j1 + 1):
+            c_lat = min(max((i + 0.5) * dlat - 90, -90.0), 90.0)
+            c_lng = ((j + 0.5) * dlng) % 360 - 180
+            cells.add(geohash_encode(c_lat, c_lng, precision))
+    return sorted(cells)
+
+
+def _key(versions, cell, category_id, radius_km, page, page_size) -> str:
+    digest = hashlib.md5(repr(sorted(versions.items())).encode()).hexdigest()[:12]
+    return f"nearby:{cell}:{category_id or '-'}:{radius_km:g}:{page}:{page_size}:{digest}"
+
+
+def cache_key(cell, lat, lng, category_id, radius_km, page, page_size) -> str:
+    versions = get_versions(f"nearby:{c}" for c in coarse_cells(lat, lng, radius_km))
+    return _key(versions, cell, category_id, radius_km, page, page_size)
+
+
+async def acache_key(cell, lat, lng, category_id, radius_km, page, page_size) -> str:
+    versions = await aget_versions(f"nearby:{c}" for c in coarse_cells(lat, lng, radius_km))
+    return _key(versions, cell, category_id, radius_km, page, page_size)
+
+
+def get_page(key):
+    return cache.get(key)
+
+
+async def aget_page(key):
+    return await acache.aget(key)
+
+
+def set_page(key, data):
+    cache.set(key, data, getattr(settings, "NEARBY_CACHE_TTL", 60))
+
+
+def invalidate_point(point):
+    """Invalide les pages dont le cercle couvre `point` (Point GEOS ou None)."""
+    if point is None:
+        return
+    bump_version(f"nearby:{geohash_encode(point.y, point.x, _coarse_precision())}")
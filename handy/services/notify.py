@@ -0,0 +1,66 @@
+# services/notify.py
+"""
+Diffusion de notifications à une liste de destinataires :
+- lignes Notification insérées par `bulk_create` (par lots), compteurs de
+  non-lus mis à jour par lot (bulk_create ne déclenche pas post_save) ;
+- jetons Device regroupés en lots multicast (500 pour FCM), chaque lot étant
+  envoyé par une tâche `send_push_batch` (cf. handy.tasks) ;
+- jetons morts supprimés, jetons en échec temporaire réessayés avec backoff.
+"""
+import random
+from typing import Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+
+from handy.models import Device, Notification
+from handy.services import unread
+from handy.services.push import FCM_MAX_TOKENS
+
+
+def create_notifications(user_ids: Iterable[int], notification_type: str, message: str, content_object=None,
+                         batch_size: int = 1000) -> int:
+    content_type, object_id = None, None
+    if content_object is not None:
+        content_type, object_id = ContentType.objects.get_for_model(content_object), content_object.pk
+    user_ids = list(dict.fromkeys(user_ids))  # dédoublonnage, ordre conservé
+    for i in range(0, len(user_ids), batch_size):
+        rows = Notification.objects.bulk_create([
+            Notification(user_id=uid, notification_type=notification_type, message=message,
+                         content_type=content_type, object_id=object_id)
+            for uid in user_ids[i:i + batch_size]
+        ])
+        unread.notifications_created(rows)
+    return len(user_ids)
+
+
+def token_batches(user_ids: Iterable[int], size: int = FCM_MAX_TOKENS) -> Iterator[List[str]]:
+    """Jetons des appareils des destinataires, par lots multicast."""
+    user_ids = list(set(user_ids))
+    batch = []
+    for i in range(0, len(user_ids), 5000):
+        for token in (Device.objects.filter(user_id__in=user_ids[i:i + 5000])
+                      .order_by('id').values_list('device_token', flat=True).iterator()):
+            batch.append(token)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def prune_tokens(tokens: Iterable[str]) -> int:
+    tokens = list(tokens)
+    if not tokens:
+        return 0
+    deleted, _ = Device.objects.filter(device_token__in=tokens).delete()
+    return deleted
+
+
+def retry_delay(attempt: int) -> Optional[float]:
+    """Backoff exponentiel avec gigue ; None quand les tentatives sont épuisées."""
+    if attempt >= getattr(settings, "PUSH_RETRY_MAX", 4):
+        return None
+    base = getattr(settings, "PUSH_RETRY_BASE_S", 5)
+    delay = min(base * (2 ** attempt), getattr(settings, "PUSH_RETRY_MAX_DELAY_S", 300))
+    return delay * random.uniform(0.8, 1.2)
@@ -1,25 +1,241 @@
 # services/pricing.py
+"""
+Moteur de prix des devis : tout est en mémoire, un devis ne fait aucune requête.
+
+prix = base(catégorie) x durée (h, 30 min minimum) x majoration horaire
+       x majoration de zone x facteur distance, arrondi au franc, plancher `MIN_PRICE`.
+
+- base : ServiceCategory.base_price_xof, héritée du parent, sinon `DEFAULT_BASE` ;
+  table rechargée quand la version partagée "pricing_bases" change ;
+- majoration horaire : courbe de 24 coefficients (PRICING_HOURLY_SURGE, surchargeable
+  par slug de catégorie) ;
+- majoration de zone : calculée chaque minute (tâche refresh_zone_surge) par cellule
+  geohash à partir des réservations récentes (demande) et des artisans en ligne
+  (offre), publiée dans le cache, relue au plus toutes les `PRICING_ZONE_REFRESH_S` ;
+- distance artisan -> client : gratuite jusqu'à `PRICING_FREE_KM`, puis +x % par km,
+  plafonnée ;
+- `quote_many` : lot de devis (sans artisan) calculé en un passage NumPy sur les
+  mêmes tables ; les valeurs trop proches d'un demi-franc sont recalculées en
+  Decimal pour un arrondi identique au devis unitaire.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
 from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from django.conf import settings
+from django.contrib.gis.db.models.functions import GeoHash
+from django.core.cache import cache
+from django.db.models import Count
 from django.utils import timezone
-from django.contrib.gis.db.models.functions import Distance
-from django.contrib.gis.geos import Point
-
-BASES = {
-  'menage': Decimal('2500'),
-  'plomberie': Decimal('3000'),
-  'electricite': Decimal('3500'),
-}
-
-def estimate_price(category_slug: str, minutes: int, artisan_loc, client_lat, client_lng):
-    base = BASES.get(category_slug, Decimal('3000'))
-    duration = Decimal(max(30, minutes)) / Decimal(60)  # min 30min
-    surge = Decimal('1.20') if 18 <= timezone.localtime().hour <= 22 else Decimal('1.00')
-
-    # distance (km)
-    if artisan_loc:
-        dist_m = Distance('location', Point(client_lng, client_lat, srid=4326))
-        # si tu veux un calcul coté DB, passe par annotate avant; sinon calcule côté app si tu as 2 points
-    distance_factor = Decimal('1.00')  # brancher calc réel si besoin
-
-    total = (base * duration * surge * distance_factor).quantize(Decimal('1.'))
-    return max(total, Decimal('1000'))  # floor
\ No newline at end of file
+
+from handy.services.geo import geohash_encode, haversine_m
+from handy.services.versioning import VersionGate, get_version
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAME = "pricing_bases"
+ZONES_KEY = "pricing:zones"
+DEFAULT_BASE = Decimal('3000')
+MIN_PRICE = Decimal('1000')
+DEMAND_STATUSES = ("pending", "confirmed", "in_progress")
+EVENING_SURGE = [1.0] * 18 + [1.2] * 5 + [1.0]  # 18h-22h : +20 %
+
+
+def _dec(value) -> Decimal:
+    return Decimal(str(value))
+
+
+def _curve(values) -> List[Decimal]:
+    values = list(values or [])
+    if len(values) != 24:
+        values = EVENING_SURGE
+    return [_dec(v) for v in values]
+
+
+class PricingEngine:
+    def __init__(self, ttl: int = 3600, check_every: float = 2.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._bases: Dict[str, Decimal] = {}
+        self._loaded_at = None
+        self._zones: Dict[str, Decimal] = {}
+        self._zones_at = None
+        self.gate = VersionGate(VERSION_NAME, check_every=check_every)
+        self._curves: Dict[Optional[str], List[Decimal]] = {}
+
+    # ---- paramètres (settings) ----
+    def curve(self, category_slug=None) -> List[Decimal]:
+        if not self._curves:
+            curves = {None: _curve(getattr(settings, "PRICING_HOURLY_SURGE", EVENING_SURGE))}
+            for slug, values in getattr(settings, "PRICING_HOURLY_SURGE_BY_CATEGORY", {}).items():
+                curves[slug] = _curve(values)
+            self._curves = curves
+        return self._curves.get(category_slug, self._curves[None])
+
+    # ---- prix de base ----
+    def reload(self):
+        from handy.models import ServiceCategory
+
+        version = get_version(VERSION_NAME)
+        rows = {pk: (slug, parent_id, base) for pk, slug, parent_id, base in
+                ServiceCategory.objects.values_list('id', 'slug', 'parent_id', 'base_price_xof')}
+        bases = {}
+        for pk, (slug, _, _) in rows.items():
+            seen, node = set(), pk
+            while node in rows and rows[node][2] is None and node not in seen:
+                seen.add(node)
+                node = rows[node][1]
+            bases[slug] = Decimal(rows[node][2]) if node in rows and rows[node][2] is not None else DEFAULT_BASE
+        self._bases = bases
+        self._loaded_at = time.monotonic()
+        self.gate.mark_loaded(version)
+
+    def _is_fresh(self) -> bool:
+        return (self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+                and self.gate.is_current())
+
+    def _ensure_loaded(self):
+        try:
+            if self._is_fresh():
+                return
+        except Exception:
+            # cache partagé indisponible : on garde la table courante
+            if self._loaded_at is not None:
+                return
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    self.reload()
+            return
+        # table périmée : un seul thread recharge, les autres utilisent l'ancienne
+        if self._lock.acquire(blocking=False):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Échec de rechargement des prix de base")
+            finally:
+                self._lock.release()
+
+    def base(self, category_slug) -> Decimal:
+        self._ensure_loaded()
+        return self._bases.get(category_slug, DEFAULT_BASE)
+
+    def invalidate(self):
+        self._loaded_at = None
+        self.gate.bump()
+
+    # ---- majoration de zone ----
+    def zones(self) -> Dict[str, Decimal]:
+        """Table {cellule geohash: coefficient} ; seules les cellules majorées y figurent."""
+        refresh_s = getattr(settings, "PRICING_ZONE_REFRESH_S", 30)
+        if self._zones_at is None or time.monotonic() - self._zones_at >= refresh_s:
+            try:
+                raw = cache.get(ZONES_KEY) or {}
+                self._zones = {cell: _dec(v) for cell, v in raw.items()}
+            except Exception:
+                logger.warning("Majorations de zone illisibles, table précédente conservée.")
+            self._zones_at = time.monotonic()
+        return self._zones
+
+    def zone_surge(self, lat, lng) -> Decimal:
+        if lat is None or lng is None:
+            return Decimal('1')
+        cell = geohash_encode(lat, lng, getattr(settings, "PRICING_ZONE_PRECISION", 5))
+        return self.zones().get(cell, Decimal('1'))
+
+    # ---- devis ----
+    @staticmethod
+    def distance_factor(artisan_loc, client_lat, client_lng) -> Decimal:
+        if artisan_loc is None or client_lat is None or client_lng is None:
+            return Decimal('1')
+        km = haversine_m(artisan_loc.y, artisan_loc.x, client_lat, client_lng) / 1000
+        extra = max(0.0, km - getattr(settings, "PRICING_FREE_KM", 3))
+        factor = min(1 + extra * getattr(settings, "PRICING_PER_KM", 0.02),
+                     getattr(settings, "PRICING_DISTANCE_MAX_FACTOR", 1.5))
+        return _dec(round(factor, 4))
+
+    def quote(self, category_slug: str, minutes: int, artisan_loc=None, client_lat=None, client_lng=None,
+              at=None) -> Decimal:
+        base = self.base(category_slug)
+        duration = Decimal(max(30, minutes)) / Decimal(60)  # min 30min
+        surge = self.curve(category_slug)[timezone.localtime(at).hour]
+        zone = self.zone_surge(client_lat, client_lng)
+        distance = self.distance_factor(artisan_loc, client_lat, client_lng)
+        total = (base * duration * surge * zone * distance).quantize(Decimal('1.'))
+        return max(total, MIN_PRICE)
+
+    def quote_many(self, items: Iterable[dict], at=None) -> List[Decimal]:
+        """
+        Devis d'un lot de {"category_slug", "minutes", "lat"?, "lng"?}, dans l'ordre.
+        Même formule que `quote` (sans facteur distance : pas d'artisan désigné).
+        """
+        items = list(items)
+        if not items:
+            return []
+        self._ensure_loaded()
+        hour = timezone.localtime(at).hour
+        zones = self.zones()
+        precision = getattr(settings, "PRICING_ZONE_PRECISION", 5)
+
+        n = len(items)
+        base, minutes, surge, zone = (np.empty(n) for _ in range(4))
+        for i, item in enumerate(items):
+            slug = item["category_slug"]
+            base[i] = self._bases.get(slug, DEFAULT_BASE)
+            minutes[i] = max(30, item["minutes"])
+            surge[i] = self.curve(slug)[hour]
+            lat, lng = item.get("lat"), item.get("lng")
+            zone[i] = zones.get(geohash_encode(lat, lng, precision), 1) if lat is not None and lng is not None else 1
+
+        raw = base * (minutes / 60) * surge * zone
+        totals = np.maximum(np.rint(raw), float(MIN_PRICE))
+        ties = np.abs(raw - np.floor(raw) - 0.5) < 1e-6  # demi-franc : arrondi Decimal (demi-pair)
+        return [self.quote(item["category_slug"], item["minutes"], client_lat=item.get("lat"),
+                           client_lng=item.get("lng"), at=at) if tie else Decimal(int(total))
+                for item, total, tie in zip(items, totals, ties)]
+
+
+pricing_engine = PricingEngine(ttl=getattr(settings, "PRICING_BASES_TTL", 3600))
+
+
+def estimate_price(category_slug: str, minutes: int, artisan_loc=None, client_lat=None, client_lng=None):
+    return pricing_engine.quote(category_slug, minutes, artisan_loc, client_lat, client_lng)
+
+
+def compute_zone_surge(now=None) -> Dict[str, float]:
+    """
+    Demande (réservations des `PRICING_SURGE_WINDOW_MIN` dernières minutes) rapportée
+    à l'offre (artisans approuvés en ligne) par cellule ; publie la table dans le cache.
+    """
+    from handy.models import Booking, HandymanProfile
+
+    now = now or timezone.now()
+    precision = getattr(settings, "PRICING_ZONE_PRECISION", 5)
+    since = now - timedelta(minutes=getattr(settings, "PRICING_SURGE_WINDOW_MIN", 30))
+    demand = dict(Booking.objects.filter(
+        created_at__gte=since, status__in=DEMAND_STATUSES, job_location__isnull=False
+    ).annotate(cell=GeoHash('job_location', precision=precision)).values('cell')
+        .annotate(n=Count('id')).values_list('cell', 'n'))
+    supply = dict(HandymanProfile.objects.filter(
+        online=True, is_approved=True, location__isnull=False
+    ).annotate(cell=GeoHash('location', precision=precision)).filter(cell__in=list(demand)).values('cell')
+        .annotate(n=Count('id')).values_list('cell', 'n')) if demand else {}
+
+    threshold = getattr(settings, "PRICING_ZONE_SURGE_THRESHOLD", 1.0)
+    slope = getattr(settings, "PRICING_ZONE_SURGE_SLOPE", 0.25)
+    cap = getattr(settings, "PRICING_ZONE_SURGE_MAX", 1.5)
+    min_demand = getattr(settings, "PRICING_ZONE_MIN_DEMAND", 3)
+    zones = {}
+    for cell, n in demand.items():
+        if n < min_demand:
+            continue
+        ratio = n / max(supply.get(cell, 0), 1)
+        if ratio > threshold:
+            zones[cell] = round(min(1 + slope * (ratio - threshold), cap), 2)
+    cache.set(ZONES_KEY, zones, timeout=getattr(settings, "PRICING_ZONE_TTL", 300))
+    return zones
@@ -0,0 +1,114 @@
+# services/push.py
+"""
+Envoi push multicast (FCM) par lots de jetons Device.device_token.
+
+- au plus `FCM_MAX_TOKENS` (500, limite du multicast FCM) jetons par appel ;
+- chaque jeton obtient un verdict : ok, à réessayer (indisponibilité, quota),
+  mort (désinscrit, inconnu de FCM, autre projet) ou échec ; seuls les jetons
+  morts sont supprimés ; un lot entier en échec sur un même code (identifiants
+  sans droits, message refusé…) est une erreur de configuration : rien n'est supprimé ;
+- firebase-admin est optionnel : sans lui (ou sans identifiants), les envois
+  sont ignorés avec un avertissement.
+"""
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FCM_MAX_TOKENS = 500
+DEAD_CODES = {"NOT_FOUND", "UNREGISTERED", "SENDER_ID_MISMATCH"}
+TOKEN_CODES = {"NOT_FOUND", "UNREGISTERED"}  # propres au jeton, même si tout le lot les reçoit
+RETRY_CODES = {"UNAVAILABLE", "INTERNAL", "RESOURCE_EXHAUSTED", "QUOTA_EXCEEDED", "DEADLINE_EXCEEDED", "UNKNOWN"}
+
+_app = None
+_app_lock = threading.Lock()
+
+
+@dataclass
+class PushResult:
+    sent: int = 0
+    retry: List[str] = field(default_factory=list)
+    dead: List[str] = field(default_factory=list)
+    failed: int = 0  # erreurs définitives non liées au jeton
+
+
+def chunks(tokens: Sequence[str], size: int = FCM_MAX_TOKENS):
+    size = min(size, FCM_MAX_TOKENS)
+    for i in range(0, len(tokens), size):
+        yield list(tokens[i:i + size])
+
+
+def _firebase_app():
+    global _app
+    if _app is not None:
+        return _app
+    with _app_lock:
+        if _app is None:
+            try:
+                import firebase_admin
+                from firebase_admin import credentials
+            except ImportError:
+                return None
+            path = getattr(settings, "FCM_CREDENTIALS_FILE", "")
+            if not path:
+                return None
+            _app = firebase_admin.initialize_app(credentials.Certificate(path), name="handy-push")
+    return _app
+
+
+def _fcm_send(tokens: List[str], title: str, body: str, data: Dict[str, str]) -> Optional[List[Optional[str]]]:
+    """Un appel multicast ; retourne un code d'erreur par jeton (None = envoyé), ou None si FCM est indisponible."""
+    app = _firebase_app()
+    if app is None:
+        return None
+    from firebase_admin import exceptions, messaging
+
+    message = messaging.MulticastMessage(
+        tokens=tokens,
+        notification=messaging.Notification(title=title, body=body),
+        data=data,
+    )
+    try:
+        response = messaging.send_each_for_multicast(message, app=app)
+    except exceptions.FirebaseError as exc:
+        # échec global du lot (réseau, auth) : tous les jetons sont à réessayer
+        logger.warning("FCM: échec du lot de %s jetons (%s)", len(tokens), exc.code)
+        return ["UNAVAILABLE"] * len(tokens)
+    codes = []
+    for r in response.responses:
+        if r.success:
+            codes.append(None)
+        elif isinstance(r.exception, messaging.UnregisteredError):
+            codes.append("UNREGISTERED")
+        elif isinstance(r.exception, messaging.SenderIdMismatchError):
+            codes.append("SENDER_ID_MISMATCH")  # code PERMISSION_DENIED : distingué par le type
+        else:
+            codes.append(getattr(r.exception, "code", None) or "UNKNOWN")
+    return codes
+
+
+def send_multicast(tokens: Sequence[str], title: str, body: str, data: Optional[dict] = None) -> PushResult:
+    """Envoie à une liste de jetons (découpée en lots FCM) et classe les échecs par jeton."""
+    result = PushResult()
+    payload = {str(k): str(v) for k, v in (data or {}).items()}  # FCM : valeurs texte uniquement
+    for batch in chunks(list(tokens)):
+        codes = _fcm_send(batch, title, body, payload)
+        if codes is None:
+            logger.warning("FCM non configuré : %s notifications push ignorées.", len(batch))
+            result.failed += len(batch)
+            continue
+        uniform = set(codes)
+        if len(batch) > 1 and len(uniform) == 1 and not uniform & (TOKEN_CODES | RETRY_CODES | {None}):
+            # tout le lot refusé pour la même raison : c'est le message ou les identifiants, pas les jetons
+            logger.error("FCM: tout le lot refusé (%s), aucun jeton supprimé.", codes[0])
+            result.failed += len(batch)
+            continue
+        result.dead += [t for t, code in zip(batch, codes) if code in DEAD_CODES]
+        result.retry += [t for t, code in zip(batch, codes) if code in RETRY_CODES]
+        result.sent += sum(1 for code in codes if code is None)
+        result.failed += sum(1 for code in codes if code and code not in DEAD_CODES and code not in RETRY_CODES)
+    return result
@@ -0,0 +1,127 @@
+# services/querybudget.py
+"""
+Budget de requêtes SQL par endpoint (nom d'URL).
+
+- un wrapper d'exécution posé sur chaque connexion (signal connection_created)
+  compte les requêtes et le temps DB de la requête HTTP en cours, portée par une
+  ContextVar : les appels ORM faits via `sync_to_async` (vues async) sont comptés ;
+- QueryBudgetMiddleware agrège par nom d'URL (nombre d'appels, requêtes, temps DB,
+  dépassements) et signale tout dépassement de QUERY_BUDGETS / QUERY_BUDGET_DEFAULT ;
+- QUERY_BUDGET_STRICT=True (tests) : un dépassement lève QueryBudgetExceeded.
+"""
+import contextvars
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar[Optional["Usage"]] = contextvars.ContextVar("query_budget_usage", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class Usage:
+    queries: int = 0
+    db_ms: float = 0.0
+
+
+@dataclass
+class Budget:
+    queries: Optional[int] = None
+    db_ms: Optional[float] = None
+
+
+def _record(execute, sql, params, many, context):
+    usage = _current.get()
+    if usage is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        usage.queries += 1
+        usage.db_ms += (time.perf_counter() - start) * 1000
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    if _record not in connection.execute_wrappers:
+        # en tête : `execute_wrapper()` retire ses propres wrappers par pop() en fin de liste
+        connection.execute_wrappers.insert(0, _record)
+
+
+def start() -> contextvars.Token:
+    for connection in connections.all(initialized_only=True):  # ouvertes avant le chargement du module
+        install_query_counter(None, connection)
+    return _current.set(Usage())
+
+
+def stop(token: contextvars.Token) -> Usage:
+    usage = _current.get() or Usage()
+    _current.reset(token)
+    return usage
+
+
+def budget_for(url_name: str) -> Budget:
+    custom = getattr(settings, "QUERY_BUDGETS", {}).get(url_name)
+    if isinstance(custom, dict):
+        return Budget(custom.get("queries"), custom.get("db_ms"))
+    if custom is not None:
+        return Budget(int(custom), getattr(settings, "QUERY_BUDGET_DB_MS", None))
+    return Budget(getattr(settings, "QUERY_BUDGET_DEFAULT", None), getattr(settings, "QUERY_BUDGET_DB_MS", None))
+
+
+class QueryStats:
+    """Agrégats par nom d'URL (par process)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def add(self, url_name: str, usage: Usage, exceeded: bool):
+        with self._lock:
+            s = self._stats.setdefault(url_name, {"calls": 0, "queries": 0, "db_ms": 0.0,
+                                                  "max_queries": 0, "over_budget": 0})
+            s["calls"] += 1
+            s["queries"] += usage.queries
+            s["db_ms"] += usage.db_ms
+            s["max_queries"] = max(s["max_queries"], usage.queries)
+            s["over_budget"] += int(exceeded)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(s) for name, s in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+query_stats = QueryStats()
+
+
+def check(url_name: str, usage: Usage):
+    """Enregistre l'usage ; signale (ou lève, en mode strict) un dépassement de budget."""
+    budget = budget_for(url_name)
+    over = []
+    if budget.queries is not None and usage.queries > budget.queries:
+        over.append(f"{usage.queries} requêtes > {budget.queries}")
+    if budget.db_ms is not None and usage.db_ms > budget.db_ms:
+        over.append(f"{usage.db_ms:.0f} ms DB > {budget.db_ms:.0f}")
+    query_stats.add(url_name, usage, bool(over))
+    if over:
+        message = f"Budget SQL dépassé pour « {url_name} » : " + ", ".join(over)
+        if getattr(settings, "QUERY_BUDGET_STRICT", False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,142 @@
+# services/ranking.py
+"""
+Classement des candidats du matching : les caractéristiques sont chargées une
+fois, en colonnes NumPy (2 requêtes + 1 pour les favoris), puis le score pondéré
+est calculé en vectoriel sur tous les candidats ; top-k via `argpartition`.
+
+Caractéristiques, toutes ramenées dans [0, 1] :
+- distance : 1 - d / rayon ;
+- rating : note lissée (bayes_score) / 5 ;
+- price_fit : proximité du prix (service le moins cher de la catégorie) au budget
+  demandé, sinon à la médiane des candidats ;
+- acceptance : missions acceptées / missions tranchées (a priori de Laplace) ;
+- recency : décroissance exponentielle depuis la dernière connexion ;
+- experience : log(1 + missions) normalisé ;
+- favorite : 1 si l'artisan est dans les favoris du client.
+
+Poids : DEFAULT_WEIGHTS <- settings.MATCH_RANKING_WEIGHTS <- ServiceCategory.ranking_weights.
+"""
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.utils import timezone
+
+FEATURES = ("distance", "rating", "price_fit", "acceptance", "recency", "experience", "favorite")
+DEFAULT_WEIGHTS = {
+    "distance": 0.35, "rating": 0.25, "price_fit": 0.10, "acceptance": 0.10,
+    "recency": 0.08, "experience": 0.07, "favorite": 0.05,
+}
+ACCEPTED_STATUSES = ("confirmed", "in_progress", "completed")
+WEIGHTS_KEY = "rank:w:{}"
+
+
+def category_weights(category_id) -> np.ndarray:
+    """Vecteur de poids (ordre FEATURES) de la catégorie, mis en cache."""
+    key = WEIGHTS_KEY.format(category_id)
+    weights = cache.get(key)
+    if weights is None:
+        from handy.models import ServiceCategory
+
+        weights = {**DEFAULT_WEIGHTS, **getattr(settings, "MATCH_RANKING_WEIGHTS", {})}
+        custom = ServiceCategory.objects.filter(pk=category_id).values_list('ranking_weights', flat=True).first()
+        if isinstance(custom, dict):
+            weights.update({k: float(v) for k, v in custom.items() if k in DEFAULT_WEIGHTS})
+        cache.set(key, weights, getattr(settings, "MATCH_RANKING_WEIGHTS_TTL", 3600))
+    return np.array([weights.get(f, 0.0) for f in FEATURES], dtype=np.float64)
+
+
+def invalidate_category_weights(category_id):
+    cache.delete(WEIGHTS_KEY.format(category_id))
+
+
+def load_features(user_ids: List[int], category_id, client_id=None) -> Dict[str, np.ndarray]:
+    """Colonnes brutes, alignées sur `user_ids` (valeurs absentes : NaN / 0)."""
+    from handy.models import Booking, FavoriteHandyman, HandymanProfile, Service
+
+    n = len(user_ids)
+    pos = {uid: i for i, uid in enumerate(user_ids)}
+    cols = {
+        "bayes": np.zeros(n), "jobs": np.zeros(n), "price": np.full(n, np.nan),
+        "idle_days": np.full(n, np.inf), "accepted": np.zeros(n), "decided": np.zeros(n),
+        "favorite": np.zeros(n),
+    }
+    now = timezone.now()
+
+    cheapest = (Service.objects
+                .filter(handyman_id=OuterRef('user_id'), category_id=category_id, is_active=True, price__gt=0)
+                .order_by('price').values('price')[:1])
+    for uid, bayes, jobs, last_login, price in (
+            HandymanProfile.objects.filter(user_id__in=user_ids)
+            .annotate(cheapest=Subquery(cheapest))
+            .values_list('user_id', 'bayes_score', 'completed_jobs', 'user__last_login', 'cheapest')):
+        i = pos[uid]
+        cols["bayes"][i], cols["jobs"][i] = bayes or 0.0, jobs or 0
+        if price is not None:
+            cols["price"][i] = float(price)
+        if last_login:
+            cols["idle_days"][i] = (now - last_login).total_seconds() / 86400
+
+    since = now - timedelta(days=getattr(settings, "MATCH_ACCEPTANCE_WINDOW_DAYS", 180))
+    for uid, accepted, decided in (
+            Booking.objects.filter(handyman_id__in=user_ids, created_at__gte=since)
+            .values('handyman_id')
+            .annotate(accepted=Count('id', filter=Q(status__in=ACCEPTED_STATUSES)),
+                      decided=Count('id', filter=~Q(status='pending')))
+            .values_list('handyman_id', 'accepted', 'decided')):
+        cols["accepted"][pos[uid]], cols["decided"][pos[uid]] = accepted, decided
+
+    if client_id:
+        for uid in FavoriteHandyman.objects.filter(client_id=client_id, handyman_id__in=user_ids) \
+                .values_list('handyman_id', flat=True):
+            cols["favorite"][pos[uid]] = 1.0
+    return cols
+
+
+def feature_matrix(distance_m: np.ndarray, cols, radius_m: float, budget: Optional[float] = None) -> np.ndarray:
+    """Matrice (n, len(FEATURES)) des caractéristiques normalisées."""
+    price = cols["price"]
+    known = ~np.isnan(price)
+    ref = float(budget) if budget else (float(np.median(price[known])) if known.any() else 0.0)
+    price_fit = np.full(price.shape, 0.5)  # prix inconnu (sur devis) : neutre
+    if ref > 0:
+        price_fit[known] = np.clip(1.0 - np.abs(price[known] - ref) / ref, 0.0, 1.0)
+
+    max_jobs = np.log1p(cols["jobs"].max()) if cols["jobs"].size else 0.0
+    tau = getattr(settings, "MATCH_RECENCY_TAU_DAYS", 7)
+    return np.column_stack([
+        np.clip(1.0 - distance_m / radius_m, 0.0, 1.0),
+        np.clip(cols["bayes"] / 5.0, 0.0, 1.0),
+        price_fit,
+        (cols["accepted"] + 1.0) / (cols["decided"] + 2.0),
+        np.exp(-cols["idle_days"] / tau),
+        np.log1p(cols["jobs"]) / max_jobs if max_jobs > 0 else np.zeros_like(cols["jobs"]),
+        cols["favorite"],
+    ])
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices des k meilleurs scores, triés : O(n) + O(k log k)."""
+    if k >= scores.size:
+        return np.argsort(-scores, kind="stable")
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def rank_candidates(candidates: List[dict], category_id, radius_km, limit, client_id=None,
+                    budget=None) -> List[dict]:
+    """Trie les dicts de `match_artisans` par score pondéré ; ajoute la clé `score`."""
+    if not candidates:
+        return []
+    user_ids = [c["user_id"] for c in candidates]
+    cols = load_features(user_ids, category_id, client_id)
+    distance = np.fromiter((c["distance_m"] for c in candidates), dtype=np.float64, count=len(candidates))
+    scores = feature_matrix(distance, cols, radius_km * 1000, budget) @ category_weights(category_id)
+
+    ranked = []
+    for i in top_k(scores, limit):
+        ranked.append({**candidates[i], "score": round(float(scores[i]), 4)})
+    return ranked
@@ -0,0 +1,103 @@
+# services/rollups.py
+"""
+Agrégats quotidiens par client (ClientDailyStats).
+
+Chaque écriture sur Payment / Booking / Quotation / Review recalcule uniquement
+la case (client, jour) touchée, à partir des tables sources (quelques agrégats
+indexés). La lecture du tableau de bord employeur est un seul parcours de
+l'index (client, day) ; les séries 7/30/90 jours sortent des mêmes lignes.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from handy.models import Booking, ClientDailyStats, Payment, Review
+
+SERIES_DAYS = (7, 30, 90)
+
+
+def local_day(dt):
+    return timezone.localdate(dt) if dt else None
+
+
+def refresh_client_day(client_id, day):
+    """Recalcule la case (client, jour) depuis les tables sources."""
+    if not client_id or day is None:
+        return
+    spend = Payment.objects.filter(
+        booking__client_id=client_id, payment_date__date=day
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    bookings = Booking.objects.filter(client_id=client_id, created_at__date=day).aggregate(
+        total=Count('id', distinct=True),
+        pending=Count('id', filter=Q(status='pending'), distinct=True),
+        responded=Count('id', filter=Q(quotations__isnull=False), distinct=True),
+    )
+    reviews = Review.objects.filter(booking__client_id=client_id, created_at__date=day).aggregate(
+        count=Count('id'), rating_sum=Sum('rating'),
+    )
+    values = {
+        'spend': spend,
+        'bookings': bookings['total'],
+        'bookings_pending': bookings['pending'],
+        'bookings_responded': bookings['responded'],
+        'reviews': reviews['count'],
+        'rating_sum': reviews['rating_sum'] or 0,
+    }
+    if not spend and not bookings['total'] and not reviews['count']:
+        ClientDailyStats.objects.filter(client_id=client_id, day=day).delete()
+        return
+    ClientDailyStats.objects.update_or_create(client_id=client_id, day=day, defaults=values)
+
+
+# ---- points d'entrée des signaux ----
+def refresh_for_booking(booking_id=None, client_id=None, created_at=None):
+    if client_id is None:
+        row = Booking.objects.filter(pk=booking_id).values_list('client_id', 'created_at').first()
+        if not row:
+            return
+        client_id, created_at = row
+    refresh_client_day(client_id, local_day(created_at))
+
+
+def refresh_for_payment(payment: Payment, old_day=None):
+    client_id = Booking.objects.filter(pk=payment.booking_id).values_list('client_id', flat=True).first()
+    day = local_day(payment.payment_date)
+    refresh_client_day(client_id, day)
+    if old_day and old_day != day:
+        refresh_client_day(client_id, old_day)
+
+
+def refresh_for_review(review: Review):
+    client_id = Booking.objects.filter(pk=review.booking_id).values_list('client_id', flat=True).first()
+    refresh_client_day(client_id, local_day(review.created_at))
+
+
+# ---- lecture ----
+def client_dashboard_stats(client_id, days=7, today=None) -> dict:
+    """Totaux + série de dépenses sur `days` jours, en une seule requête."""
+    today = today or timezone.localdate()
+    month_start = today.replace(day=1)
+    first_day = today - timedelta(days=days - 1)
+
+    spending = {}
+    stats = {'monthly_spending': Decimal('0.00'), 'pending_requests': 0, 'total_requests': 0,
+             'responded_requests': 0, 'review_count': 0, 'rating_sum': 0}
+    rows = ClientDailyStats.objects.filter(client_id=client_id).values_list(
+        'day', 'spend', 'bookings', 'bookings_pending', 'bookings_responded', 'reviews', 'rating_sum')
+    for day, spend, bookings, pending, responded, reviews, rating_sum in rows:
+        stats['total_requests'] += bookings
+        stats['pending_requests'] += pending
+        stats['responded_requests'] += responded
+        stats['review_count'] += reviews
+        stats['rating_sum'] += rating_sum
+        if month_start <= day <= today:
+            stats['monthly_spending'] += spend
+        if first_day <= day <= today:
+            spending[day] = spend
+
+    stats['avg_rating'] = stats['rating_sum'] / stats['review_count'] if stats['review_count'] else None
+    # du plus ancien au plus récent
+    stats['daily_spending'] = [float(spending.get(first_day + timedelta(days=i), 0)) for i in range(days)]
+    return stats
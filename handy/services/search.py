@@ -0,0 +1,67 @@
+# services/search.py
+"""
+Recherche plein texte du catalogue (Service).
+
+- `search_vector` : tsvector pondéré (titre A, catégorie + artisan B, description C),
+  index GIN ;
+- `search_document` : titre + catégorie + artisan, index GIN trigrammes, pour
+  tolérer les fautes de frappe.
+
+Les deux colonnes sont recalculées par les signaux Service / ServiceCategory / User.
+`search_services` est utilisé par ServiceSearchView et par l'API (ServiceSearchFilter).
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Q
+
+SEARCH_CONFIG = getattr(settings, "SEARCH_CONFIG", "french")
+TRIGRAM_WEIGHT = getattr(settings, "SEARCH_TRIGRAM_WEIGHT", 0.3)
+
+
+REBUILD_SQL = """
+UPDATE handy_service AS s
+SET search_vector =
+        setweight(to_tsvector(%(config)s, coalesce(s.title, '')), 'A')
+     || setweight(to_tsvector(%(config)s, coalesce(c.name, '') || ' ' || coalesce(u.first_name, '') || ' '
+                                         || coalesce(u.last_name, '')), 'B')
+     || setweight(to_tsvector(%(config)s, coalesce(s.description, '')), 'C'),
+    search_document = concat_ws(' ', s.title, c.name, nullif(trim(concat_ws(' ', u.first_name, u.last_name)), ''))
+FROM handy_servicecategory AS c, handy_user AS u
+WHERE c.id = s.category_id AND u.id = s.handyman_id
+"""
+
+
+def refresh_search_index(queryset):
+    """Recalcule search_vector / search_document des services du queryset, en une seule UPDATE."""
+    ids = list(queryset.values_list('pk', flat=True))
+    if not ids:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_SQL + " AND s.id = ANY(%(ids)s)", {"config": SEARCH_CONFIG, "ids": ids})
+        return cursor.rowcount
+
+
+def rebuild_search_index():
+    """Recalcul complet en une requête (chargements en masse qui contournent les signaux)."""
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_SQL, {"config": SEARCH_CONFIG})
+        return cursor.rowcount
+
+
+def search_services(queryset, query):
+    """
+    Filtre + classe par pertinence : correspondance plein texte OU trigrammes
+    (fautes de frappe), chacune servie par son index GIN.
+    """
+    query = (query or "").strip()
+    if not query:
+        return queryset
+    ts_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    return (
+        queryset
+        .filter(Q(search_vector=ts_query) | Q(search_document__trigram_word_similar=query))
+        .annotate(rank=SearchRank(F('search_vector'), ts_query)
+                  + TrigramWordSimilarity(query, 'search_document') * TRIGRAM_WEIGHT)
+        .order_by('-rank', '-created_at')
+    )
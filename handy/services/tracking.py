@@ -0,0 +1,72 @@
+# services/tracking.py
+"""
+Ingestion des points GPS (JobTracking) : WebSocket TrackingConsumer et
+action REST BookingViewSet.track passent par le même buffer.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from handy.models import JobTracking
+from handy.services.batching import BatchWriter
+from handy.services.eta import eta_engine
+
+
+def _parse_ts(value):
+    """Horodatage client optionnel : ISO 8601 ou epoch en millisecondes."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=dt_timezone.utc)
+    ts = parse_datetime(str(value))
+    if ts and timezone.is_naive(ts):
+        ts = timezone.make_aware(ts)
+    return ts
+
+
+def make_point(booking_id, handyman_id, lat, lng, speed=None, heading=None, ts=None) -> JobTracking:
+    return JobTracking(
+        booking_id=int(booking_id),
+        handyman_id=handyman_id,
+        loc=Point(float(lng), float(lat), srid=4326),
+        speed=float(speed) if speed is not None else None,
+        heading=float(heading) if heading is not None else None,
+        ts=_parse_ts(ts) or timezone.now(),
+    )
+
+
+class TrackingBuffer(BatchWriter):
+    # au-delà, on oublie les dernières positions connues (mémoire bornée)
+    MAX_TRACKED_BOOKINGS = 50000
+
+    def __init__(self, **kwargs):
+        super().__init__(JobTracking, name="tracking", **kwargs)
+        self.stats["late"] = 0
+        self._last_ts = {}
+
+    def add(self, point: JobTracking) -> bool:
+        # point "en retard" : plus ancien que le dernier reçu pour la même mission
+        # (réseau mobile, rejeu hors ligne). Il est conservé pour l'historique.
+        last = self._last_ts.get(point.booking_id)
+        if last is not None and point.ts < last:
+            self.stats["late"] += 1
+        else:
+            if len(self._last_ts) >= self.MAX_TRACKED_BOOKINGS:
+                self._last_ts.clear()
+            self._last_ts[point.booking_id] = point.ts
+        return super().add(point)
+
+    def write(self, objs):
+        super().write(objs)
+        # ETA calculé après insertion, à partir des points du lot (pas de relecture DB)
+        eta_engine.observe_many(objs)
+
+
+tracking_buffer = TrackingBuffer(
+    max_batch=getattr(settings, "TRACKING_BATCH_SIZE", 200),
+    flush_ms=getattr(settings, "TRACKING_FLUSH_MS", 1000),
+    max_pending=getattr(settings, "TRACKING_MAX_PENDING", 20000),
+)
@@ -0,0 +1,173 @@
+# services/unread.py
+"""
+Compteurs de non-lus (badges) maintenus par deltas, lus en O(1).
+
+- clés par utilisateur : "notifications", "messages" (toutes conversations),
+  "conversation:<id>" ;
+- chaque variation est appliquée à la table UnreadCounter (upsert, une requête
+  par lot) puis, après commit, au cache Redis par `incr` (commutatif : l'ordre
+  des commits concurrents n'importe pas). Une clé absente du cache n'est pas
+  incrémentée : elle sera rechargée depuis la table à la prochaine lecture ;
+- un message non lu compte pour chaque participant sauf son expéditeur
+  (Message.is_read est partagé par la conversation).
+"""
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+NOTIFICATIONS = "notifications"
+MESSAGES = "messages"
+CACHE_KEY = "unread:{}:{}"
+
+# hausses : upsert ; baisses : simple UPDATE borné à 0 (ligne absente = compteur déjà à 0)
+INCREMENT_SQL = """
+INSERT INTO handy_unreadcounter (user_id, key, count, updated_at)
+VALUES {values}
+ON CONFLICT (user_id, key)
+DO UPDATE SET count = handy_unreadcounter.count + EXCLUDED.count, updated_at = EXCLUDED.updated_at
+"""
+DECREMENT_SQL = """
+UPDATE handy_unreadcounter AS c
+SET count = GREATEST(c.count - d.n, 0), updated_at = now()
+FROM (VALUES {values}) AS d(user_id, key, n)
+WHERE c.user_id = d.user_id AND c.key = d.key
+"""
+
+MARK_CONVERSATION_SQL = """
+UPDATE handy_message SET is_read = true
+WHERE conversation_id = %s AND NOT is_read AND sender_id <> %s AND id <= %s
+RETURNING sender_id
+"""
+
+
+def conversation_key(conversation_id) -> str:
+    return f"conversation:{conversation_id}"
+
+
+def _ttl():
+    return getattr(settings, "UNREAD_CACHE_TTL", 7 * 86400)
+
+
+# ---- écriture ----
+def apply(deltas: Dict[Tuple[int, str], int]):
+    """Applique {(user_id, key): delta} : table (dans la transaction courante) puis cache après commit."""
+    rows = [(user_id, key, delta) for (user_id, key), delta in deltas.items() if delta]
+    if not rows:
+        return
+    ups = [(user_id, key, delta) for user_id, key, delta in rows if delta > 0]
+    downs = [(user_id, key, -delta) for user_id, key, delta in rows if delta < 0]
+    with connection.cursor() as cursor:
+        if ups:
+            cursor.execute(INCREMENT_SQL.format(values=", ".join(["(%s, %s, %s, now())"] * len(ups))),
+                           [p for row in ups for p in row])
+        if downs:
+            cursor.execute(DECREMENT_SQL.format(values=", ".join(["(%s::bigint, %s::varchar, %s::integer)"] * len(downs))),
+                           [p for row in downs for p in row])
+
+    def _incr():
+        for user_id, key, delta in rows:
+            try:
+                cache.incr(CACHE_KEY.format(user_id, key), delta)
+            except ValueError:
+                pass  # absente du cache : rechargée depuis la table à la lecture
+    transaction.on_commit(_incr)
+
+
+def _participants(conversation_ids) -> Dict[int, list]:
+    from handy.models import Conversation
+
+    members = defaultdict(list)
+    for conversation_id, user_id in Conversation.participants.through.objects.filter(
+            conversation_id__in=set(conversation_ids)).values_list('conversation_id', 'user_id'):
+        members[conversation_id].append(user_id)
+    return members
+
+
+def message_deltas(messages: Iterable, sign: int = 1) -> Dict[Tuple[int, str], int]:
+    """+1 (ou -1) par message pour chaque participant autre que l'expéditeur."""
+    messages = list(messages)
+    members = _participants(m.conversation_id for m in messages)
+    deltas = Counter()
+    for m in messages:
+        for user_id in members.get(m.conversation_id, ()):
+            if user_id != m.sender_id:
+                deltas[(user_id, conversation_key(m.conversation_id))] += sign
+                deltas[(user_id, MESSAGES)] += sign
+    return deltas
+
+
+def messages_created(messages: Iterable):
+    apply(message_deltas(m for m in messages if not m.is_read))
+
+
+def notifications_created(notifications: Iterable):
+    deltas = Counter()
+    for n in notifications:
+        if not n.is_read:
+            deltas[(n.user_id, NOTIFICATIONS)] += 1
+    apply(deltas)
+
+
+# ---- marquage en masse ----
+def mark_conversation_read(user_id, conversation_id, up_to) -> int:
+    """
+    Marque lus, en une requête, les messages reçus jusqu'à l'id `up_to` inclus.
+    Les compteurs de tous les destinataires sont décrémentés (is_read est partagé).
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(MARK_CONVERSATION_SQL, [conversation_id, user_id, up_to])
+            senders = Counter(sender_id for (sender_id,) in cursor.fetchall())
+        if not senders:
+            return 0
+        deltas = Counter()
+        for member in _participants([conversation_id]).get(conversation_id, ()):
+            n = sum(count for sender_id, count in senders.items() if sender_id != member)
+            if n:
+                deltas[(member, conversation_key(conversation_id))] -= n
+                deltas[(member, MESSAGES)] -= n
+        apply(deltas)
+    return sum(senders.values())
+
+
+def mark_notifications_read(user_id, up_to=None) -> int:
+    from handy.models import Notification
+
+    qs = Notification.objects.filter(user_id=user_id, is_read=False)
+    if up_to is not None:
+        qs = qs.filter(id__lte=up_to)
+    with transaction.atomic():
+        n = qs.update(is_read=True)
+        apply({(user_id, NOTIFICATIONS): -n})
+    return n
+
+
+# ---- lecture ----
+def counts(user_id, keys: Iterable[str]) -> Dict[str, int]:
+    """Compteurs demandés : un aller-retour cache, la table seulement pour les clés absentes."""
+    from handy.models import UnreadCounter
+
+    cache_keys = {CACHE_KEY.format(user_id, key): key for key in keys}
+    found = cache.get_many(list(cache_keys))
+    result = {cache_keys[k]: max(int(v), 0) for k, v in found.items()}
+    missing = [key for k, key in cache_keys.items() if k not in found]
+    if missing:
+        stored = dict(UnreadCounter.objects.filter(user_id=user_id, key__in=missing).values_list('key', 'count'))
+        for key in missing:
+            result[key] = max(stored.get(key, 0), 0)
+            # add et non set : ne pas écraser un incr concurrent
+            cache.add(CACHE_KEY.format(user_id, key), result[key], _ttl())
+    return result
+
+
+def badges(user_id, conversation_ids: Iterable[int] = ()) -> dict:
+    keys = [NOTIFICATIONS, MESSAGES] + [conversation_key(c) for c in conversation_ids]
+    values = counts(user_id, keys)
+    return {
+        "notifications": values[NOTIFICATIONS],
+        "messages": values[MESSAGES],
+        "conversations": {c: values[conversation_key(c)] for c in conversation_ids},
+    }
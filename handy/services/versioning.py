@@ -0,0 +1,91 @@
+# services/versioning.py
+"""
+Numéros de version partagés (cache Redis) pour invalider des structures
+gardées en mémoire dans chaque process (index, tables de règles...).
+"""
+import time
+
+from django.core.cache import cache
+
+from handy.services import acache
+
+KEY_PREFIX = "ver:"
+
+
+def _key(name: str) -> str:
+    return f"{KEY_PREFIX}{name}"
+
+
+def get_version(name: str) -> int:
+    key = _key(name)
+    v = cache.get(key)
+    if v is None:
+        cache.add(key, 1, timeout=None)
+        v = cache.get(key) or 1
+    return int(v)
+
+
+def get_versions(names) -> dict:
+    """Plusieurs versions en un aller-retour ; absente = 0 (rien n'a encore changé)."""
+    keys = {_key(n): n for n in names}
+    found = cache.get_many(list(keys))
+    return {n: int(found.get(k, 0)) for k, n in keys.items()}
+
+
+async def aget_versions(names) -> dict:
+    """Variante asynchrone de `get_versions` (vues async)."""
+    keys = {_key(n): n for n in names}
+    found = await acache.aget_many(keys)
+    return {n: int(found.get(k, 0)) for k, n in keys.items()}
+
+
+def bump_version(name: str) -> int:
+    key = _key(name)
+    try:
+        return int(cache.incr(key))
+    except ValueError:
+        # clé absente (cache vidé / premier appel)
+        cache.add(key, 1, timeout=None)
+        return int(cache.incr(key))
+
+
+class VersionGate:
+    """
+    Compare une version locale à la version partagée, en limitant les
+    allers-retours vers le cache à un toutes les `check_every` secondes.
+    """
+
+    def __init__(self, name: str, check_every: float = 2.0):
+        self.name = name
+        self.check_every = check_every
+        self.local_version = None
+        self._shared_version = None
+        self._checked_at = 0.0
+
+    def shared_version(self) -> int:
+        now = time.monotonic()
+        if self._shared_version is None or now - self._checked_at >= self.check_every:
+            self._shared_version = get_version(self.name)
+            self._checked_at = now
+        return self._shared_version
+
+    def is_current(self) -> bool:
+        return self.local_version is not None and self.local_version == self.shared_version()
+
+    def mark_loaded(self, version: int):
+        self.local_version = version
+        self._shared_version = version
+        self._checked_at = time.monotonic()
+
+    def bump(self):
+        """
+        Publie une modification faite localement. Si personne d'autre n'a bumpé
+        entre-temps, la copie locale reste à jour ; sinon elle devient périmée.
+        """
+        new = bump_version(self.name)
+        if self.local_version is not None and new == self.local_version + 1:
+            self.mark_loaded(new)
+        else:
+            self._shared_version = new
+            self._checked_at = time.monotonic()
+        return new
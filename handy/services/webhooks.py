@@ -0,0 +1,164 @@
+# services/webhooks.py
+"""
+Webhooks de paiement : journal append-only, application différée par lot.
+
+- réception : une insertion `ON CONFLICT DO NOTHING` sur (provider, event_id),
+  sans verrou ni lecture de Payment ; un rejeu du fournisseur est absorbé et
+  l'accusé de réception part immédiatement (même pour une référence inconnue) ;
+- référence encore inconnue (webhook arrivé avant l'enregistrement de
+  `transaction_id`) : l'événement reste en file et est repris par le balayage
+  périodique pendant `PAYMENT_WEBHOOK_UNKNOWN_GRACE_S`, puis classé « unknown » ;
+- sans `event_id` fourni, la clé est dérivée de (provider_ref, status) : un même
+  statut renvoyé pour un même paiement n'est enregistré qu'une fois ;
+- application : les événements sont répartis en `shards` par provider_ref. Un
+  worker tient un shard à la fois (verrou consultatif) : les événements d'un
+  paiement sont appliqués dans l'ordre de réception, les shards en parallèle ;
+- par lot : transitions d'un même paiement fusionnées (doublons et statut
+  inchangé sans effet), un bulk_update Payment, un bulk_create PaymentLog et
+  une UPDATE par verdict sur le journal.
+"""
+import hashlib
+import logging
+import zlib
+from collections import Counter, defaultdict
+from datetime import timedelta
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from handy.models import Booking, Payment, PaymentLog, PaymentWebhookEvent
+from handy.services.dashboard import invalidate_handyman_stats
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAMESPACE = 0x5057  # pg_advisory_xact_lock(namespace, shard)
+KICK_KEY = "paywh:kick:{}"
+STATUSES = dict(Payment.PAYMENT_STATUS)
+
+
+def _shards() -> int:
+    return max(1, int(getattr(settings, "PAYMENT_WEBHOOK_SHARDS", 8)))
+
+
+def _batch_size() -> int:
+    return max(1, int(getattr(settings, "PAYMENT_WEBHOOK_BATCH_SIZE", 500)))
+
+
+def _unknown_grace():
+    return timedelta(seconds=int(getattr(settings, "PAYMENT_WEBHOOK_UNKNOWN_GRACE_S", 900)))
+
+
+def shard_for(provider_ref: str) -> int:
+    return zlib.crc32(provider_ref.encode()) % _shards()
+
+
+def event_key(provider: str, data: dict) -> str:
+    event_id = data.get("event_id") or data.get("id")
+    if event_id:
+        return str(event_id)[:100]
+    raw = f"{provider}:{data.get('provider_ref')}:{data.get('status')}"
+    return "sha1:" + hashlib.sha1(raw.encode()).hexdigest()
+
+
+# ---- réception ----
+def record_event(provider: str, data: dict) -> PaymentWebhookEvent:
+    """Ajoute l'événement au journal (ignoré s'il y est déjà) et planifie son traitement."""
+    provider_ref = str(data["provider_ref"])
+    event = PaymentWebhookEvent(
+        provider=provider, event_id=event_key(provider, data), provider_ref=provider_ref,
+        status=str(data["status"]), payload=dict(data), shard=shard_for(provider_ref),
+    )
+    PaymentWebhookEvent.objects.bulk_create([event], ignore_conflicts=True)
+    transaction.on_commit(lambda: schedule(event.shard))
+    return event
+
+
+def schedule(shard: int):
+    """
+    Un seul passage planifié par shard et par fenêtre `PAYMENT_WEBHOOK_COALESCE_S` :
+    la tâche part après la fenêtre et reprend tout ce qui a été reçu entre-temps.
+    """
+    from handy.tasks import process_payment_webhooks
+
+    if not getattr(settings, "PAYMENT_WEBHOOK_ASYNC", True):
+        process_shard(shard)
+        return
+    window = max(1, int(getattr(settings, "PAYMENT_WEBHOOK_COALESCE_S", 1)))
+    if cache.add(KICK_KEY.format(shard), 1, timeout=window):
+        process_payment_webhooks.apply_async((shard,), countdown=window)
+
+
+# ---- application ----
+def pending_shards() -> List[int]:
+    return list(PaymentWebhookEvent.objects.filter(processed_at__isnull=True)
+                .values_list('shard', flat=True).distinct())
+
+
+def process_shard(shard: int) -> Counter:
+    """Vide la file d'un shard, lot par lot. Sans effet si un autre worker le tient déjà."""
+    stats = Counter()
+    size = _batch_size()
+    last_id = 0  # les événements différés restent en file : on avance par id
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", [LOCK_NAMESPACE, shard])
+                if not cursor.fetchone()[0]:
+                    return stats
+            events = list(PaymentWebhookEvent.objects.filter(shard=shard, processed_at__isnull=True, id__gt=last_id)
+                          .order_by('id')[:size])
+            if events:
+                stats.update(apply_events(events))
+                last_id = events[-1].pk
+        if len(events) < size:
+            return stats
+
+
+def apply_events(events: List[PaymentWebhookEvent]) -> Counter:
+    """
+    Applique un lot (ordonné par id) dans la transaction courante ; retourne les verdicts.
+    Référence inconnue reçue depuis moins de la période de grâce : « deferred », laissé en file.
+    """
+    payments: Dict[str, Payment] = {
+        p.transaction_id: p for p in Payment.objects.select_for_update().order_by('id')
+        .filter(transaction_id__in={e.provider_ref for e in events})
+        .only('id', 'booking_id', 'transaction_id', 'status', 'is_paid', 'updated_at')
+    }
+    now = timezone.now()
+    retry_after = now - _unknown_grace()
+    outcomes = defaultdict(list)
+    changed: Dict[int, Payment] = {}
+    logs = []
+    for event in events:
+        payment = payments.get(event.provider_ref)
+        if payment is None:
+            outcome = 'deferred' if event.received_at > retry_after else 'unknown'
+        elif event.status not in STATUSES:
+            outcome = 'invalid'
+        elif event.status == payment.status:
+            outcome = 'unchanged'
+        else:
+            logs.append(PaymentLog(payment=payment, previous_status=payment.status, new_status=event.status,
+                                   notes=f"prov={event.provider} event={event.event_id}"))
+            payment.status = event.status
+            payment.is_paid = event.status == 'completed'  # bulk_update ne passe pas par save()
+            payment.updated_at = now
+            changed[payment.pk] = payment
+            outcome = 'applied'
+        outcomes[outcome].append(event.pk)
+
+    if changed:
+        Payment.objects.bulk_update(list(changed.values()), ['status', 'is_paid', 'updated_at'])
+        PaymentLog.objects.bulk_create(logs)
+        handymen = set(Booking.objects.filter(pk__in={p.booking_id for p in changed.values()})
+                       .values_list('handyman_id', flat=True))
+        transaction.on_commit(lambda: [invalidate_handyman_stats(h) for h in handymen])
+    for outcome, ids in outcomes.items():
+        if outcome != 'deferred':
+            PaymentWebhookEvent.objects.filter(pk__in=ids).update(processed_at=now, outcome=outcome)
+    if outcomes.get('unknown'):
+        logger.warning("Webhooks paiement : %s événement(s) pour une référence inconnue.", len(outcomes['unknown']))
+    return Counter({outcome: len(ids) for outcome, ids in outcomes.items()})
@@ -1,10 +1,24 @@
 import logging
 
-from django.db import models
-from django.db.models.signals import post_delete, post_save
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save, m2m_changed
 from django.dispatch import receiver
 
-from handy.models import ServiceImage, User, HandymanProfile, Review, Booking
+from handy.models import ServiceImage, User, HandymanProfile, Review, Booking, Payment, DepositTransaction, Quotation, \
+    Service, ServiceCategory, IPBlacklist, AvailabilitySlot, TimeOff, ServiceArea, Message, Notification, HandymanDocument, \
+    PricingRule
+from handy.services.availability import availability_index
+from handy.services.coverage import coverage_index
+from handy.services.dashboard import invalidate_handyman_stats
+from handy.services.eta import eta_engine
+from handy.services.fees import fee_rules
+from handy.services.geoindex import geo_index
+from handy.services.ipblacklist import ip_blacklist
+from handy.services import nearby as nearby_cache
+from handy.services import rollups, unread
+from handy.services.pricing import pricing_engine
+from handy.services.ranking import invalidate_category_weights
+from handy.services.search import refresh_search_index
 from handy.tasks import notify_booking_status
 logger = logging.getLogger(__name__)
 
@@ -21,13 +35,38 @@ def delete_service_image_file(sender, instance, **kwargs):
         instance.image.delete(False)
 
 
+def _review_handyman_id(review: Review):
+    return Booking.objects.filter(pk=review.booking_id).values_list('handyman_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance: Review, **kwargs):
+    instance._old_rating = None
+    if instance.pk:
+        instance._old_rating = Review.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+
+
 @receiver(post_save, sender=Review)
 def update_rating_on_review(sender, instance: Review, created, **kwargs):
-    if not created: return
-    handyman = instance.booking.handyman
-    qs = Review.objects.filter(booking__handyman=handyman)
-    avg = qs.aggregate(avg=models.Avg('rating'))['avg'] or 0
-    HandymanProfile.objects.filter(user=handyman).update(rating=avg)
+    # compteurs dénormalisés, mis à jour en O(1) (pas de ré-agrégation des avis)
+    old = getattr(instance, '_old_rating', None)
+    if created or old is None:
+        HandymanProfile.apply_review(_review_handyman_id(instance), instance.rating, 1)
+    elif old != instance.rating:
+        HandymanProfile.apply_review(_review_handyman_id(instance), instance.rating - old, 0)
+
+
+@receiver(pre_delete, sender=Review)
+def remember_review_handyman(sender, instance: Review, **kwargs):
+    # en suppression en cascade, la réservation n'existe plus au post_delete
+    instance._handyman_id = _review_handyman_id(instance)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_review_delete(sender, instance: Review, **kwargs):
+    handyman_id = getattr(instance, '_handyman_id', None)
+    if handyman_id:
+        HandymanProfile.apply_review(handyman_id, -instance.rating, -1)
 
 @receiver(post_save, sender=Booking)
 def increment_completed_jobs(sender, instance: Booking, **kwargs):
@@ -50,3 +89,329 @@ def on_booking_status_change(sender, instance: Booking, created: bool, **kwargs)
             logger.exception("Échec d'envoi de la tâche Celery notify_booking_status")
     else:
         logger.debug("notify_booking_status indisponible — notification ignorée.")
+
+
+# ---- Index spatial mémoire (matching) ----
+GEO_FIELDS = ('is_approved', 'online', 'location')
+
+
+def _geo_state(profile):
+    return tuple(getattr(profile, f) for f in GEO_FIELDS)
+
+
+@receiver(post_save, sender=HandymanProfile)
+def sync_geo_index_on_profile_save(sender, instance: HandymanProfile, created, **kwargs):
+    # seuls l'approbation, la présence et la position déplacent l'artisan dans l'index :
+    # les autres sauvegardes (note, complétion, missions…) ne périment pas les autres process
+    old = getattr(instance, '_old_geo_state', None)
+    if created:
+        if not (instance.is_approved and instance.online and instance.location is not None):
+            return
+    elif old is None or old == _geo_state(instance):
+        return
+    transaction.on_commit(lambda: geo_index.upsert(instance))
+
+
+@receiver(post_delete, sender=HandymanProfile)
+def sync_geo_index_on_profile_delete(sender, instance: HandymanProfile, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: geo_index.remove(pk))
+
+
+@receiver(m2m_changed, sender=HandymanProfile.skills.through)
+def sync_geo_index_on_skills_change(sender, instance, action, reverse, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        transaction.on_commit(lambda: geo_index.upsert(instance))
+    elif kwargs.get("pk_set"):
+        # instance = ServiceCategory, pk_set = profils concernés
+        pk_set = set(kwargs["pk_set"])
+
+        def _upsert():
+            for profile in HandymanProfile.objects.filter(pk__in=pk_set).select_related("user"):
+                geo_index.upsert(profile)
+        transaction.on_commit(_upsert)
+    else:
+        transaction.on_commit(geo_index.invalidate)
+
+
+@receiver(post_save, sender=Booking)
+def drop_eta_state_on_booking_change(sender, instance: Booking, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if instance.status in ('completed', 'cancelled'):
+        eta_engine.forget(instance.id)
+    elif _touches(update_fields, 'job_location'):
+        booking_id, location = instance.id, instance.job_location
+        transaction.on_commit(lambda: eta_engine.retarget(booking_id, location))
+
+
+# ---- Cache du tableau de bord artisan ----
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_dashboard_on_booking(sender, instance: Booking, **kwargs):
+    invalidate_handyman_stats(instance.handyman_id)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def invalidate_dashboard_on_payment(sender, instance: Payment, **kwargs):
+    handyman_id = Booking.objects.filter(pk=instance.booking_id).values_list('handyman_id', flat=True).first()
+    invalidate_handyman_stats(handyman_id)
+
+
+@receiver(post_save, sender=DepositTransaction)
+@receiver(post_delete, sender=DepositTransaction)
+def invalidate_dashboard_on_deposit(sender, instance: DepositTransaction, **kwargs):
+    invalidate_handyman_stats(instance.handyman_id)
+
+
+# ---- Agrégats quotidiens client (tableau de bord employeur) ----
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def refresh_client_rollup_on_booking(sender, instance: Booking, **kwargs):
+    rollups.refresh_for_booking(client_id=instance.client_id, created_at=instance.created_at)
+
+
+@receiver(post_save, sender=Quotation)
+@receiver(post_delete, sender=Quotation)
+def refresh_client_rollup_on_quotation(sender, instance: Quotation, **kwargs):
+    rollups.refresh_for_booking(booking_id=instance.booking_id)
+
+
+@receiver(pre_save, sender=Payment)
+def remember_payment_day(sender, instance: Payment, **kwargs):
+    # jour de paiement avant modification : l'ancienne case doit aussi être recalculée
+    instance._rollup_old_day = None
+    if instance.pk:
+        old = Payment.objects.filter(pk=instance.pk).values_list('payment_date', flat=True).first()
+        instance._rollup_old_day = rollups.local_day(old)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def refresh_client_rollup_on_payment(sender, instance: Payment, **kwargs):
+    rollups.refresh_for_payment(instance, old_day=getattr(instance, '_rollup_old_day', None))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_client_rollup_on_review(sender, instance: Review, **kwargs):
+    rollups.refresh_for_review(instance)
+
+
+# ---- Index de recherche plein texte (Service) ----
+def _touches(update_fields, *names):
+    return update_fields is None or bool(set(update_fields) & set(names))
+
+
+@receiver(post_save, sender=Service)
+def refresh_service_search(sender, instance: Service, update_fields=None, **kwargs):
+    if _touches(update_fields, 'title', 'description', 'category', 'handyman'):
+        refresh_search_index(Service.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=ServiceCategory)
+def drop_category_ranking_weights(sender, instance: ServiceCategory, update_fields=None, **kwargs):
+    if _touches(update_fields, 'ranking_weights'):
+        invalidate_category_weights(instance.pk)
+
+
+@receiver(post_save, sender=ServiceCategory)
+def refresh_category_services_search(sender, instance: ServiceCategory, created, update_fields=None, **kwargs):
+    if not created and _touches(update_fields, 'name'):
+        refresh_search_index(Service.objects.filter(category=instance))
+
+
+@receiver(post_save, sender=User)
+def refresh_handyman_services_search(sender, instance: User, created, update_fields=None, **kwargs):
+    # ignore les sauvegardes partielles (ex. last_login à chaque connexion)
+    if not created and instance.user_type == 'handyman' and _touches(update_fields, 'first_name', 'last_name'):
+        refresh_search_index(Service.objects.filter(handyman=instance))
+
+
+# ---- Tables de tarification en mémoire (frais plateforme, prix de base) ----
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+def invalidate_fee_rules(sender, instance: PricingRule, **kwargs):
+    transaction.on_commit(fee_rules.invalidate)
+
+
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_delete, sender=ServiceCategory)
+def invalidate_fee_rules_on_category(sender, instance: ServiceCategory, update_fields=None, **kwargs):
+    # héritage des règles par parent : une nouvelle catégorie ou un parent modifié change la table
+    if _touches(update_fields, 'parent'):
+        transaction.on_commit(fee_rules.invalidate)
+
+
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_delete, sender=ServiceCategory)
+def invalidate_pricing_bases(sender, instance: ServiceCategory, update_fields=None, **kwargs):
+    if _touches(update_fields, 'base_price_xof', 'parent', 'slug'):
+        transaction.on_commit(pricing_engine.invalidate)
+
+
+# ---- Liste noire IP (cache mémoire du middleware) ----
+@receiver(post_save, sender=IPBlacklist)
+@receiver(post_delete, sender=IPBlacklist)
+def invalidate_ip_blacklist(sender, instance: IPBlacklist, **kwargs):
+    transaction.on_commit(ip_blacklist.invalidate)
+
+
+# ---- Index de disponibilité (bitmaps par artisan) ----
+def _refresh_availability(user_id):
+    if user_id:
+        transaction.on_commit(lambda: availability_index.refresh(user_id))
+
+
+@receiver(post_save, sender=AvailabilitySlot)
+@receiver(post_delete, sender=AvailabilitySlot)
+@receiver(post_save, sender=TimeOff)
+@receiver(post_delete, sender=TimeOff)
+def refresh_availability_on_schedule(sender, instance, **kwargs):
+    _refresh_availability(HandymanProfile.objects.filter(pk=instance.handyman_id)
+                          .values_list('user_id', flat=True).first())
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def refresh_availability_on_booking(sender, instance: Booking, **kwargs):
+    _refresh_availability(instance.handyman_id)
+
+
+@receiver(post_save, sender=HandymanProfile)
+def refresh_availability_on_profile(sender, instance: HandymanProfile, update_fields=None, **kwargs):
+    if _touches(update_fields, 'availability'):
+        _refresh_availability(instance.user_id)
+
+
+# ---- Cache de /services/nearby/ (versions par cellule geohash) ----
+def _profile_location(user_id):
+    return HandymanProfile.objects.filter(user_id=user_id).values_list('location', flat=True).first()
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_nearby_on_service(sender, instance: Service, **kwargs):
+    location = _profile_location(instance.handyman_id)
+    transaction.on_commit(lambda: nearby_cache.invalidate_point(location))
+
+
+@receiver(pre_save, sender=HandymanProfile)
+def remember_profile_location(sender, instance: HandymanProfile, update_fields=None, **kwargs):
+    # position (cache nearby) et état d'indexation (GeoIndex) avant modification, en une lecture
+    instance._old_location = instance._old_geo_state = None
+    if instance.pk and _touches(update_fields, *GEO_FIELDS):
+        old = HandymanProfile.objects.filter(pk=instance.pk).values_list(*GEO_FIELDS).first()
+        if old is not None:
+            instance._old_geo_state = old
+            instance._old_location = old[GEO_FIELDS.index('location')]
+
+
+@receiver(post_save, sender=HandymanProfile)
+@receiver(post_delete, sender=HandymanProfile)
+def invalidate_nearby_on_profile(sender, instance: HandymanProfile, update_fields=None, **kwargs):
+    # l'ordre des pages dépend aussi de la note : toute sauvegarde du profil invalide sa cellule
+    points = [p for p in (getattr(instance, '_old_location', None), instance.location) if p is not None]
+
+    def _bump():
+        for point in points:
+            nearby_cache.invalidate_point(point)
+    transaction.on_commit(_bump)
+
+
+# ---- Index des zones d'intervention (ServiceArea) ----
+@receiver(post_save, sender=ServiceArea)
+def refresh_coverage_on_area(sender, instance: ServiceArea, **kwargs):
+    transaction.on_commit(lambda: coverage_index.refresh_areas([instance.pk]))
+
+
+@receiver(post_delete, sender=ServiceArea)
+def remove_coverage_on_area_delete(sender, instance: ServiceArea, **kwargs):
+    transaction.on_commit(lambda: coverage_index.remove(instance.pk))
+
+
+@receiver(post_save, sender=HandymanProfile)
+def refresh_coverage_on_profile(sender, instance: HandymanProfile, created, update_fields=None, **kwargs):
+    # approbation : la zone entre dans l'index ou en sort
+    if not created and _touches(update_fields, 'is_approved'):
+        area_ids = list(ServiceArea.objects.filter(handyman=instance).values_list('id', flat=True))
+        transaction.on_commit(lambda: coverage_index.refresh_areas(area_ids))
+
+
+@receiver(m2m_changed, sender=HandymanProfile.skills.through)
+def refresh_coverage_on_skills(sender, instance, action, reverse, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    profiles = kwargs.get("pk_set") if reverse else [instance.pk]
+    if profiles:
+        area_ids = list(ServiceArea.objects.filter(handyman_id__in=profiles).values_list('id', flat=True))
+        transaction.on_commit(lambda: coverage_index.refresh_areas(area_ids))
+    else:
+        coverage_index.invalidate()
+
+
+# ---- Compteurs de non-lus (messages / notifications) ----
+@receiver(pre_save, sender=Message)
+@receiver(pre_save, sender=Notification)
+def remember_read_state(sender, instance, **kwargs):
+    instance._was_read = None
+    if instance.pk:
+        instance._was_read = sender.objects.filter(pk=instance.pk).values_list('is_read', flat=True).first()
+
+
+@receiver(post_save, sender=Message)
+def count_unread_message(sender, instance: Message, created, **kwargs):
+    # les messages du chat passent par MessageBuffer (bulk_create) : comptés dans le buffer
+    if created:
+        unread.messages_created([instance])
+    elif instance._was_read is not None and instance._was_read != instance.is_read:
+        unread.apply(unread.message_deltas([instance], sign=-1 if instance.is_read else 1))
+
+
+@receiver(post_delete, sender=Message)
+def uncount_deleted_message(sender, instance: Message, **kwargs):
+    if not instance.is_read:
+        unread.apply(unread.message_deltas([instance], sign=-1))
+
+
+@receiver(post_save, sender=Notification)
+def count_unread_notification(sender, instance: Notification, created, **kwargs):
+    if created:
+        unread.notifications_created([instance])
+    elif instance._was_read is not None and instance._was_read != instance.is_read:
+        unread.apply({(instance.user_id, unread.NOTIFICATIONS): -1 if instance.is_read else 1})
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance: Notification, **kwargs):
+    if not instance.is_read:
+        unread.apply({(instance.user_id, unread.NOTIFICATIONS): -1})
+
+
+# ---- Complétion du profil (colonne stockée) ----
+@receiver(post_save, sender=HandymanProfile)
+def refresh_profile_completion(sender, instance: HandymanProfile, update_fields=None, **kwargs):
+    if _touches(update_fields, 'bio', 'experience_years', 'license_number', 'cni_number', 'insurance_info', 'photo'):
+        changed = HandymanProfile.refresh_completion([instance.pk])
+        if instance.pk in changed:
+            instance.completion = changed[instance.pk]
+
+
+@receiver(m2m_changed, sender=HandymanProfile.skills.through)
+def refresh_completion_on_skills(sender, instance, action, reverse, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        changed = HandymanProfile.refresh_completion([instance.pk])
+        instance.completion = changed.get(instance.pk, instance.completion)
+    elif kwargs.get("pk_set"):
+        HandymanProfile.refresh_completion(kwargs["pk_set"])
+
+
+@receiver(post_save, sender=HandymanDocument)
+@receiver(post_delete, sender=HandymanDocument)
+def refresh_completion_on_document(sender, instance: HandymanDocument, **kwargs):
+    HandymanProfile.refresh_completion([instance.handyman_id])
@@ -1,25 +1,119 @@
+import logging
+from collections import defaultdict
+
 from celery import shared_task
+from django.db import transaction
+from django.db.models import Sum
 from django.utils import timezone
-from .models import HandymanProfile, Notification
+from .models import HandymanProfile, DepositTransaction, DepositBalance, Device
+from .services import notify, pricing, push, webhooks
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
 def send_profile_completion_reminders():
-    profiles = HandymanProfile.objects.filter(is_approved=True)
-    for profile in profiles:
-        if profile.profile_completion() < 100:
-            Notification.objects.create(
-                user=profile.user,
-                notification_type='profile_incomplete',
-                message=f"Votre profil n'est complété qu'à {profile.profile_completion()}%. "
-                        f"Complétez-le pour apparaître dans les recommandations."
-            )
-
-
-@shared_task(max_retries=3, default_retry_delay=10)
+    """Filtre SQL sur la colonne `completion`, puis une insertion groupée par pourcentage."""
+    by_percent = defaultdict(list)
+    for user_id, percent in (HandymanProfile.objects.filter(is_approved=True, completion__lt=100)
+                             .values_list('user_id', 'completion').iterator()):
+        by_percent[percent].append(user_id)
+
+    sent = 0
+    for percent, user_ids in by_percent.items():
+        sent += dispatch_notifications(
+            user_ids, 'profile_incomplete',
+            f"Votre profil n'est complété qu'à {percent}%. "
+            f"Complétez-le pour apparaître dans les recommandations.",
+            with_push=False,
+        )
+    return sent
+
+
+@shared_task
+def dispatch_notifications(user_ids, notification_type, message, title=None, data=None, with_push=True):
+    """
+    Notification de masse : lignes insérées par lot, puis une tâche push par lot
+    de jetons (FCM_MAX_TOKENS). Retourne le nombre de destinataires.
+    """
+    count = notify.create_notifications(user_ids, notification_type, message)
+    if with_push:
+        for tokens in notify.token_batches(user_ids):
+            send_push_batch.delay(tokens, title or "Tratra", message, data)
+    return count
+
+
+@shared_task
+def send_push_batch(tokens, title, body, data=None, attempt=0):
+    """
+    Un appel multicast ; les jetons morts sont supprimés, ceux en échec temporaire
+    seuls réessayés (backoff exponentiel) dans une nouvelle tâche.
+    """
+    result = push.send_multicast(tokens, title, body, data)
+    if result.dead:
+        pruned = notify.prune_tokens(result.dead)
+        logger.info("Push: %s jetons morts supprimés.", pruned)
+    if result.retry:
+        delay = notify.retry_delay(attempt)
+        if delay is None:
+            logger.warning("Push: %s jetons abandonnés après %s tentatives.", len(result.retry), attempt + 1)
+        else:
+            send_push_batch.apply_async((result.retry, title, body, data, attempt + 1), countdown=delay)
+    return {"sent": result.sent, "retry": len(result.retry), "dead": len(result.dead), "failed": result.failed}
+
+
+@shared_task
+def process_payment_webhooks(shard=None):
+    """
+    Applique les webhooks de paiement en attente : un shard (planifié à la réception)
+    ou, sans argument, tous les shards ayant du retard (balayage périodique).
+    """
+    shards = [shard] if shard is not None else webhooks.pending_shards()
+    stats = {}
+    for s in shards:
+        for outcome, n in webhooks.process_shard(s).items():
+            stats[outcome] = stats.get(outcome, 0) + n
+    return stats
+
+
+@shared_task
+def refresh_zone_surge():
+    """Majorations de zone (demande / offre par cellule geohash), publiées pour les devis."""
+    return len(pricing.compute_zone_surge())
+
+
+@shared_task
 def notify_booking_status(user_id, booking_id, status):
-    _send_fcm(user_id, "Réservation", f"Statut: {status}", {"t":"booking","id":booking_id,"s":status})
+    tokens = list(Device.objects.filter(user_id=user_id).values_list('device_token', flat=True))
+    if tokens:
+        send_push_batch(tokens, "Réservation", f"Statut: {status}", {"t": "booking", "id": booking_id, "s": status})
 
 @shared_task
 def notify_arrival_imminent(user_id, booking_id):
-    _send_sms(_resolve_msisdn(user_id), "Votre artisan arrive. Merci de vous préparer.")
\ No newline at end of file
+    _send_sms(_resolve_msisdn(user_id), "Votre artisan arrive. Merci de vous préparer.")
+
+
+@shared_task
+def reconcile_deposit_balances():
+    """
+    Compare chaque solde matérialisé au SUM de l'historique (une requête groupée),
+    puis corrige sous verrou les écarts éventuels (écritures hors ORM, suppressions en masse...).
+    """
+    totals = dict(DepositTransaction.objects.filter(status='completed')
+                  .values_list('handyman_id').annotate(total=Sum('amount')))
+    ledgers = dict(DepositBalance.objects.values_list('handyman_id', 'balance'))
+
+    fixed = 0
+    for handyman_id in set(totals) | set(ledgers):
+        if (totals.get(handyman_id) or 0) == (ledgers.get(handyman_id) or 0):
+            continue
+        with transaction.atomic():
+            ledger = DepositBalance.lock(handyman_id)
+            expected = DepositTransaction.compute_balance(handyman_id)
+            if ledger.balance != expected:
+                logger.warning("Caution %s: solde %s != historique %s, correction.",
+                               handyman_id, ledger.balance, expected)
+                DepositBalance.objects.filter(pk=ledger.pk).update(balance=expected, reconciled_at=timezone.now())
+                fixed += 1
+    DepositBalance.objects.update(reconciled_at=timezone.now())
+    return fixed
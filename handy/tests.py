@@ -76,7 +76,10 @@ def service(db, user_handyman, category):
 
 @pytest.fixture
 def auth_client(api_client, user_client):
-    api_client.force_authenticate(user=user_client)
+    # vrai jeton JWT : les vues async authentifient l'en-tête, pas force_authenticate
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user_client)}")
     return api_client
 
 
@@ -98,6 +101,9 @@ def test_match_endpoint(auth_client, handyman_profile, category):
     assert res.status_code == 200
     data = res.json()
     assert isinstance(data, list)
+    # corps form-encoded, accepté comme par l'ancienne vue DRF
+    form = auth_client.post(url, payload)
+    assert form.status_code == 200 and form.json() == data
     assert len(data) >= 1
     # champs attendus
     assert {"id", "full_name", "rating", "completed_jobs", "distance_m"}.issubset(data[0].keys())
@@ -135,7 +141,9 @@ def test_booking_create_and_timeline(auth_client, user_handyman, service):
 
 
 @pytest.mark.django_db
-def test_payment_initiate_and_webhook(auth_client, user_handyman, service):
+def test_payment_initiate_and_webhook(api_client, auth_client, user_handyman, service, settings,
+                                     django_capture_on_commit_callbacks):
+    settings.PAYMENT_WEBHOOK_ASYNC = False  # application immédiate (sans worker)
     # 1) créer une réservation
     create_url = reverse("bookings-list")
     start = timezone.now() + timezone.timedelta(hours=1)
@@ -176,9 +184,728 @@ def test_payment_initiate_and_webhook(auth_client, user_handyman, service):
     # 4) webhook -> completed
     webhook_url = reverse("payment-webhook", kwargs={"provider": "om"})
     webhook_payload = {"provider_ref": provider_ref, "status": "completed"}
-    w_res = api_client.post(webhook_url, webhook_payload, format="json")  # webhook sans auth
+    with django_capture_on_commit_callbacks(execute=True):
+        w_res = api_client.post(webhook_url, webhook_payload, format="json")  # webhook sans auth
     assert w_res.status_code == 200, w_res.content
 
     # 5) recharger depuis DB et valider
     p.refresh_from_db()
-    assert p.status == "completed"
\ No newline at end of file
+    assert p.status == "completed"
+
+@pytest.mark.django_db
+def test_match_uses_geo_index_when_warm(handyman_profile, category, django_capture_on_commit_callbacks):
+    from handy.services.geoindex import VERSION_NAME, geo_index
+    from handy.services.matching import match_artisans
+    from handy.services.versioning import get_version
+
+    geo_index.rebuild()
+    assert geo_index.is_ready()
+
+    results = match_artisans(5.346, -4.018, category.id)
+    assert [r["id"] for r in results] == [handyman_profile.id]
+    assert 0 < results[0]["distance_m"] < 1000
+
+    # sauvegarde sans effet sur l'index (complétion, missions…) : version partagée inchangée
+    version = get_version(VERSION_NAME)
+    with django_capture_on_commit_callbacks(execute=True):
+        handyman_profile.completed_jobs += 1
+        handyman_profile.save()
+    assert get_version(VERSION_NAME) == version and geo_index.is_ready()
+
+    # passage hors ligne -> retiré de l'index au commit
+    with django_capture_on_commit_callbacks(execute=True):
+        handyman_profile.online = False
+        handyman_profile.save()
+    assert match_artisans(5.346, -4.018, category.id) == []
+
+
+def test_batch_writer_backpressure_and_flush():
+    from handy.services.batching import BatchWriter
+
+    written = []
+
+    class _Writer(BatchWriter):
+        def write(self, objs):
+            written.extend(objs)
+
+        def _ensure_thread(self):
+            pass  # pas de thread de fond dans le test
+
+    w = _Writer(model=None, name="test", max_batch=2, flush_ms=10, max_pending=3)
+    assert all(w.add(i) for i in range(3))
+    assert w.add(3) is False  # file pleine -> le plus ancien est abandonné
+    assert w.stats["dropped"] == 1
+
+    assert w.flush() == 3
+    assert written == [1, 2, 3]
+    assert w.pending == 0
+
+    w.add(4)
+    w._flush_at_exit()  # enregistré via atexit : la file n'est pas perdue à l'arrêt
+    assert written[-1] == 4 and w.pending == 0
+    assert not w.synchronous and _Writer(model=None, max_batch=1).synchronous
+
+
+@pytest.mark.django_db
+def test_eta_engine_throttles_route_writes(auth_client, user_handyman, service):
+    from types import SimpleNamespace
+    from handy.models import BookingRoute
+    from handy.services.eta import EtaEngine
+
+    start = timezone.now() + timezone.timedelta(hours=1)
+    booking = Booking.objects.create(
+        client=User.objects.get(username="client1"), handyman=user_handyman, service=service,
+        booking_date=start, address="Plateau", city="Abidjan", postal_code="00225",
+        job_location=Point(-4.00, 5.30, srid=4326),
+    )
+    engine = EtaEngine(min_delta_min=2, min_interval_s=3600)
+    t0 = timezone.now()
+
+    def ping(i, lat):
+        return SimpleNamespace(booking_id=booking.id, loc=Point(-4.00, lat, srid=4326), speed=10.0,
+                               heading=0.0, ts=t0 + timezone.timedelta(seconds=5 * i))
+
+    engine.observe_many([ping(i, 5.40 - i * 0.0001) for i in range(20)])
+    route = BookingRoute.objects.get(booking=booking)
+    assert route.eta_minutes > 0
+    # 20 points, un seul lot -> une seule écriture
+    assert engine.stats["writes"] == 1
+
+
+@pytest.mark.django_db
+def test_eta_engine_follows_job_location(user_handyman, service, django_capture_on_commit_callbacks):
+    from types import SimpleNamespace
+    from django.core.cache import cache
+    from handy.services.eta import KEY, eta_engine
+
+    booking = Booking.objects.create(
+        client=User.objects.get(username="client1"), handyman=user_handyman, service=service,
+        booking_date=timezone.now(), address="Plateau", city="Abidjan", postal_code="00225",
+    )
+    t0 = timezone.now()
+
+    def ping(i):
+        return SimpleNamespace(booking_id=booking.id, loc=Point(-4.00, 5.40, srid=4326), speed=10.0,
+                               heading=0.0, ts=t0 + timezone.timedelta(seconds=5 * i))
+
+    assert eta_engine.observe(ping(0)) is None  # destination pas encore connue
+
+    with django_capture_on_commit_callbacks(execute=True):
+        booking.job_location = Point(-4.00, 5.30, srid=4326)
+        booking.save(update_fields=["job_location"])
+    far = eta_engine.observe(ping(1))
+    assert far is not None and far > 0  # destination relue dès qu'elle est renseignée
+
+    with django_capture_on_commit_callbacks(execute=True):
+        booking.job_location = Point(-4.00, 5.399, srid=4326)
+        booking.save(update_fields=["job_location"])
+    assert cache.get(KEY.format(booking.id)) is None  # état calculé sur l'ancienne destination abandonné
+    assert eta_engine.observe(ping(2)) < far
+
+
+@pytest.mark.django_db
+def test_deposit_balance_is_materialized(handyman_profile, user_handyman):
+    from decimal import Decimal
+    from django.core.exceptions import ValidationError
+    from handy.models import DepositTransaction, DepositBalance
+
+    DepositTransaction.objects.create(handyman=user_handyman, type='deposit', amount=Decimal('10000'))
+    pending = DepositTransaction.objects.create(handyman=user_handyman, type='deposit', amount=Decimal('5000'),
+                                                status='pending')
+    assert handyman_profile.deposit_balance == Decimal('10000')
+
+    pending.status = 'completed'
+    pending.save()
+    assert handyman_profile.deposit_balance == Decimal('15000')
+
+    assert handyman_profile.deduct_platform_fee(Decimal('100000')) is True   # 11 000
+    assert handyman_profile.deduct_platform_fee(Decimal('100000')) is False  # solde insuffisant
+    assert DepositBalance.current(user_handyman.id) == Decimal('4000')
+    assert DepositTransaction.compute_balance(user_handyman.id) == Decimal('4000')
+
+    with pytest.raises(ValidationError):
+        DepositTransaction.objects.create(handyman=user_handyman, type='withdrawal', amount=Decimal('-5000'))
+
+
+@pytest.mark.django_db
+def test_dashboard_stats_single_pass(user_handyman, service, django_assert_num_queries):
+    from handy.services.dashboard import compute_handyman_stats, get_handyman_stats
+
+    client = User.objects.get(username="client1")
+    soon = timezone.now() + timezone.timedelta(minutes=30)
+    for status in ("confirmed", "pending", "cancelled"):
+        Booking.objects.create(client=client, handyman=user_handyman, service=service, booking_date=soon,
+                               address="Plateau", city="Abidjan", postal_code="00225", status=status)
+
+    # agrégation conditionnelle + revenus par jour + solde de caution
+    with django_assert_num_queries(3):
+        stats = compute_handyman_stats(user_handyman.id)
+    assert stats["total_missions"] == 3
+    assert stats["next_mission_at"] is not None
+
+    get_handyman_stats(user_handyman.id)
+    Booking.objects.filter(status="pending").first().delete()  # signal -> invalidation
+    assert get_handyman_stats(user_handyman.id)["total_missions"] == 2
+
+
+@pytest.mark.django_db
+def test_client_daily_rollup_follows_payments(user_handyman, service):
+    from decimal import Decimal
+    from handy.models import ClientDailyStats, Payment
+    from handy.services.rollups import client_dashboard_stats
+
+    client = User.objects.get(username="client1")
+    booking = Booking.objects.create(client=client, handyman=user_handyman, service=service,
+                                     booking_date=timezone.now() + timezone.timedelta(days=1),
+                                     address="Plateau", city="Abidjan", postal_code="00225")
+    payment = Payment.objects.create(booking=booking, amount=Decimal("20000"), platform_fee=Decimal("2200"),
+                                     method="cash", payment_date=timezone.now())
+
+    stats = client_dashboard_stats(client.id, days=30)
+    assert stats["pending_requests"] == 1
+    assert stats["daily_spending"][-1] == 20000.0
+    assert len(stats["daily_spending"]) == 30
+
+    # le paiement change de jour : l'ancienne case est vidée
+    payment.payment_date = timezone.now() - timezone.timedelta(days=3)
+    payment.save()
+    stats = client_dashboard_stats(client.id, days=7)
+    assert stats["daily_spending"][-1] == 0
+    assert stats["daily_spending"][-4] == 20000.0
+    assert ClientDailyStats.objects.filter(client=client).count() == 2
+
+
+@pytest.mark.django_db
+def test_review_counters_are_incremental(handyman_profile, user_handyman, service):
+    from handy.models import Review
+
+    # nouveau profil sans avis : note lissée = a priori, pas 0
+    assert handyman_profile.bayes_score == pytest.approx(HandymanProfile.rating_prior()[0])
+
+    client = User.objects.get(username="client1")
+    bookings = [
+        Booking.objects.create(client=client, handyman=user_handyman, service=service, status="completed",
+                               booking_date=timezone.now(), address="Plateau", city="Abidjan", postal_code="00225")
+        for _ in range(2)
+    ]
+    first = Review.objects.create(booking=bookings[0], rating=5)
+    Review.objects.create(booking=bookings[1], rating=3)
+
+    handyman_profile.refresh_from_db()
+    assert (handyman_profile.rating_sum, handyman_profile.review_count) == (8, 2)
+    assert handyman_profile.rating == pytest.approx(4.0)
+    assert handyman_profile.bayes_score == pytest.approx((4.0 * 5 + 8) / 7)
+
+    first.rating = 4
+    first.save()
+    first.delete()
+    handyman_profile.refresh_from_db()
+    assert (handyman_profile.rating_sum, handyman_profile.review_count) == (3, 1)
+    assert handyman_profile.rating == pytest.approx(3.0)
+
+
+@pytest.mark.django_db
+def test_service_search_ranks_and_tolerates_typos(service, user_handyman, category):
+    from handy.services.search import search_services
+
+    Service.objects.create(handyman=user_handyman, category=category, title="Installation chauffe-eau",
+                           description="Pose et raccordement", price_type="quote", is_active=True)
+    qs = Service.objects.filter(is_active=True)
+
+    assert [s.id for s in search_services(qs, "fuite")] == [service.id]
+    # faute de frappe : rattrapée par les trigrammes
+    assert service.id in [s.id for s in search_services(qs, "réparaton")]
+    # catégorie renommée : l'index des services suit, en une seule UPDATE quel que soit leur nombre
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    category.name = "Sanitaire"
+    with CaptureQueriesContext(connection) as ctx:
+        category.save()
+    assert sum(q["sql"].startswith('UPDATE handy_service AS s') for q in ctx.captured_queries) == 1
+    assert search_services(qs, "sanitaire").count() == 2
+
+
+def test_ip_prefix_tree_matches_ranges():
+    import ipaddress
+    from handy.services.ipblacklist import PrefixTree
+
+    tree = PrefixTree()
+    tree.insert(ipaddress.ip_network("41.202.0.0/16"))
+    tree.insert(ipaddress.ip_network("41.202.7.0/24"))  # déjà couverte
+    tree.insert(ipaddress.ip_network("10.0.0.1/32"))
+
+    assert tree.contains(ipaddress.ip_address("41.202.255.1"))
+    assert tree.contains(ipaddress.ip_address("10.0.0.1"))
+    assert not tree.contains(ipaddress.ip_address("10.0.0.2"))
+    assert not tree.contains(ipaddress.ip_address("41.203.0.1"))
+    assert tree.size == 2
+
+
+@pytest.mark.django_db
+def test_availability_index_excludes_busy_artisans(handyman_profile, user_handyman, service):
+    from handy.models import AvailabilitySlot, TimeOff
+    from handy.services.availability import availability_index
+
+    day = timezone.localdate() + timezone.timedelta(days=1)
+    at = lambda h: timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time())) \
+        + timezone.timedelta(hours=h)
+    AvailabilitySlot.objects.create(handyman=handyman_profile, weekday=day.weekday(),
+                                    start_time="08:00", end_time="18:00")
+    client = User.objects.get(username="client1")
+    Booking.objects.create(client=client, handyman=user_handyman, service=service, status="confirmed",
+                           booking_date=at(9), end_date=at(11),
+                           address="Plateau", city="Abidjan", postal_code="00225")
+    TimeOff.objects.create(handyman=handyman_profile, start=at(15), end=at(16))
+    availability_index.refresh(user_handyman.id)  # on_commit ne se déclenche pas dans la transaction de test
+
+    uid = user_handyman.id
+    assert availability_index.is_free(uid, at(12), at(14))
+    assert not availability_index.is_free(uid, at(10), at(12))   # mission confirmée
+    assert not availability_index.is_free(uid, at(15.5), at(17))  # congé
+    assert not availability_index.is_free(uid, at(19), at(20))    # hors gabarit
+
+
+@pytest.mark.django_db
+def test_availability_from_profile_form_is_matched(settings, handyman_profile, user_handyman, category):
+    from handy.forms import DAY_CHOICES, HandymanProfileForm
+    from handy.models import ServiceArea
+    from handy.services.availability import availability_index
+    from handy.services.matching import match_artisans
+
+    settings.COVERAGE_INDEX_ENABLED = False
+    settings.MATCH_RANKING_ENABLED = False
+    ServiceArea.objects.create(handyman=handyman_profile, center=Point(-4.017, 5.345, srid=4326), radius_km=5)
+    day = timezone.localdate() + timezone.timedelta(days=1)
+    at = lambda h: timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time())) \
+        + timezone.timedelta(hours=h)
+    day_name = DAY_CHOICES[day.weekday()][0]
+    form = HandymanProfileForm(instance=handyman_profile, data={
+        "experience_years": 3, "hourly_rate": 0, "daily_rate": 0, "monthly_rate": 0, "travel_fee": 0,
+        "skills": [category.id], "availability_choices": [f"{day_name}_matin", f"{day_name}_nuit"],
+    })
+    assert form.is_valid(), form.errors
+    form.save()
+    assert handyman_profile.availability == {day_name: ["matin", "nuit"]}
+    availability_index.refresh(user_handyman.id)
+
+    def matched(start, end):
+        return [r["user_id"] for r in match_artisans(5.346, -4.018, category.id, start=at(start), end=at(end))]
+
+    assert matched(9, 11) == [user_handyman.id]
+    assert matched(23, 29) == [user_handyman.id]  # nuit : jusqu'à 6h le lendemain
+    assert matched(13, 15) == []
+
+    # gabarit illisible : aucune contrainte plutôt que toujours occupé
+    HandymanProfile.objects.filter(pk=handyman_profile.pk).update(availability={"Funday": ["brunch"]})
+    availability_index.refresh(user_handyman.id)
+    assert matched(13, 15) == [user_handyman.id]
+
+
+def test_ranking_scores_are_weighted_and_top_k():
+    import numpy as np
+    from handy.services.ranking import FEATURES, feature_matrix, top_k
+
+    cols = {
+        "bayes": np.array([4.8, 3.0, 4.0]), "jobs": np.array([50, 2, 10]),
+        "price": np.array([10000.0, np.nan, 30000.0]), "idle_days": np.array([1.0, np.inf, 30.0]),
+        "accepted": np.array([9, 0, 1]), "decided": np.array([10, 0, 5]), "favorite": np.array([0.0, 0.0, 1.0]),
+    }
+    matrix = feature_matrix(np.array([2000.0, 500.0, 14000.0]), cols, radius_m=15000, budget=10000)
+    assert matrix.shape == (3, len(FEATURES))
+    assert matrix.min() >= 0 and matrix.max() <= 1
+    assert matrix[1, FEATURES.index("price_fit")] == 0.5  # sur devis : neutre
+
+    only_distance = np.array([1.0 if f == "distance" else 0.0 for f in FEATURES])
+    assert list(top_k(matrix @ only_distance, 2)) == [1, 0]
+    only_rating = np.array([1.0 if f == "rating" else 0.0 for f in FEATURES])
+    assert list(top_k(matrix @ only_rating, 5)) == [0, 2, 1]
+
+
+@pytest.mark.django_db
+def test_nearby_page_is_cached_per_geohash_cell(api_client, service, handyman_profile, django_assert_num_queries):
+    from django.core.cache import cache
+    from handy.services import nearby as nearby_cache
+
+    cache.clear()
+    url = reverse("services-nearby")
+    first = api_client.get(url, {"lat": 5.3461, "lng": -4.0181})
+    assert first.status_code == 200 and first.json()["count"] == 1
+
+    # même cellule geohash : servi depuis le cache, sans requête SQL
+    with django_assert_num_queries(0):
+        second = api_client.get(url, {"lat": 5.3462, "lng": -4.0182})
+    assert second.json()["results"] == first.json()["results"]
+
+    cell, lat, lng = nearby_cache.snap(5.3461, -4.0181)
+    key = nearby_cache.cache_key(cell, lat, lng, None, 15.0, "1", 20)
+    nearby_cache.invalidate_point(handyman_profile.location)  # version de la cellule grossière incrémentée
+    assert nearby_cache.cache_key(cell, lat, lng, None, 15.0, "1", 20) != key
+
+
+@pytest.mark.django_db
+def test_coverage_index_matches_postgis(user_handyman, category):
+    from django.contrib.gis.geos import Polygon
+    from handy.models import ServiceArea
+    from handy.services.coverage import coverage_index
+
+    profile = HandymanProfile.objects.get(user=user_handyman)
+    profile.is_approved = True
+    profile.save()
+    profile.skills.add(category)
+    ServiceArea.objects.create(handyman=profile, center=Point(-4.017, 5.345, srid=4326), radius_km=5)
+
+    inside, outside = Point(-4.0, 5.36, srid=4326), Point(-3.9, 5.345, srid=4326)  # ~2,5 km / ~13 km
+    assert ServiceArea.objects.filter(coverage__covers=inside).exists()
+    assert not ServiceArea.objects.filter(coverage__covers=outside).exists()
+
+    coverage_index.rebuild()
+    assert [a.user_id for a in coverage_index.covering(5.36, -4.0, category.id)] == [user_handyman.id]
+    assert coverage_index.covering(5.345, -3.9, category.id) == []
+
+    # polygone prioritaire sur le disque ; mise à jour incrémentale sans reconstruction
+    area = profile.service_area
+    area.polygon = Polygon(((-3.95, 5.30), (-3.85, 5.30), (-3.85, 5.40), (-3.95, 5.40), (-3.95, 5.30)), srid=4326)
+    area.save()
+    coverage_index.refresh_areas([area.pk])  # on_commit ne se déclenche pas dans la transaction de test
+    assert coverage_index.covering(5.36, -4.0, category.id) == []
+    assert [a.id for a in coverage_index.covering(5.345, -3.9, category.id)] == [area.pk]
+
+
+@pytest.mark.django_db
+def test_chat_messages_are_written_in_batches(user_client, user_handyman):
+    from handy.models import Conversation, Message
+    from handy.services.chat import MessageBuffer, make_message
+
+    conversation = Conversation.objects.create()
+    conversation.participants.add(user_client, user_handyman)
+
+    class _Buffer(MessageBuffer):
+        def _ensure_thread(self):
+            pass  # pas de thread de fond dans le test
+
+    buffer = _Buffer(max_batch=50, flush_ms=10)
+    sent = [make_message(conversation.id, user_client.id if i % 2 else user_handyman.id, f"msg {i}")
+            for i in range(5)]
+    for msg in sent:
+        buffer.add(msg)
+    assert Message.objects.count() == 0  # diffusé, pas encore écrit
+
+    assert buffer.flush() == 5
+    stored = list(Message.objects.filter(conversation=conversation).order_by("id"))
+    assert [m.content for m in stored] == [f"msg {i}" for i in range(5)]
+    # l'horodatage diffusé est celui enregistré
+    assert [m.created_at for m in stored] == [m.created_at for m in sent]
+
+
+@pytest.mark.django_db
+def test_message_history_cursor_and_since_sync(auth_client, user_client, user_handyman):
+    from handy.models import Conversation, Message
+
+    conversation = Conversation.objects.create()
+    conversation.participants.add(user_client, user_handyman)
+    other = Conversation.objects.create()
+    other.participants.add(user_handyman)
+    Message.objects.create(conversation=other, sender=user_handyman, content="privé")
+    for i in range(5):
+        Message.objects.create(conversation=conversation, sender=user_handyman, content=f"m{i}")
+
+    url = reverse("messages-list")
+    first = auth_client.get(url, {"conversation": conversation.id, "page_size": 3}).json()
+    assert [m["content"] for m in first["results"]] == ["m4", "m3", "m2"]
+    assert "count" not in first and first["next"]
+    second = auth_client.get(first["next"]).json()
+    assert [m["content"] for m in second["results"]] == ["m1", "m0"]
+
+    # reconnexion : seules les lignes postérieures au dernier id vu
+    since = first["since"]
+    Message.objects.create(conversation=conversation, sender=user_client, content="m5")
+    sync = auth_client.get(url, {"since": since}).json()
+    assert [m["content"] for m in sync["results"]] == ["m5"]
+    assert sync["has_more"] is False and sync["since"] > since
+
+
+@pytest.mark.django_db
+def test_unread_counters_follow_creates_and_mark_read(auth_client, user_client, user_handyman,
+                                                      django_capture_on_commit_callbacks):
+    from django.core.cache import cache
+    from handy.models import Conversation, Message, Notification, UnreadCounter
+
+    cache.clear()
+    conversation = Conversation.objects.create()
+    conversation.participants.add(user_client, user_handyman)
+    with django_capture_on_commit_callbacks(execute=True):
+        msgs = [Message.objects.create(conversation=conversation, sender=user_handyman, content=f"m{i}")
+                for i in range(4)]
+        Message.objects.create(conversation=conversation, sender=user_client, content="réponse")
+        for i in range(3):
+            Notification.objects.create(user=user_client, notification_type="booking_status", message=f"n{i}")
+
+    badges = auth_client.get(reverse("unread-counts"), {"conversations": str(conversation.id)}).json()
+    assert badges == {"notifications": 3, "messages": 4, "conversations": {str(conversation.id): 4}}
+    assert UnreadCounter.objects.get(user=user_handyman, key="messages").count == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        res = auth_client.post(reverse("conversations-read", args=[conversation.id]),
+                               {"up_to": msgs[2].id}, format="json")
+    assert res.json() == {"marked": 3, "unread": 1, "messages": 1}
+    assert Message.objects.filter(conversation=conversation, is_read=False).count() == 2
+    bad = reverse("conversations-read", args=[conversation.id]).replace(f"/{conversation.id}/", "/abc/")
+    assert auth_client.post(bad, {}, format="json").status_code == 404
+
+    with django_capture_on_commit_callbacks(execute=True):
+        res = auth_client.post(reverse("notifications-read"), {}, format="json")
+    assert res.json() == {"marked": 3, "unread": 0}
+
+
+@pytest.mark.django_db
+def test_notification_dispatch_bulk_and_push_retry(user_client, user_handyman, monkeypatch):
+    from handy import tasks
+    from handy.models import Device, Notification
+    from handy.services import push
+
+    Device.objects.create(user=user_client, device_token="ok-1", device_type="android")
+    Device.objects.create(user=user_client, device_token="dead-1", device_type="ios")
+    Device.objects.create(user=user_handyman, device_token="busy-1", device_type="android")
+
+    calls = []
+    codes = {"ok-1": None, "dead-1": "UNREGISTERED", "busy-1": "UNAVAILABLE"}
+    monkeypatch.setattr(push, "_fcm_send", lambda tokens, *a: calls.append(tokens) or [codes[t] for t in tokens])
+    retried = []
+    monkeypatch.setattr(tasks.send_push_batch, "apply_async", lambda args, countdown: retried.append((args, countdown)))
+    monkeypatch.setattr(tasks.send_push_batch, "delay", lambda *args: tasks.send_push_batch(*args))
+
+    count = tasks.dispatch_notifications([user_client.id, user_handyman.id, user_client.id],
+                                         "booking_status", "Promo", title="Tratra")
+    assert count == 2
+    assert Notification.objects.filter(notification_type="booking_status").count() == 2
+    assert calls == [["ok-1", "dead-1", "busy-1"]]  # un seul appel multicast
+    assert not Device.objects.filter(device_token="dead-1").exists()
+    assert [args[0] for args, _ in retried] == [["busy-1"]]  # seul le jeton en échec temporaire
+    assert retried[0][0][-1] == 1 and retried[0][1] > 0
+
+    # identifiants sans droits : tout le lot en PERMISSION_DENIED, aucun jeton supprimé
+    codes.update({"ok-1": "PERMISSION_DENIED", "busy-1": "PERMISSION_DENIED", "dead-2": "PERMISSION_DENIED"})
+    Device.objects.create(user=user_client, device_token="dead-2", device_type="ios")
+    assert tasks.send_push_batch(["ok-1", "busy-1", "dead-2"], "Tratra", "Promo") == \
+        {"sent": 0, "retry": 0, "dead": 0, "failed": 3}
+    assert Device.objects.filter(device_token__in=["ok-1", "busy-1", "dead-2"]).count() == 3
+    # code non lié au jeton sur une partie du lot : compté en échec, jeton conservé
+    codes.update({"ok-1": None, "dead-2": "UNREGISTERED"})
+    assert tasks.send_push_batch(["ok-1", "busy-1", "dead-2"], "Tratra", "Promo")["failed"] == 1
+    assert list(Device.objects.filter(device_token__in=["ok-1", "busy-1", "dead-2"])
+                .values_list('device_token', flat=True).order_by('device_token')) == ["busy-1", "ok-1"]
+
+
+@pytest.mark.django_db
+def test_profile_completion_is_stored_and_maintained(user_handyman, category, django_assert_num_queries):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from handy.models import HandymanDocument
+
+    profile = HandymanProfile.objects.get(user=user_handyman)
+    assert profile.completion == 0
+
+    profile.bio = "Plombier depuis 10 ans"
+    profile.experience_years = 10
+    profile.save()
+    profile.skills.add(category)
+    HandymanDocument.objects.create(handyman=profile, document_type="id_card",
+                                    file=SimpleUploadedFile("cni.pdf", b"%PDF-1.4"))
+    profile.refresh_from_db()
+    assert profile.completion == 50  # 4 critères sur 8
+
+    # lecture sans requête supplémentaire (plus de exists() par ligne)
+    with django_assert_num_queries(0):
+        assert profile.profile_completion() == 50 and not profile.is_fully_completed
+    assert HandymanProfile.objects.filter(completion__lt=100, pk=profile.pk).exists()
+
+    profile.documents.all().delete()
+    profile.refresh_from_db()
+    assert profile.completion == 37
+
+
+@pytest.mark.django_db(transaction=True)
+def test_payment_webhooks_are_deduplicated_and_applied_in_batch(api_client, user_client, user_handyman,
+                                                                 service, settings):
+    from handy.models import PaymentLog, PaymentWebhookEvent
+    from handy.services import webhooks
+
+    settings.PAYMENT_WEBHOOK_ASYNC = False
+    booking = Booking.objects.create(client=user_client, handyman=user_handyman, service=service,
+                                     booking_date=timezone.now(), address="Plateau", city="Abidjan",
+                                     postal_code="00225", description="x", proposed_price=7000)
+    payment = Payment.objects.create(booking=booking, amount=7000, platform_fee=700, method="card",
+                                     transaction_id="om_tx_1")
+    url = reverse("payment-webhook", kwargs={"provider": "om"})
+
+    # rejeu du même événement : une seule ligne, un seul log
+    for _ in range(3):
+        res = api_client.post(url, {"event_id": "e1", "provider_ref": "om_tx_1", "status": "completed"}, format="json")
+        assert res.status_code == 200
+    # référence inconnue : acquittée, laissée en file pendant la période de grâce
+    assert api_client.post(url, {"event_id": "e2", "provider_ref": "nope", "status": "completed"},
+                           format="json").status_code == 200
+    assert PaymentWebhookEvent.objects.filter(provider="om").count() == 2
+    payment.refresh_from_db()
+    assert payment.status == "completed" and payment.is_paid
+    assert PaymentLog.objects.filter(payment=payment).count() == 1
+    late = PaymentWebhookEvent.objects.get(event_id="e2")
+    assert late.processed_at is None and late.outcome == ""
+
+    # paiement enregistré entre-temps : appliqué au passage suivant
+    booking2 = Booking.objects.create(client=user_client, handyman=user_handyman, service=service,
+                                      booking_date=timezone.now(), address="Plateau", city="Abidjan",
+                                      postal_code="00225", description="y", proposed_price=7000)
+    other = Payment.objects.create(booking=booking2, amount=7000, platform_fee=700, method="card",
+                                   transaction_id="nope")
+    assert webhooks.process_shard(late.shard)["applied"] == 1
+    other.refresh_from_db()
+    assert other.status == "completed"
+
+    # toujours inconnue après la période de grâce : classée « unknown »
+    api_client.post(url, {"event_id": "e3", "provider_ref": "ghost", "status": "completed"}, format="json")
+    PaymentWebhookEvent.objects.filter(event_id="e3").update(
+        received_at=timezone.now() - timezone.timedelta(seconds=settings.PAYMENT_WEBHOOK_UNKNOWN_GRACE_S + 1))
+    ghost = PaymentWebhookEvent.objects.get(event_id="e3")
+    assert webhooks.process_shard(ghost.shard)["unknown"] == 1
+
+    # lot : transitions fusionnées dans l'ordre de réception
+    shard = webhooks.shard_for("om_tx_1")
+    PaymentWebhookEvent.objects.bulk_create([
+        PaymentWebhookEvent(provider="om", event_id=f"b{i}", provider_ref="om_tx_1", status=s, shard=shard)
+        for i, s in enumerate(["completed", "refunded", "refunded"])
+    ])
+    assert webhooks.process_shard(shard) == {"unchanged": 2, "applied": 1}
+    payment.refresh_from_db()
+    assert payment.status == "refunded" and not payment.is_paid
+    assert not PaymentWebhookEvent.objects.filter(processed_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_platform_fee_rules_inherit_and_batch(category, django_assert_num_queries,
+                                              django_capture_on_commit_callbacks):
+    from decimal import Decimal
+    from handy.models import PricingRule
+    from handy.services.fees import compute_platform_fee, compute_platform_fees
+
+    child = ServiceCategory.objects.create(name="Fuite", slug="fuite", parent=category)
+    other = ServiceCategory.objects.create(name="Jardin", slug="jardin")
+    with django_capture_on_commit_callbacks(execute=True):
+        PricingRule.objects.create(category=None, fee_percent=Decimal("10.00"), fee_min_xof=300)
+        PricingRule.objects.create(category=category, fee_percent=Decimal("12.50"), fee_min_xof=500)
+
+    assert compute_platform_fee(Decimal("10000"), child.id) == Decimal("1250")  # hérité du parent
+    items = [(Decimal("10000"), child.id), (Decimal("2000"), category.id), (Decimal("4005.00"), other.id),
+             (Decimal("12345.67"), None), (Decimal("10.005"), other.id)]
+    with django_assert_num_queries(0):
+        fees = compute_platform_fees(items)
+    assert fees == [compute_platform_fee(a, c) for a, c in items]
+    assert fees[:3] == [Decimal("1250"), Decimal("500"), Decimal("400")]  # minimum, arrondi demi-pair
+
+    with django_capture_on_commit_callbacks(execute=True):
+        PricingRule.objects.create(category=child, fee_percent=Decimal("5.00"), fee_min_xof=0)
+    assert compute_platform_fee(Decimal("10000"), child.id) == Decimal("500")
+
+
+@pytest.mark.django_db
+def test_pricing_engine_quotes_from_memory(category, django_assert_num_queries,
+                                           django_capture_on_commit_callbacks):
+    from decimal import Decimal
+    from datetime import datetime
+    from django.core.cache import cache
+    from handy.services import pricing
+    from handy.services.geo import geohash_encode
+
+    with django_capture_on_commit_callbacks(execute=True):
+        category.base_price_xof = 4000
+        category.save()
+        child = ServiceCategory.objects.create(name="Fuite", slug="fuite", parent=category)
+    noon = timezone.make_aware(datetime(2025, 10, 20, 12, 0))
+    evening = noon.replace(hour=19)
+
+    engine = pricing.pricing_engine
+    engine.quote(child.slug, 60, at=noon)  # chargement de la table
+    cache.set(pricing.ZONES_KEY, {geohash_encode(5.34, -4.02, 5): 1.3})
+    engine._zones_at = None
+    with django_assert_num_queries(0):
+        assert engine.quote(child.slug, 60, at=noon) == Decimal("4000")  # base héritée
+        assert engine.quote(child.slug, 60, at=evening) == Decimal("4800")  # 18h-22h : +20 %
+        assert engine.quote(child.slug, 90, client_lat=5.34, client_lng=-4.02, at=noon) == Decimal("7800")
+        far = Point(-4.02, 5.34 + 0.09, srid=4326)  # ~10 km : 7 km facturés x 2 % (x1,1402), zone x1,3
+        assert engine.quote(child.slug, 60, artisan_loc=far, client_lat=5.34, client_lng=-4.02,
+                            at=noon) == Decimal("5929")
+        assert engine.quote("inconnue", 10, at=noon) == Decimal("1500")  # 30 min mini, base par défaut
+
+
+@pytest.mark.django_db
+def test_price_estimate_batch_matches_single_quotes(api_client, category):
+    from handy.services.pricing import pricing_engine
+
+    items = [{"category_slug": category.slug, "minutes": m} for m in (20, 60, 95)]
+    items += [{"category_slug": "inconnue", "minutes": 45, "lat": 5.34, "lng": -4.02}]
+    res = api_client.post(reverse("price-estimate-batch"), {"items": items}, format="json")
+    assert res.status_code == 200, res.content
+    results = res.json()["results"]
+    assert [r["category_slug"] for r in results] == [i["category_slug"] for i in items]
+    assert [r["amount_xof"] for r in results] == [
+        int(pricing_engine.quote(i["category_slug"], i["minutes"], client_lat=i.get("lat"), client_lng=i.get("lng")))
+        for i in items
+    ]
+
+    bad = api_client.post(reverse("price-estimate-batch"), {"items": [{"minutes": 60}]}, format="json")
+    assert bad.status_code == 400
+
+
+@pytest.mark.django_db
+def test_hot_read_endpoints_are_async(api_client, auth_client, user_client, user_handyman, service, category):
+    import asyncio
+    from handy.api import async_views
+    from handy.models import BookingRoute
+
+    for view in (async_views.match, async_views.services_nearby, async_views.booking_eta, async_views.slides):
+        assert asyncio.iscoroutinefunction(view)
+
+    booking = Booking.objects.create(client=user_client, handyman=user_handyman, service=service,
+                                     booking_date=timezone.now(), address="Plateau", city="Abidjan",
+                                     postal_code="00225", description="x")
+    BookingRoute.objects.create(booking=booking, eta_minutes=12)
+    res = auth_client.get(reverse("bookings-eta", kwargs={"pk": booking.id}))
+    assert res.status_code == 200 and res.json()["eta_minutes"] == 12
+    assert auth_client.get(reverse("bookings-eta", kwargs={"pk": booking.id + 999})).status_code == 404
+
+    slides = APIClient().get(reverse("slides-list"))
+    assert slides.status_code == 200
+    assert any(s.get("ctaParams") == {"category_id": category.id} for s in slides.json())
+
+    anonymous = APIClient().post(reverse("match"), {"category_id": category.id, "lat": 5.3, "lng": -4.0},
+                                 format="json")
+    assert anonymous.status_code == 401
+    assert APIClient().get(reverse("match")).status_code == 405
+
+
+@pytest.mark.django_db
+def test_query_budget_per_endpoint(settings, auth_client, user_client, user_handyman, service):
+    from handy.services.querybudget import QueryBudgetExceeded, query_stats
+
+    booking = Booking.objects.create(client=user_client, handyman=user_handyman, service=service,
+                                     booking_date=timezone.now(), address="Plateau", city="Abidjan",
+                                     postal_code="00225", description="x")
+    url = reverse("bookings-eta", kwargs={"pk": booking.id})
+    query_stats.reset()
+    settings.QUERY_BUDGET_HEADERS = True
+    settings.QUERY_BUDGETS = {"bookings-eta": 10}
+    res = auth_client.get(url)
+    assert res.status_code == 200
+    assert int(res["X-DB-Queries"]) >= 2  # existence + route
+    stats = query_stats.snapshot()["bookings-eta"]
+    assert stats["calls"] == 1 and stats["over_budget"] == 0
+    assert stats["queries"] == int(res["X-DB-Queries"])
+
+    settings.QUERY_BUDGETS = {"bookings-eta": 1}
+    settings.QUERY_BUDGET_STRICT = False
+    assert auth_client.get(url).status_code == 200  # dépassement journalisé seulement
+    assert query_stats.snapshot()["bookings-eta"]["over_budget"] == 1
+
+    settings.QUERY_BUDGET_STRICT = True
+    with pytest.raises(QueryBudgetExceeded):
+        auth_client.get(url)
@@ -10,8 +10,7 @@ from django.contrib.auth import login
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.exceptions import PermissionDenied
 from django.db import transaction
-from django.db.models import Sum, Max, Count, Avg, Min, Q, F, Prefetch
-from django.db.models.functions import TruncDay
+from django.db.models import Max, Count, Avg, Min, Q, F, Prefetch
 from django.http import HttpResponseForbidden
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy, reverse
@@ -19,8 +18,11 @@ from django.utils import timezone
 from django.views.generic import TemplateView, DetailView, ListView, CreateView, UpdateView, View
 from handy.forms import HandymanSignupForm, EmployerSignupForm, HandymanProfileForm, ServiceImageFormSet, ServiceForm, \
     BookingForm, BookingResponseForm, MessageForm, ReviewForm, PaymentForm, DepositTopUpForm
-from handy.models import HandymanProfile, Service, Booking, ServiceCategory, Review, Payment, Notification, Message, \
+from handy.models import HandymanProfile, Service, Booking, ServiceCategory, Review, Notification, Message, \
     Conversation, DepositTransaction
+from handy.services.dashboard import get_handyman_stats
+from handy.services.rollups import SERIES_DAYS, client_dashboard_stats
+from handy.services.search import search_services
 
 from django.contrib.auth import get_user_model
 
@@ -72,127 +74,55 @@ class HandymanDashboardView(LoginRequiredMixin, UserPassesTestMixin, TemplateVie
         user = self.request.user
         now = timezone.now()
 
-        # Missions aujourd'hui
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        today_end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-        today_missions = Booking.objects.filter(
-            handyman=user,
-            booking_date__gte=today_start,
-            booking_date__lte=today_end,
-            status__in=['confirmed', 'in_progress']
-        )
+        # Compteurs, revenus et caution : 2 requêtes agrégées, en cache par artisan
+        stats = get_handyman_stats(user.id)
 
-        # Missions aujourd'hui
-        today = timezone.now().date()
-        missions_today = Booking.objects.filter(
-            handyman=handyman,
-            booking_date__date=today,
-            status__in=["pending", "confirmed", "in_progress"]
-        )
-        mission_count = missions_today.count()
-        next_service = missions_today.order_by('booking_date').first()
-        if next_service:
-            delta = next_service.booking_date - timezone.now()
+        next_service_in = None
+        if stats['next_service_at']:
+            delta = stats['next_service_at'] - now
             next_service_in = int(delta.total_seconds() // 3600)
-        else:
-            next_service_in = None
+        next_mission = {'booking_date': stats['next_mission_at']} if stats['next_mission_at'] else None
 
         # Dispos ouvertes = clé `availability` (exemple)
         total_slots = sum(1 for day, slots in profile.availability.items() if slots)
 
+        bookings = Booking.objects.filter(handyman=user).select_related('service__category', 'client')
+
         # Réservations à venir (dans les 7 prochains jours)
-        upcoming_bookings = Booking.objects.filter(
-            handyman=user,
-            booking_date__gte=timezone.now(),
-            booking_date__lte=timezone.now() + timedelta(days=7),
+        upcoming_bookings = bookings.filter(
+            booking_date__gte=now,
+            booking_date__lte=now + timedelta(days=7),
             status__in=['confirmed', 'in_progress']
         ).order_by('booking_date')
 
         # Demandes récentes (en attente, créées dans les 3 derniers jours)
-        booking_requests = Booking.objects.filter(
-            handyman=user,
+        booking_requests = bookings.filter(
             status='pending',
-            created_at__gte=timezone.now() - timedelta(days=3)
+            created_at__gte=now - timedelta(days=3)
         ).order_by('-created_at')
 
         # Historique des missions (terminées ou annulées)
-        completed_bookings = Booking.objects.filter(
-            handyman=user,
+        completed_bookings = bookings.filter(
             status__in=['completed', 'cancelled']
-        ).order_by('-booking_date')[:10]  # Limite à 10 résultats
-
-        # Prochaine mission
-        next_mission = Booking.objects.filter(
-            handyman=user,
-            booking_date__gt=now,
-            status='confirmed'
-        ).order_by('booking_date').first()
-
-        # Statistiques mensuelles
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-
-        # Missions du mois
-        monthly_bookings = Booking.objects.filter(
-            handyman=user,
-            booking_date__gte=month_start,
-            booking_date__lte=month_end
-        )
-
-        # Revenu mensuel
-        revenue = monthly_bookings.filter(
-            payment__is_paid=True
-        ).aggregate(total=Sum('payment__amount'))['total'] or 0
-
-        # Nombre de missions
-        total_missions = monthly_bookings.count()
+        ).select_related('payment').order_by('-booking_date')[:10]  # Limite à 10 résultats
 
         # Croissance par rapport au mois dernier
-        last_month_start = (month_start - timedelta(days=1)).replace(day=1)
-        last_month_end = month_start - timedelta(days=1)
-        last_month_missions = Booking.objects.filter(
-            handyman=user,
-            booking_date__gte=last_month_start,
-            booking_date__lte=last_month_end
-        ).count()
-
+        total_missions = stats['total_missions']
+        last_month_missions = stats['last_month_missions']
         mission_growth = 0
         if last_month_missions > 0:
             mission_growth = round((total_missions - last_month_missions) / last_month_missions * 100)
 
-        # Graphique des revenus par jour
-        revenue_data = monthly_bookings.filter(
-            payment__is_paid=True
-        ).annotate(day=TruncDay('booking_date')).values('day').annotate(
-            total=Sum('payment__amount')
-        ).order_by('day')
-
-        max_revenue = revenue_data.aggregate(max=Max('total'))['max'] or 1
-        revenue_chart = []
-        for entry in revenue_data:
-            percentage = min(100, round(entry['total'] / max_revenue * 100))
-            revenue_chart.append({
-                'day': entry['day'],
-                'amount': entry['total'],
-                'percentage': percentage
-            })
-
         # Disponibilités
-        availability = user.handyman_profile.availability or {}
+        availability = profile.availability or {}
         availability_slots = sum(len(slots) for slots in availability.values() if slots)
 
         # Pourcentage de disponibilité (exemple)
-        days_in_month = (month_end - month_start).days + 1
-        availability_percentage = min(100, round(availability_slots / (days_in_month * 3) * 100))
+        availability_percentage = min(100, round(availability_slots / (stats['days_in_month'] * 3) * 100))
 
-        # Calcule la balance réelle de la caution
-        transactions = DepositTransaction.objects.filter(
-            handyman=self.request.user,
-            status='completed'
-        )
-        deposit_balance = transactions.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        deposit_balance = stats['deposit_balance']
 
-        # Définir un seuil minimal recommandé (ex. 50 000 FCFA)
+        # Définir un seuil minimal recommandé (ex. 50 000 FCFA)
         deposit_threshold = Decimal('50000.00')
 
         # Pourcentage par rapport au seuil
@@ -208,24 +138,24 @@ class HandymanDashboardView(LoginRequiredMixin, UserPassesTestMixin, TemplateVie
             "rating": profile.rating,
             "completed_jobs": profile.completed_jobs,
             "is_verified": handyman.is_verified,
-            "is_completed": handyman.handyman_profile.is_fully_completed,
-            "valeur_completed": handyman.handyman_profile.profile_completion(),
+            "is_completed": profile.is_fully_completed,
+            "valeur_completed": profile.profile_completion(),
             "is_premium": profile.is_approved,
             "total_slots": total_slots,
             "profile_picture": profile.photo.url if profile.photo else None,
-            "mission_count": mission_count,
+            "mission_count": stats['mission_count'],
             "next_service_in": next_service_in,
             'services': self.request.user.services.all(),
             'upcoming_bookings': upcoming_bookings,
             'booking_requests': booking_requests,
             'completed_bookings': completed_bookings,
-            'today_missions_count': today_missions.count(),
+            'today_missions_count': stats['today_missions_count'],
             'next_mission': next_mission,
             'monthly_stats': {
                 'total_missions': total_missions,
-                'revenue': revenue,
+                'revenue': stats['revenue'],
                 'mission_growth': mission_growth,
-                'revenue_chart': revenue_chart,
+                'revenue_chart': stats['revenue_chart'],
                 'availability_percentage': availability_percentage,
                 'availability_slots': availability_slots,
             }
@@ -525,34 +455,27 @@ class EmployeurDashboardView(LoginRequiredMixin, UserPassesTestMixin, TemplateVi
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
-        current_month = timezone.now().month
+
+        # Dépenses, demandes et avis : agrégats quotidiens pré-calculés (1 requête)
+        days = self.request.GET.get('days', '7')
+        days = int(days) if days.isdigit() and int(days) in SERIES_DAYS else 7
+        rollup = client_dashboard_stats(user.id, days=days)
 
         # Statistiques principales
         stats = {
             'total_services': Service.objects.filter(is_active=True).count(),
-            'monthly_spending': Payment.objects.filter(
-                booking__client=user,
-                payment_date__month=current_month
-            ).aggregate(total=Sum('amount'))['total'] or 0,
-            'pending_requests': Booking.objects.filter(
-                client=user,
-                status='pending'
-            ).count(),
+            'monthly_spending': rollup['monthly_spending'],
+            'pending_requests': rollup['pending_requests'],
         }
 
         # Taux de réponse (basé sur les devis reçus)
-        total_requests = Booking.objects.filter(client=user).count()
-        # Compter les demandes avec au moins un devis
-        responded_requests = Booking.objects.filter(
-            client=user,
-            quotations__isnull=False
-        ).distinct().count()
+        total_requests = rollup['total_requests']
+        responded_requests = rollup['responded_requests']
         response_rate = round((responded_requests / total_requests * 100) if total_requests > 0 else 85)
 
         # Satisfaction
-        employer_reviews = Review.objects.filter(booking__client=user)
-        avg_rating = employer_reviews.aggregate(avg=Avg('rating'))['avg'] or 4.8
-        review_count = employer_reviews.count()
+        avg_rating = rollup['avg_rating'] or 4.8
+        review_count = rollup['review_count']
 
         # Catégories populaires
         popular_categories = ServiceCategory.objects.annotate(
@@ -562,11 +485,11 @@ class EmployeurDashboardView(LoginRequiredMixin, UserPassesTestMixin, TemplateVi
         # Prestataires recommandés
         recommended_workers = User.objects.filter(
             user_type='handyman',
-            services__is_active=True
+            id__in=Service.objects.filter(is_active=True).values('handyman_id')
         ).annotate(
-            avg_rating=Avg('handyman_bookings__review__rating'),
-            review_count=Count('handyman_bookings__review')
-        ).order_by('-avg_rating')[:4]
+            avg_rating=F('handyman_profile__rating'),
+            review_count=F('handyman_profile__review_count')
+        ).order_by(F('handyman_profile__bayes_score').desc(nulls_last=True))[:4]
 
         # Demandes actives
         active_bookings = Booking.objects.filter(
@@ -583,18 +506,8 @@ class EmployeurDashboardView(LoginRequiredMixin, UserPassesTestMixin, TemplateVi
             status__in=['confirmed', 'in_progress']
         ).order_by('booking_date')[:3]
 
-        # Calcul des dépenses quotidiennes réelles
-        daily_spending = []
-        today = timezone.now().date()
-        for i in range(7):
-            date = today - timedelta(days=i)
-            daily_total = Payment.objects.filter(
-                booking__client=user,
-                payment_date__date=date
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            daily_spending.append(float(daily_total))
-
-        daily_spending.reverse()  # Pour avoir du plus ancien au plus récent
+        # Dépenses quotidiennes (du plus ancien au plus récent)
+        daily_spending = rollup['daily_spending']
         max_daily = max(daily_spending) if daily_spending else 1
 
         context.update({
@@ -608,6 +521,7 @@ class EmployeurDashboardView(LoginRequiredMixin, UserPassesTestMixin, TemplateVi
             'upcoming_bookings': upcoming_bookings,
             'daily_spending': daily_spending,
             'max_daily_spending': max_daily,
+            'spending_days': days,
         })
         return context
 
@@ -841,16 +755,12 @@ class AddPaymentView(LoginRequiredMixin, CreateView):
         amount = Decimal(self.request.POST.get('amount'))
         platform_fee = amount * Decimal('0.11')
 
-        # ✅ Vérifier si la caution est suffisante
-        if artisan_profile.deposit_balance < platform_fee:
+        # ✅ Déduire la commission de la caution (solde vérifié sous verrou)
+        if not artisan_profile.deduct_platform_fee(amount):
             messages.error(self.request,
                            "L'artisan n'a pas suffisamment de caution pour couvrir les frais de plateforme.")
             return redirect(self.get_success_url())
 
-        # ✅ Déduire la commission de la caution
-        artisan_profile.deposit_balance -= platform_fee
-        artisan_profile.save()
-
         # ✅ Créer le paiement
         payment = form.save(commit=False)
         payment.booking = booking
@@ -880,17 +790,14 @@ class ServiceSearchView(ListView):
             Service.objects.filter(is_active=True, handyman__is_active=True)
             .select_related('handyman', 'category')
             .prefetch_related('images')
+            .annotate(avg_rating=F('handyman__handyman_profile__rating'),
+                      review_count=F('handyman__handyman_profile__review_count'))
         )
 
+        # Plein texte + trigrammes (index GIN), classé par pertinence
         q = self.request.GET.get('q')
         if q:
-            qs = qs.filter(
-                Q(title__icontains=q) |
-                Q(description__icontains=q) |
-                Q(category__name__icontains=q) |
-                Q(handyman__first_name__icontains=q) |
-                Q(handyman__last_name__icontains=q)
-            )
+            qs = search_services(qs, q)
 
         if category := self.request.GET.get('category'):
             qs = qs.filter(category__slug=category)
@@ -905,9 +812,7 @@ class ServiceSearchView(ListView):
             qs = qs.filter(price_type=price_type)
 
         if rating := self.request.GET.get('rating'):
-            qs = qs.annotate(
-                avg_rating=Avg('handyman__handyman_bookings__review__rating')
-            ).filter(avg_rating__gte=rating)
+            qs = qs.filter(handyman__handyman_profile__rating__gte=rating)
 
         if location := self.request.GET.get('location'):
             qs = qs.filter(
@@ -915,12 +820,13 @@ class ServiceSearchView(ListView):
                 Q(handyman__postal_code__icontains=location)
             )
 
-        sort_by = self.request.GET.get('sort_by', 'newest')
-        if sort_by == 'popular':
+        sort_by = self.request.GET.get('sort_by') or ('relevance' if q else 'newest')
+        if sort_by == 'relevance' and q:
+            pass  # ordre de search_services
+        elif sort_by == 'popular':
             qs = qs.annotate(booking_count=Count('bookings')).order_by('-booking_count')
         elif sort_by == 'rating':
-            qs = qs.annotate(avg_rating=Avg('handyman__handyman_bookings__review__rating')).order_by(
-                F('avg_rating').desc(nulls_last=True))
+            qs = qs.order_by(F('handyman__handyman_profile__bayes_score').desc(nulls_last=True))
         elif sort_by == 'price_low':
             qs = qs.order_by('price')
         elif sort_by == 'price_high':
@@ -928,7 +834,8 @@ class ServiceSearchView(ListView):
         else:
             qs = qs.order_by('-created_at')
 
-        return qs.distinct()
+        # jointures to-one uniquement : pas de doublons, donc pas de DISTINCT (COUNT de pagination plus léger)
+        return qs
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -945,7 +852,7 @@ class ServiceSearchView(ListView):
             'current_rating': self.request.GET.get('rating'),
             'current_location': self.request.GET.get('location'),
             'current_price_type': self.request.GET.get('price_type'),
-            'current_sort': self.request.GET.get('sort_by', 'newest'),
+            'current_sort': self.request.GET.get('sort_by') or ('relevance' if self.request.GET.get('q') else 'newest'),
             'min_price_range': Service.objects.filter(is_active=True).aggregate(min=Min('price'))['min'] or 0,
             'max_price_range': Service.objects.filter(is_active=True).aggregate(max=Max('price'))['max'] or 1000,
             'popular_services': Service.objects.filter(is_active=True)
@@ -994,7 +901,10 @@ class ServiceDetailView(LoginRequiredMixin, DetailView):
             Q(category=service.category) |
             Q(handyman=service.handyman),
             is_active=True
-        ).exclude(id=service.id).select_related('handyman').prefetch_related('images')[:6]
+        ).exclude(id=service.id).select_related('handyman').prefetch_related('images').annotate(
+            avg_rating=F('handyman__handyman_profile__rating'),
+            review_count=F('handyman__handyman_profile__review_count')
+        )[:6]
 
         # Dernières réservations
         recent_bookings = Booking.objects.filter(
@@ -1083,10 +993,10 @@ class WorkerProfileView(LoginRequiredMixin, DetailView):
             is_active=True
         ).prefetch_related('images', 'category')[:6]
 
-        # Statistiques
-        reviews = Review.objects.filter(booking__handyman=worker)
-        avg_rating = reviews.aggregate(avg=Avg('rating'))['avg'] or 0
-        review_count = reviews.count()
+        # Statistiques (compteurs d'avis dénormalisés sur le profil)
+        profile = getattr(worker, 'handyman_profile', None)
+        avg_rating = profile.rating if profile else 0
+        review_count = profile.review_count if profile else 0
 
         stats = {
             'total_services': Service.objects.filter(handyman=worker, is_active=True).count(),
@@ -15,6 +15,7 @@ from pathlib import Path
 
 import channels
 import environ
+from celery.schedules import crontab
 from decouple import config
 import sentry_sdk
 from sentry_sdk.integrations.django import DjangoIntegration
@@ -63,6 +64,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'django.contrib.postgres',
 
     'handy',
     # Libs
@@ -120,6 +122,7 @@ MIDDLEWARE = [
 
     'axes.middleware.AxesMiddleware',
     'handy.middleware.IPBlacklistMiddleware',
+    'handy.middleware.QueryBudgetMiddleware',
 
 ]
 
@@ -284,12 +287,150 @@ CHANNEL_LAYERS = {
     },
 }
 
+# === BASE DE DONNÉES : CONNEXIONS ===
+# persistent : connexion réutilisée DB_CONN_MAX_AGE s par thread (WSGI, workers Celery), vérifiée avant réutilisation ;
+# pgbouncer : pooler local en mode transaction (daphne) ; Django rend sa connexion à chaque requête,
+#             pas de curseurs serveur (incompatibles avec le mode transaction)
+DB_POOL_MODE = config('DB_POOL_MODE', default='persistent')
+DB_CONN_MAX_AGE = int(config('DB_CONN_MAX_AGE', default=60))
+
+
+def db_connection_settings():
+    """Clés à fusionner dans DATABASES['default'] (settings dev / prod)."""
+    if DB_POOL_MODE == 'pgbouncer':
+        return {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'DISABLE_SERVER_SIDE_CURSORS': True}
+    return {'CONN_MAX_AGE': DB_CONN_MAX_AGE, 'CONN_HEALTH_CHECKS': True}
+
+
+# Budget de requêtes par endpoint (handy.services.querybudget) : {nom d'URL: max requêtes | {"queries", "db_ms"}}
+QUERY_BUDGET_DEFAULT = int(config('QUERY_BUDGET_DEFAULT', default=50))
+QUERY_BUDGET_DB_MS = None  # temps DB max par requête HTTP (ms), None = non contrôlé
+QUERY_BUDGETS = {
+    'match': 10,
+    'services-nearby': 6,
+    'bookings-eta': 3,
+    'slides-list': 3,
+    'price-estimate': 2,
+    'price-estimate-batch': 2,
+    'payment-webhook': 3,
+    'unread-counts': 3,
+}
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default='0').lower() in ('1', 'true', 'yes')  # lève (tests)
+QUERY_BUDGET_HEADERS = config('QUERY_BUDGET_HEADERS', default='0').lower() in ('1', 'true', 'yes')
+
+# === CACHE ===
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('REDIS_CACHE_URL', default='redis://redis:6379/1'),
+    }
+}
+DASHBOARD_CACHE_TTL = int(config('DASHBOARD_CACHE_TTL', default=300))  # stats tableau de bord artisan
+
+# === SÉCURITÉ ===
+IP_BLACKLIST_TTL = int(config('IP_BLACKLIST_TTL', default=600))  # rechargement forcé de la liste noire (s)
+
+# === MATCHING ===
+# Index spatial en mémoire (handy.services.geoindex) ; repli PostGIS si froid/périmé
+GEO_INDEX_ENABLED = config('GEO_INDEX_ENABLED', default='1').lower() in ('1', 'true', 'yes')
+GEO_INDEX_TTL = int(config('GEO_INDEX_TTL', default=300))  # secondes avant reconstruction
+GEO_INDEX_CELL_DEG = 0.02  # ~2,2 km
+# Zones d'intervention (handy.services.coverage) : R-tree mémoire, repli PostGIS (ST_Covers)
+COVERAGE_INDEX_ENABLED = config('COVERAGE_INDEX_ENABLED', default='1').lower() in ('1', 'true', 'yes')
+COVERAGE_INDEX_TTL = int(config('COVERAGE_INDEX_TTL', default=600))
+COVERAGE_INDEX_MAX_PENDING = 500  # zones modifiées hors arbre avant reconstruction
+# Index de disponibilité (handy.services.availability) : bitmaps dans le cache partagé
+AVAILABILITY_BUCKET_MIN = int(config('AVAILABILITY_BUCKET_MIN', default=15))  # taille d'un créneau (min)
+AVAILABILITY_HORIZON_DAYS = int(config('AVAILABILITY_HORIZON_DAYS', default=30))
+AVAILABILITY_DEFAULT_BOOKING_MIN = 120  # durée supposée d'une mission sans end_date ni durée de service
+AVAILABILITY_MATCH_OVERFETCH = 5  # candidats examinés = limit x facteur quand un créneau est demandé
+# Classement pondéré (handy.services.ranking) ; poids par défaut surchargés par ServiceCategory.ranking_weights
+MATCH_RANKING_ENABLED = config('MATCH_RANKING_ENABLED', default='1').lower() in ('1', 'true', 'yes')
+MATCH_RANKING_POOL = 50  # candidats les plus proches soumis au classement
+MATCH_RANKING_WEIGHTS = {}
+MATCH_ACCEPTANCE_WINDOW_DAYS = 180
+MATCH_RECENCY_TAU_DAYS = 7
+# Cache de /services/nearby/ (handy.services.nearby)
+NEARBY_CACHE_TTL = int(config('NEARBY_CACHE_TTL', default=60))  # secondes
+NEARBY_GEOHASH_PRECISION = 6  # cellule partagée par les visiteurs (~1,2 x 0,6 km)
+NEARBY_VERSION_PRECISION = 5  # cellules d'invalidation (~4,9 x 4,9 km)
+NEARBY_CACHE_MAX_RADIUS_KM = 30  # au-delà : pas de cache
+
+# === AVIS ===
+# Note lissée HandymanProfile.bayes_score = (m*C + somme des notes) / (C + nombre d'avis)
+RATING_PRIOR_MEAN = float(config('RATING_PRIOR_MEAN', default=4.0))
+RATING_PRIOR_WEIGHT = int(config('RATING_PRIOR_WEIGHT', default=5))
+
+# === CHAT ===
+# Messages du ChatConsumer écrits par lot (handy.services.chat) ; CHAT_BATCH_SIZE=1 => écriture synchrone
+CHAT_BATCH_SIZE = int(config('CHAT_BATCH_SIZE', default=100))
+CHAT_FLUSH_MS = int(config('CHAT_FLUSH_MS', default=250))
+CHAT_MAX_PENDING = int(config('CHAT_MAX_PENDING', default=10000))
+# Notifications push (handy.services.push / notify) : FCM multicast, jetons morts supprimés
+FCM_CREDENTIALS_FILE = config('FCM_CREDENTIALS_FILE', default='')  # compte de service Firebase (vide : push ignoré)
+PUSH_RETRY_MAX = 4  # tentatives supplémentaires pour les jetons en échec temporaire
+PUSH_RETRY_BASE_S = 5  # backoff : base * 2^tentative (+/- 20 %)
+PUSH_RETRY_MAX_DELAY_S = 300
+# Compteurs de non-lus (handy.services.unread) : cache Redis, table UnreadCounter en secours
+UNREAD_CACHE_TTL = 7 * 86400
+
+# === PAIEMENTS ===
+# Webhooks (handy.services.webhooks) : journal append-only, appliqué par lot hors requête
+PAYMENT_WEBHOOK_ASYNC = config('PAYMENT_WEBHOOK_ASYNC', default='1').lower() in ('1', 'true', 'yes')
+PAYMENT_WEBHOOK_SHARDS = int(config('PAYMENT_WEBHOOK_SHARDS', default=8))  # workers parallèles max
+PAYMENT_WEBHOOK_BATCH_SIZE = 500
+PAYMENT_WEBHOOK_COALESCE_S = 1  # un passage planifié par shard et par fenêtre
+PAYMENT_WEBHOOK_UNKNOWN_GRACE_S = 900  # référence inconnue : réessayée (balayage) pendant 15 min
+# Règles de frais plateforme (handy.services.fees) : table mémoire, rechargée sur changement de version
+FEE_RULES_TTL = 3600
+# Devis (handy.services.pricing) : base par catégorie x majoration horaire x zone x distance
+PRICING_BASES_TTL = 3600
+PRICING_HOURLY_SURGE = [1.0] * 18 + [1.2] * 5 + [1.0]  # coefficient par heure locale (0-23)
+PRICING_HOURLY_SURGE_BY_CATEGORY = {}  # {"plomberie": [24 coefficients]}
+PRICING_ZONE_PRECISION = 5  # cellules geohash (~4,9 x 4,9 km)
+PRICING_SURGE_WINDOW_MIN = 30  # demande = réservations des N dernières minutes
+PRICING_ZONE_MIN_DEMAND = 3
+PRICING_ZONE_SURGE_THRESHOLD = 1.0  # demande / offre au-delà duquel la zone est majorée
+PRICING_ZONE_SURGE_SLOPE = 0.25
+PRICING_ZONE_SURGE_MAX = 1.5
+PRICING_ZONE_TTL = 300  # table de zones ignorée si la tâche ne tourne plus
+PRICING_ZONE_REFRESH_S = 30  # relecture de la table de zones par process
+PRICING_FREE_KM = 3
+PRICING_PER_KM = 0.02  # +2 % par km au-delà
+PRICING_DISTANCE_MAX_FACTOR = 1.5
+PRICE_ESTIMATE_BATCH_MAX = 100  # items par appel de /price/estimate/batch/
+
+# === TRACKING GPS ===
+# JobTracking écrit par lot (handy.services.tracking) ; TRACKING_BATCH_SIZE=1 => écriture synchrone
+TRACKING_BATCH_SIZE = int(config('TRACKING_BATCH_SIZE', default=200))
+TRACKING_FLUSH_MS = int(config('TRACKING_FLUSH_MS', default=1000))
+TRACKING_MAX_PENDING = int(config('TRACKING_MAX_PENDING', default=20000))
+
+# ETA incrémental (handy.services.eta) : écriture BookingRoute si écart >= N min ou après N s
+ETA_SPEED_ALPHA = 0.3
+ETA_MIN_DELTA_MIN = int(config('ETA_MIN_DELTA_MIN', default=2))
+ETA_MIN_INTERVAL_S = int(config('ETA_MIN_INTERVAL_S', default=60))
+
 TAILWIND_APP_NAME = 'theme'
 INTERNAL_IPS = ['127.0.0.1']
 # === CELERY ===
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://redis:6379/0')
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
-CELERY_BEAT_SCHEDULE = {}
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-deposit-balances': {
+        'task': 'handy.tasks.reconcile_deposit_balances',
+        'schedule': crontab(hour=3, minute=15),
+    },
+    'refresh-zone-surge': {
+        'task': 'handy.tasks.refresh_zone_surge',
+        'schedule': crontab(minute='*'),
+    },
+    # filet de sécurité : webhooks de paiement restés en attente (worker absent, tâche perdue)
+    'process-payment-webhooks': {
+        'task': 'handy.tasks.process_payment_webhooks',
+        'schedule': crontab(minute='*'),
+    },
+}
 
 # === DJSTRIPE ===
 DJSTRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET')
@@ -20,6 +20,7 @@ DATABASES = {
         'PORT': config('DB_PORT', '5433'),
     }
 }
+DATABASES['default'].update(db_connection_settings())
 
 SECURE_SSL_REDIRECT = False
 SECURE_HSTS_SECONDS = 0
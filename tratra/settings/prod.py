@@ -25,3 +25,4 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT'),
     }
 }
+DATABASES['default'].update(db_connection_settings())